@@ -188,6 +188,13 @@ def load_latest_results():
         return None, None
 
 
+def model_confidence(df):
+    """Уверенность писем, решенных моделью (у правил, домена и ключевых слов своя шкала)."""
+    if 'decided_by' not in df.columns:
+        return df['confidence']
+    return df.loc[df['decided_by'].fillna('model') == 'model', 'confidence']
+
+
 # --- Функция запуска классификации ---
 def run_classification(uploaded_files=None):
     """Запускает процесс классификации"""
@@ -255,7 +262,7 @@ def display_statistics(df):
 
     with col3:
         if 'confidence' in df.columns:
-            avg_conf = df['confidence'].mean() * 100
+            avg_conf = model_confidence(df).mean() * 100
             st.metric("🎯 Средняя уверенность", f"{avg_conf:.1f}%")
 
     with col4:
@@ -397,7 +404,7 @@ if df is not None and not df.empty:
         # Распределение confidence
         st.subheader("📊 Распределение уверенности")
         if 'confidence' in df.columns:
-            hist_values = np.histogram(df['confidence'].astype(float) * 100, bins=10, range=(0, 100))[0]
+            hist_values = np.histogram(model_confidence(df).astype(float) * 100, bins=10, range=(0, 100))[0]
             st.bar_chart(hist_values)
 
     with tab3:
@@ -0,0 +1,139 @@
+"""
+backends.py - Бэкенды инференса для модели Sentence Transformer.
+
+Поддерживаются:
+    torch    - эталонный PyTorch (по умолчанию)
+    onnx     - экспортированный ONNX граф с оптимизациями ONNX Runtime (CPUExecutionProvider)
+    openvino - граф OpenVINO IR
+
+Экспортированные графы сохраняются в model_cache/<backend>/<модель>, поэтому экспорт
+и оптимизация выполняются один раз. Для onnx/openvino нужны дополнительные пакеты:
+    pip install "sentence-transformers[onnx]"       # или [onnx-gpu]
+    pip install "sentence-transformers[openvino]"
+"""
+
+import os
+import re
+from typing import List, Dict, Any
+
+# === КОНФИГУРАЦИЯ ===
+INFERENCE_BACKENDS = ("torch", "onnx", "openvino")
+REFERENCE_BACKEND = "torch"
+ONNX_OPTIMIZATION_LEVEL = "O2"  # Уровень оптимизации графа ONNX Runtime (O1-O4, O4 только GPU)
+BACKEND_TOLERANCE = 1e-3  # Допустимое отклонение косинусного сходства от эталона (1 - cos)
+
+# Тексты для проверки совпадения эмбеддингов с эталонным бэкендом
+VERIFICATION_TEXTS = [
+    "Ваш заказ оплачен, кассовый чек ОФД во вложении",
+    "Приглашаем на собеседование на позицию Python backend разработчика",
+    "Не работает вход в SAP, ошибка 404 при доступе к серверу",
+    "Электронный билет Аэрофлот, регистрация на рейс открыта",
+    "Weekly newsletter: industry digest and market analytics",
+    "Подтвердите email: код из SMS 123456",
+]
+
+_REQUIRED_PACKAGES = {
+    "onnx": ("optimum.onnxruntime", "onnxruntime", 'pip install "sentence-transformers[onnx]"'),
+    "openvino": ("optimum.intel", "openvino", 'pip install "sentence-transformers[openvino]"'),
+}
+
+
+def check_backend_available(backend: str):
+    """Проверяет, что бэкенд известен и его зависимости установлены."""
+    import importlib
+
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Неизвестный бэкенд '{backend}'. Доступны: {', '.join(INFERENCE_BACKENDS)}")
+    if backend not in _REQUIRED_PACKAGES:
+        return
+
+    *modules, install_hint = _REQUIRED_PACKAGES[backend]
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            raise ImportError(f"Для бэкенда '{backend}' не хватает пакета {module}: {install_hint}") from e
+
+
+def _export_dir(cache_root: str, backend: str, model_name: str) -> str:
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    return os.path.join(cache_root, backend, slug)
+
+
+def _load_onnx(model_name: str, cache_root: str):
+    from sentence_transformers import SentenceTransformer
+
+    export_dir = _export_dir(cache_root, "onnx", model_name)
+    optimized_file = f"onnx/model_{ONNX_OPTIMIZATION_LEVEL}.onnx"
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+
+    if os.path.exists(os.path.join(export_dir, optimized_file)):
+        return SentenceTransformer(export_dir, device='cpu', backend="onnx",
+                                   model_kwargs={**model_kwargs, "file_name": optimized_file})
+
+    # Первый запуск: экспорт в ONNX (если в репозитории модели нет готового графа) и оптимизация
+    print(f"🔧 Экспорт модели в ONNX: {export_dir}")
+    model = SentenceTransformer(model_name, cache_folder=cache_root, device='cpu', backend="onnx",
+                                model_kwargs=model_kwargs)
+    model.save_pretrained(export_dir)
+    try:
+        from sentence_transformers import export_optimized_onnx_model
+
+        export_optimized_onnx_model(model, ONNX_OPTIMIZATION_LEVEL, export_dir)
+        print(f"✅ ONNX граф оптимизирован ({ONNX_OPTIMIZATION_LEVEL})")
+        return SentenceTransformer(export_dir, device='cpu', backend="onnx",
+                                   model_kwargs={**model_kwargs, "file_name": optimized_file})
+    except Exception as e:
+        print(f"⚠️  Не удалось оптимизировать ONNX граф, используем неоптимизированный: {e}")
+        return model
+
+
+def _load_openvino(model_name: str, cache_root: str):
+    from sentence_transformers import SentenceTransformer
+
+    export_dir = _export_dir(cache_root, "openvino", model_name)
+    if os.path.exists(os.path.join(export_dir, "openvino", "openvino_model.xml")):
+        return SentenceTransformer(export_dir, device='cpu', backend="openvino")
+
+    print(f"🔧 Экспорт модели в OpenVINO IR: {export_dir}")
+    model = SentenceTransformer(model_name, cache_folder=cache_root, device='cpu', backend="openvino")
+    model.save_pretrained(export_dir)
+    return model
+
+
+def load_backend_model(model_name: str, backend: str, cache_root: str):
+    """Загружает модель в указанном бэкенде."""
+    from sentence_transformers import SentenceTransformer
+
+    check_backend_available(backend)
+    if backend == "onnx":
+        return _load_onnx(model_name, cache_root)
+    if backend == "openvino":
+        return _load_openvino(model_name, cache_root)
+    return SentenceTransformer(model_name, cache_folder=cache_root, device='cpu')
+
+
+def compare_embeddings(reference_model, candidate_model, texts: List[str] = None,
+                       tolerance: float = BACKEND_TOLERANCE) -> Dict[str, Any]:
+    """
+    Сравнивает эмбеддинги двух моделей на одних и тех же текстах.
+    :return: Минимальное косинусное сходство пар, максимальное абсолютное отклонение и вердикт
+    """
+    import numpy as np
+
+    texts = texts or VERIFICATION_TEXTS
+    reference = reference_model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    candidate = candidate_model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+
+    reference_norm = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate_norm = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosines = np.sum(reference_norm * candidate_norm, axis=1)
+
+    min_cosine = float(cosines.min())
+    return {
+        "texts": len(texts),
+        "min_cosine": min_cosine,
+        "max_abs_diff": float(np.abs(reference - candidate).max()),
+        "tolerance": tolerance,
+        "ok": bool(1.0 - min_cosine <= tolerance),
+    }
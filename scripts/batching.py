@@ -0,0 +1,195 @@
+"""
+batching.py - Планировщик батчей для кодирования писем.
+
+Тексты токенизируются один раз (окна, уже токенизированные при нарезке
+в token_windows, получают только служебные токены), сортируются по длине в токенах и режутся
+на батчи по бюджету токенов (с учетом паддинга), а не по фиксированному
+количеству писем. Короткие письма больше не паддятся до длины огромных
+рассылок, а результаты возвращаются в исходном порядке.
+"""
+
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+# === КОНФИГУРАЦИЯ ===
+DEFAULT_TOKEN_BUDGET = 8192  # Максимум токенов в батче с учетом паддинга
+DEFAULT_MAX_BATCH_SIZE = 64  # Максимум писем в батче независимо от бюджета
+
+
+def new_encoding_stats() -> Dict[str, Any]:
+    """Создает пустой словарь статистики кодирования."""
+    return {
+        'texts': 0,
+        'batches': 0,
+        'failed_batches': 0,
+        'deduplicated': 0,
+        'windows': 0,
+        'real_tokens': 0,
+        'padded_tokens': 0,
+        'naive_padded_tokens': 0,
+        'seconds': 0.0,
+    }
+
+
+def merge_encoding_stats(total: Dict[str, Any], part: Dict[str, Any]) -> Dict[str, Any]:
+    """Добавляет статистику одного прогона к накопленной."""
+    for key, value in part.items():
+        if isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def summarize_encoding_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Считает производные метрики: доля паддинга и токенов в секунду."""
+    padded = stats.get('padded_tokens', 0)
+    naive = stats.get('naive_padded_tokens', 0)
+    real = stats.get('real_tokens', 0)
+    seconds = stats.get('seconds', 0.0)
+    return {
+        **stats,
+        'padding_ratio': (padded - real) / padded if padded else 0.0,
+        'naive_padding_ratio': (naive - real) / naive if naive else 0.0,
+        'tokens_per_sec': real / seconds if seconds > 0 else 0.0,
+    }
+
+
+def print_encoding_stats(stats: Dict[str, Any]):
+    """Выводит статистику кодирования в консоль."""
+    summary = summarize_encoding_stats(stats)
+    print(f"⚡ Кодирование: {summary['texts']} текстов, {summary['batches']} батчей")
+    print(f"   • Паддинг: {summary['padding_ratio']:.1%} "
+          f"(без бакетов было бы {summary['naive_padding_ratio']:.1%})")
+    print(f"   • Скорость: {summary['tokens_per_sec']:.0f} токенов/сек")
+    if summary['failed_batches']:
+        print(f"   • Батчей с ошибками: {summary['failed_batches']}")
+
+
+def tokenize_texts(model, texts: List[str]) -> List[List[int]]:
+    """
+    Токенизирует тексты один раз с обрезкой до max_seq_length модели.
+    Текст, который не удалось токенизировать, получает None.
+    """
+    tokenizer = model.tokenizer
+    max_length = model.max_seq_length
+    try:
+        return tokenizer(texts, truncation=True, max_length=max_length,
+                         padding=False)['input_ids']
+    except Exception as e:
+        print(f"⚠️  Ошибка пакетной токенизации: {e}. Токенизируем по одному...")
+
+    token_ids = []
+    for text in texts:
+        try:
+            token_ids.append(tokenizer(text, truncation=True, max_length=max_length,
+                                       padding=False)['input_ids'])
+        except Exception as e:
+            print(f"⚠️  Ошибка токенизации текста: {e}")
+            token_ids.append(None)
+    return token_ids
+
+
+def model_token_ids(model, texts: List[str], window_ids: List[Optional[List[int]]] = None) -> List[List[int]]:
+    """
+    Id токенов текстов для модели. Для текстов с готовыми id окон (token_windows)
+    добавляются только служебные токены, остальные токенизируются (tokenize_texts).
+    :param window_ids: Id токенов окон без служебных или None для каждого текста
+    """
+    if window_ids is None:
+        return tokenize_texts(model, texts)
+
+    tokenizer = model.tokenizer
+    limit = model.max_seq_length - tokenizer.num_special_tokens_to_add()
+    token_ids = [None] * len(texts)
+    missing = []
+    for i, ids in enumerate(window_ids):
+        try:
+            if ids is None:
+                raise ValueError("нет id окна")
+            token_ids[i] = tokenizer.build_inputs_with_special_tokens(list(ids[:limit]))
+        except Exception:
+            missing.append(i)
+    if missing:
+        for i, ids in zip(missing, tokenize_texts(model, [texts[i] for i in missing])):
+            token_ids[i] = ids
+    return token_ids
+
+
+def plan_batches(lengths: List[int], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> List[List[int]]:
+    """
+    Группирует индексы текстов в батчи близкой длины.
+    Индексы сортируются по длине, батч растет, пока (размер * длина самого
+    длинного текста) укладывается в бюджет токенов.
+    :return: Список батчей, каждый - список исходных индексов
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+
+    batches = []
+    current = []
+    for i in order:
+        # Тексты отсортированы, поэтому текущий - самый длинный в батче
+        padded_cost = (len(current) + 1) * max(lengths[i], 1)
+        if current and (padded_cost > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+        current.append(i)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _naive_padded_tokens(lengths: List[int], batch_size: int) -> int:
+    """Токены с паддингом при наивной нарезке батчей в исходном порядке."""
+    total = 0
+    for start in range(0, len(lengths), batch_size):
+        chunk = lengths[start:start + batch_size]
+        total += max(chunk) * len(chunk)
+    return total
+
+
+def encode_bucketed(model, texts: List[str], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                    window_ids: List[Optional[List[int]]] = None) -> Tuple[list, Dict[str, Any]]:
+    """
+    Кодирует тексты батчами, сгруппированными по длине в токенах.
+    Ошибка в батче не ломает остальные: его тексты получают None,
+    вызывающий код может перекодировать их по одному.
+    :param window_ids: Id токенов окон из token_windows (см. model_token_ids)
+    :return: (эмбеддинги в исходном порядке или None, статистика)
+    """
+    import torch
+    from sentence_transformers.util import batch_to_device
+
+    stats = new_encoding_stats()
+    embeddings = [None] * len(texts)
+    if not texts:
+        return embeddings, stats
+
+    token_ids = model_token_ids(model, texts, window_ids)
+    valid = [i for i, ids in enumerate(token_ids) if ids is not None]
+    lengths = [len(token_ids[i]) for i in valid]
+
+    stats['texts'] = len(valid)
+    stats['real_tokens'] = sum(lengths)
+    stats['naive_padded_tokens'] = _naive_padded_tokens(lengths, max_batch_size) if lengths else 0
+
+    started = time.perf_counter()
+    for batch in plan_batches(lengths, token_budget, max_batch_size):
+        indices = [valid[j] for j in batch]
+        try:
+            features = model.tokenizer.pad({'input_ids': [token_ids[i] for i in indices]},
+                                           padding=True, return_tensors='pt')
+            features = batch_to_device(dict(features), model.device)
+            with torch.no_grad():
+                batch_embeddings = model(features)['sentence_embedding'].detach()
+
+            stats['batches'] += 1
+            stats['padded_tokens'] += int(features['input_ids'].numel())
+            for row, i in enumerate(indices):
+                embeddings[i] = batch_embeddings[row]
+        except Exception as e:
+            print(f"⚠️  Ошибка кодирования батча ({len(indices)} текстов): {e}")
+            stats['failed_batches'] += 1
+    stats['seconds'] = time.perf_counter() - started
+
+    return embeddings, stats
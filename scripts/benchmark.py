@@ -0,0 +1,883 @@
+"""
+benchmark.py - Бенчмарки производительности Mail Lens.
+
+Использование:
+    python scripts/benchmark.py import-time [--runs 5] [--max-ms 300]
+    python scripts/benchmark.py quantization [--limit N]
+    python scripts/benchmark.py backends [--backends torch onnx openvino] [--limit N]
+    python scripts/benchmark.py pool [--workers 1 2 4 8 16] [--torch-threads 1] [--chunk-size 64]
+    python scripts/benchmark.py cascade [--margin 0.5] [--min-score 3] [--limit N]
+    python scripts/benchmark.py stream [--counts 1000 100000] [--modes stream staged list] [--chunk-size 512]
+    python scripts/benchmark.py parse [--runs 3] [--modes legacy bytes]
+    python scripts/benchmark.py parse-memory [--attachment-mb 50]
+    python scripts/benchmark.py service [--url http://127.0.0.1:8765] [--concurrency 16] [--requests 1000]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+PROJECT_ROOT = os.path.dirname(current_dir)
+INPUT_FOLDER = os.path.join(PROJECT_ROOT, "data_input")
+OUTPUT_FOLDER = os.path.join(PROJECT_ROOT, "data_output")
+CATEGORIES_FILE = os.path.join(PROJECT_ROOT, "categories", "new_cats.txt")
+
+# Модули, которые не должны загружаться при импорте classifier
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers")
+
+_IMPORT_PROBE = """
+import sys, time
+sys.path.insert(0, {scripts_dir!r})
+started = time.perf_counter()
+import classifier
+elapsed_ms = (time.perf_counter() - started) * 1000
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(f"{{elapsed_ms:.3f}} {{','.join(heavy)}}")
+"""
+
+
+def bench_import_time(args) -> int:
+    """Замеряет время импорта classifier в чистом процессе."""
+    print("=" * 70)
+    print("⏱️  ВРЕМЯ ИМПОРТА classifier")
+    print("=" * 70)
+
+    probe = _IMPORT_PROBE.format(scripts_dir=current_dir, heavy=HEAVY_MODULES)
+    timings = []
+    heavy_loaded = set()
+    for run in range(1, args.runs + 1):
+        completed = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"❌ Импорт завершился ошибкой:\n{completed.stderr}")
+            return 1
+        elapsed, _, heavy = completed.stdout.strip().splitlines()[-1].partition(" ")
+        timings.append(float(elapsed))
+        heavy_loaded.update(name for name in heavy.split(",") if name)
+        print(f"   • Запуск {run}: {float(elapsed):.1f} мс")
+
+    median = statistics.median(timings)
+    print(f"\n📊 Медиана: {median:.1f} мс (лимит {args.max_ms} мс)")
+
+    ok = True
+    if heavy_loaded:
+        print(f"❌ При импорте загружены тяжелые модули: {', '.join(sorted(heavy_loaded))}")
+        ok = False
+    if median > args.max_ms:
+        print(f"❌ Импорт дольше лимита")
+        ok = False
+    if ok:
+        print("✅ Импорт укладывается в лимит")
+    return 0 if ok else 1
+
+
+def _load_corpus(limit: int = None) -> list:
+    """
+    Парсит письма из data_input (отсортированные по имени файла).
+    Тела декодируются у всех писем, чтобы режимы без правил по заголовкам видели полный текст.
+    """
+    from parser import parse_emails
+
+    emails = sorted(parse_emails(INPUT_FOLDER, header_rules=False), key=lambda email: email.get("filename", ""))
+    return emails[:limit] if limit else emails
+
+
+def _top_categories(results: list) -> list:
+    return [r["categories"][0][0] if r.get("categories") else None for r in results]
+
+
+def _quality(metrics_data: dict) -> dict:
+    """Достает accuracy и macro F1 из результата metrics.calculate_metrics."""
+    if not metrics_data:
+        return {"accuracy": 0.0, "macro_f1": 0.0}
+    return {
+        "accuracy": metrics_data["accuracy"],
+        "macro_f1": metrics_data["classification_report"].get("macro avg", {}).get("f1-score", 0.0),
+    }
+
+
+def bench_quantization(args) -> int:
+    """Сравнивает fp32 и int8 модели по точности и скорости на корпусе data_input."""
+    import time
+    import model_provider
+    from classifier import classify_emails
+    from metrics import calculate_metrics
+
+    emails = _load_corpus(args.limit)
+    if not emails:
+        print("❌ Нет писем для сравнения")
+        return 1
+
+    rows = {}
+    predictions = {}
+    for mode, quantize_int8 in (("fp32", False), ("int8", True)):
+        print("\n" + "=" * 70)
+        print(f"🔬 РЕЖИМ {mode.upper()}")
+        print("=" * 70)
+        model_provider.configure(quantize_int8=quantize_int8)
+
+        started = time.perf_counter()
+        model_provider.warm_up()
+        load_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        # Сравниваются модели, поэтому все письма идут через модель
+        results = classify_emails(emails, CATEGORIES_FILE, top_n=5, threshold=0.25, use_cache=False,
+                                  cascade=False, header_rules=False, domain_prior=False, near_duplicates=False)
+        seconds = time.perf_counter() - started
+
+        rows[mode] = {
+            "load_seconds": load_seconds,
+            "classify_seconds": seconds,
+            "emails_per_sec": len(emails) / seconds if seconds > 0 else 0.0,
+            **_quality(calculate_metrics(results)),
+        }
+        predictions[mode] = _top_categories(results)
+
+    agreement = sum(a == b for a, b in zip(predictions["fp32"], predictions["int8"])) / len(emails)
+    speedup = rows["fp32"]["classify_seconds"] / rows["int8"]["classify_seconds"] \
+        if rows["int8"]["classify_seconds"] > 0 else 0.0
+
+    print("\n" + "=" * 70)
+    print(f"📊 FP32 vs INT8 ({len(emails)} писем)")
+    print("=" * 70)
+    print(f"{'':<22}{'fp32':>12}{'int8':>12}")
+    for key, title, fmt in (("load_seconds", "Загрузка, с", "{:>12.2f}"),
+                            ("classify_seconds", "Классификация, с", "{:>12.2f}"),
+                            ("emails_per_sec", "Писем/сек", "{:>12.2f}"),
+                            ("accuracy", "Accuracy", "{:>12.4f}"),
+                            ("macro_f1", "Macro F1", "{:>12.4f}")):
+        print(f"{title:<22}" + fmt.format(rows["fp32"][key]) + fmt.format(rows["int8"][key]))
+    print(f"\n⚡ Ускорение int8: x{speedup:.2f}")
+    print(f"🤝 Совпадение топ-категорий: {agreement:.1%}")
+
+    report = {"emails": len(emails), "modes": rows, "speedup": speedup, "agreement": agreement}
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    report_file = os.path.join(OUTPUT_FOLDER, "quantization_comparison.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Отчет сохранен: {report_file}")
+    return 0
+
+
+def bench_backends(args) -> int:
+    """Проверяет совпадение эмбеддингов бэкендов с эталоном и сравнивает их скорость."""
+    import time
+    import model_provider
+    from backends import REFERENCE_BACKEND, check_backend_available, compare_embeddings, load_backend_model
+    from classifier import preprocess_text
+
+    emails = _load_corpus(args.limit)
+    texts = [preprocess_text(email.get("body", ""), email.get("subject", "")) for email in emails]
+    texts = [text for text in texts if text.strip()]
+    if not texts:
+        print("❌ Нет писем для сравнения")
+        return 1
+
+    rows = {}
+    reference_models = {}
+    all_ok = True
+    for backend in args.backends:
+        print("\n" + "=" * 70)
+        print(f"🔬 БЭКЕНД {backend}")
+        print("=" * 70)
+        try:
+            check_backend_available(backend)
+            model_provider.configure(backend=backend)
+            model = model_provider.warm_up()
+        except Exception as e:
+            print(f"⚠️  Бэкенд недоступен: {e}")
+            rows[backend] = {"available": False, "error": str(e)}
+            continue
+
+        name = model_provider.get_model_name()
+        if name not in reference_models:
+            reference_models[name] = model if backend == REFERENCE_BACKEND else \
+                load_backend_model(name, REFERENCE_BACKEND, model_provider.MODEL_CACHE_DIR)
+        verification = compare_embeddings(reference_models[name], model)
+        all_ok = all_ok and verification["ok"]
+
+        started = time.perf_counter()
+        model.encode(texts, batch_size=32, show_progress_bar=False)
+        seconds = time.perf_counter() - started
+
+        rows[backend] = {
+            "available": True,
+            "model": name,
+            "texts_per_sec": len(texts) / seconds if seconds > 0 else 0.0,
+            **verification,
+        }
+
+    print("\n" + "=" * 70)
+    print(f"📊 БЭКЕНДЫ ({len(texts)} текстов, эталон: {REFERENCE_BACKEND})")
+    print("=" * 70)
+    for backend, row in rows.items():
+        if not row["available"]:
+            print(f"   • {backend:<10} недоступен")
+            continue
+        verdict = "✅" if row["ok"] else "❌"
+        print(f"   • {backend:<10} {row['texts_per_sec']:>8.2f} текстов/сек, "
+              f"min cos {row['min_cosine']:.6f}, max |Δ| {row['max_abs_diff']:.2e} {verdict}")
+    return 0 if all_ok else 1
+
+
+def _memory_mb(pids: list) -> float:
+    """
+    Суммарная память процессов в МБ. На Linux считается PSS (разделяемые страницы
+    делятся между процессами), иначе - RSS. None, если замер недоступен.
+    """
+    total_kb = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+                lines = [line for line in f if line.startswith("Pss:")]
+            if not lines:
+                with open(f"/proc/{pid}/status", "r") as f:
+                    lines = [line for line in f if line.startswith("VmRSS:")]
+            total_kb += int(lines[0].split()[1])
+        except (OSError, IndexError, ValueError):
+            return None
+    return total_kb / 1024
+
+
+def _corpus_texts(limit: int = None, min_texts: int = 0) -> list:
+    """Предобработанные тексты корпуса, при необходимости размноженные до min_texts."""
+    from classifier import preprocess_text
+
+    texts = [preprocess_text(email.get("body", ""), email.get("subject", "")) for email in _load_corpus(limit)]
+    texts = [text for text in texts if text.strip()]
+    if texts and len(texts) < min_texts:
+        texts = (texts * (min_texts // len(texts) + 1))[:min_texts]
+    return texts
+
+
+def bench_pool(args) -> int:
+    """Масштабирование многопроцессного кодирования по числу воркеров."""
+    import time
+    import torch
+    import model_provider
+    from batching import encode_bucketed
+    from classifier import ENCODE_BATCH_SIZE, ENCODE_TOKEN_BUDGET
+    from encoding_pool import configure_encoding_pool, get_encoding_pool, shutdown_encoding_pool
+
+    texts = _corpus_texts(args.limit, args.min_texts)
+    if not texts:
+        print("❌ Нет писем для замера")
+        return 1
+
+    model = model_provider.warm_up()
+    rows = []
+    for workers in args.workers:
+        print("\n" + "=" * 70)
+        print(f"🔬 ВОРКЕРОВ: {workers}")
+        print("=" * 70)
+        if workers <= 1:
+            torch.set_num_threads(args.torch_threads)
+            started = time.perf_counter()
+            encode_bucketed(model, texts, ENCODE_TOKEN_BUDGET, ENCODE_BATCH_SIZE)
+            seconds = time.perf_counter() - started
+            memory = _memory_mb([os.getpid()])
+        else:
+            configure_encoding_pool(workers=workers, torch_threads=args.torch_threads,
+                                    chunk_size=args.chunk_size)
+            pool = get_encoding_pool()
+            # Прогрев: запуск процессов и загрузка модели не входят в замер
+            pool.encode(texts[:args.chunk_size * workers], ENCODE_BATCH_SIZE, ENCODE_TOKEN_BUDGET)
+            started = time.perf_counter()
+            pool.encode(texts, ENCODE_BATCH_SIZE, ENCODE_TOKEN_BUDGET)
+            seconds = time.perf_counter() - started
+            memory = _memory_mb([os.getpid()] + pool.process_ids())
+            shutdown_encoding_pool()
+
+        rows.append({"workers": workers, "seconds": seconds,
+                     "texts_per_sec": len(texts) / seconds if seconds > 0 else 0.0,
+                     "memory_mb": memory})
+
+    baseline = rows[0]["texts_per_sec"] or 1.0
+    print("\n" + "=" * 70)
+    print(f"📊 МАСШТАБИРОВАНИЕ ({len(texts)} текстов, {args.torch_threads} потоков torch на воркер)")
+    print("=" * 70)
+    print(f"{'Воркеров':>10}{'Текстов/сек':>14}{'Ускорение':>12}{'Память, МБ':>14}")
+    for row in rows:
+        memory = f"{row['memory_mb']:.0f}" if row["memory_mb"] is not None else "н/д"
+        print(f"{row['workers']:>10}{row['texts_per_sec']:>14.2f}"
+              f"{row['texts_per_sec'] / baseline:>11.2f}x{memory:>14}")
+    return 0
+
+
+def bench_cascade(args) -> int:
+    """Сравнивает классификацию только моделью и каскад "заголовки -> ключевые слова -> модель"."""
+    import time
+    import keyword_stage
+    import model_provider
+    from classifier import classify_emails
+    from metrics import calculate_metrics
+
+    if args.margin is not None:
+        keyword_stage.KEYWORD_MARGIN = args.margin
+    if args.min_score is not None:
+        keyword_stage.KEYWORD_MIN_SCORE = args.min_score
+
+    emails = _load_corpus(args.limit)
+    if not emails:
+        print("❌ Нет писем для сравнения")
+        return 1
+    model_provider.warm_up()
+
+    rows = {}
+    predictions = {}
+    stage_results = {}
+    for mode, cascade in (("model", False), ("cascade", True)):
+        print("\n" + "=" * 70)
+        print(f"🔬 РЕЖИМ {mode.upper()}")
+        print("=" * 70)
+        started = time.perf_counter()
+        results = classify_emails(emails, CATEGORIES_FILE, top_n=5, threshold=0.25,
+                                  use_cache=False, cascade=cascade, header_rules=cascade, domain_prior=False,
+                                  near_duplicates=False)
+        seconds = time.perf_counter() - started
+
+        rows[mode] = {
+            "classify_seconds": seconds,
+            "emails_per_sec": len(emails) / seconds if seconds > 0 else 0.0,
+            "header_rule_share": sum(r.get("decided_by") == "header_rule" for r in results) / len(emails),
+            "keyword_share": sum(r.get("decided_by") == "keywords" for r in results) / len(emails),
+            **_quality(calculate_metrics(results)),
+        }
+        predictions[mode] = _top_categories(results)
+        if cascade:
+            for stage in ("header_rule", "keywords"):
+                stage_results[stage] = [r for r in results if r.get("decided_by") == stage]
+
+    from utils import extract_true_category_from_filename
+
+    stage_precision = {}
+    for stage, decided in stage_results.items():
+        correct = sum(r["categories"][0][0] == extract_true_category_from_filename(r["filename"])
+                      for r in decided)
+        stage_precision[stage] = {"decided": len(decided), "correct": correct,
+                                  "precision": correct / len(decided) if decided else 0.0}
+    speedup = rows["model"]["classify_seconds"] / rows["cascade"]["classify_seconds"] \
+        if rows["cascade"]["classify_seconds"] > 0 else 0.0
+    agreement = sum(a == b for a, b in zip(predictions["model"], predictions["cascade"])) / len(emails)
+
+    print("\n" + "=" * 70)
+    print(f"📊 МОДЕЛЬ vs КАСКАД ({len(emails)} писем, отрыв {keyword_stage.KEYWORD_MARGIN}, "
+          f"мин. вес {keyword_stage.KEYWORD_MIN_SCORE})")
+    print("=" * 70)
+    print(f"{'':<26}{'model':>12}{'cascade':>12}")
+    for key, title, fmt in (("classify_seconds", "Классификация, с", "{:>12.2f}"),
+                            ("emails_per_sec", "Писем/сек", "{:>12.2f}"),
+                            ("header_rule_share", "Решено по заголовкам", "{:>12.1%}"),
+                            ("keyword_share", "Решено ключевыми словами", "{:>12.1%}"),
+                            ("accuracy", "Accuracy", "{:>12.4f}"),
+                            ("macro_f1", "Macro F1", "{:>12.4f}")):
+        print(f"{title:<26}" + fmt.format(rows["model"][key]) + fmt.format(rows["cascade"][key]))
+    print(f"\n⚡ Ускорение каскада: x{speedup:.2f}")
+    for stage, title in (("header_rule", "правил по заголовкам"), ("keywords", "ключевых слов")):
+        row = stage_precision[stage]
+        print(f"🎯 Точность {title}: {row['correct']}/{row['decided']} ({row['precision']:.1%})")
+    print(f"🤝 Совпадение топ-категорий: {agreement:.1%}")
+
+    report = {
+        "emails": len(emails),
+        "margin": keyword_stage.KEYWORD_MARGIN,
+        "min_score": keyword_stage.KEYWORD_MIN_SCORE,
+        "modes": rows,
+        "speedup": speedup,
+        "stage_precision": stage_precision,
+        "agreement": agreement,
+    }
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    report_file = os.path.join(OUTPUT_FOLDER, "cascade_comparison.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Отчет сохранен: {report_file}")
+    return 0
+
+
+_STREAM_PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {scripts_dir!r})
+import classifier
+# Кэши не участвуют в замере: кэш эмбеддингов, гистограммы доменов и индекс близнецов
+# выключены, а кэш категорий пишется во временную папку, не в model_cache
+classifier.MODEL_CACHE_DIR = {cache_dir!r}
+options = dict(top_n=5, threshold=0.25, use_cache=False, domain_prior=False, near_duplicates=False)
+started = time.perf_counter()
+if {mode!r} == "stream":
+    from pipeline import run_streaming
+    run_streaming({input_dir!r}, {output_dir!r}, {categories!r}, chunk_size={chunk_size!r}, **options)
+elif {mode!r} == "staged":
+    from pipeline import run_staged
+    run_staged({input_dir!r}, {output_dir!r}, {categories!r}, chunk_size={chunk_size!r}, **options)
+else:
+    from parser import parse_emails
+    from exporter import export_results, generate_stats
+    results = classifier.classify_emails(parse_emails({input_dir!r}), {categories!r}, **options)
+    export_results(results, {output_dir!r})
+    generate_stats(results)
+seconds = time.perf_counter() - started
+# ru_maxrss на Linux - в килобайтах
+peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+with open({result_file!r}, "w") as f:
+    json.dump({{"seconds": seconds, "peak_rss_mb": peak_mb}}, f)
+"""
+
+
+def _synthesize_corpus(target_dir: str, count: int) -> int:
+    """
+    Корпус из count писем с уникальными текстами. Первый проход - сами письма data_input,
+    дальше - синтетические text/plain письма: слова письма-образца перемешаны своим
+    зерном, поэтому длина и словарь как у образца, но ни кэш эмбеддингов, ни SimHash
+    близнецов копии не узнают. Имя сохраняет категорию: <имя>_synth<k>.eml.
+    """
+    import random
+    import shutil
+    from email.message import EmailMessage
+    from parser import parse_file
+
+    names = sorted(f for f in os.listdir(INPUT_FOLDER) if f.endswith((".eml", ".msg")))
+    sources = []
+    for name in names:
+        email_data = parse_file(os.path.join(INPUT_FOLDER, name), header_rules=False)
+        if email_data:
+            sources.append((name, email_data))
+    if not sources:
+        return 0
+
+    for i in range(count):
+        name, email_data = sources[i % len(sources)]
+        if i < len(sources):
+            shutil.copyfile(os.path.join(INPUT_FOLDER, name), os.path.join(target_dir, name))
+            continue
+        words = (email_data.get("body") or "").split()
+        random.Random(i).shuffle(words)
+        message = EmailMessage()
+        message["From"] = (email_data.get("headers") or {}).get("from_address") or "sender@example.com"
+        message["Subject"] = f"{email_data.get('subject') or ''} #{i}"
+        # Перенос строк каждые 20 слов: длинные строки для MIME не нужны
+        message.set_content("\n".join(" ".join(words[j:j + 20]) for j in range(0, len(words), 20)) or f"#{i}")
+        stem = os.path.splitext(name)[0]
+        with open(os.path.join(target_dir, f"{stem}_synth{i // len(sources)}.eml"), "wb") as f:
+            f.write(message.as_bytes())
+    return count
+
+
+def bench_stream(args) -> int:
+    """Пиковая память (RSS) потокового и спискового режимов на корпусах разного размера."""
+    import tempfile
+
+    rows = []
+    for count in args.counts:
+        with tempfile.TemporaryDirectory(prefix="mail_lens_stream_") as workdir:
+            input_dir = os.path.join(workdir, "input")
+            os.makedirs(input_dir)
+            if not _synthesize_corpus(input_dir, count):
+                print("❌ Нет писем для замера")
+                return 1
+            for mode in args.modes:
+                print(f"🔬 {mode}: {count} писем...")
+                output_dir = os.path.join(workdir, f"output_{mode}")
+                result_file = os.path.join(workdir, f"{mode}.json")
+                probe = _STREAM_PROBE.format(scripts_dir=current_dir, mode=mode, input_dir=input_dir,
+                                             output_dir=output_dir, categories=CATEGORIES_FILE,
+                                             cache_dir=os.path.join(workdir, f"cache_{mode}"),
+                                             chunk_size=args.chunk_size, result_file=result_file)
+                # Вывод пайплайна не нужен, ошибки остаются в stderr
+                completed = subprocess.run([sys.executable, "-c", probe], stdout=subprocess.DEVNULL,
+                                           stderr=subprocess.PIPE, text=True)
+                if completed.returncode != 0:
+                    print(f"❌ Режим {mode} завершился ошибкой:\n{completed.stderr[-2000:]}")
+                    return 1
+                with open(result_file, "r") as f:
+                    measured = json.load(f)
+                rows.append({"mode": mode, "emails": count, **measured})
+
+    print("\n" + "=" * 70)
+    print(f"📊 ПИКОВАЯ ПАМЯТЬ (порция потокового режима: {args.chunk_size} писем)")
+    print("=" * 70)
+    print("Корпус: письма data_input + синтетические письма с перемешанными словами (тексты уникальны);")
+    print("кэш эмбеддингов, гистограммы доменов и индекс близнецов выключены, кэш категорий - во временной папке")
+    print(f"{'Режим':>10}{'Писем':>10}{'Пик RSS, МБ':>14}{'Секунд':>10}{'Писем/сек':>12}")
+    for row in rows:
+        rate = row["emails"] / row["seconds"] if row["seconds"] > 0 else 0.0
+        print(f"{row['mode']:>10}{row['emails']:>10}{row['peak_rss_mb']:>14.0f}"
+              f"{row['seconds']:>10.1f}{rate:>12.1f}")
+    return 0
+
+
+def _legacy_parse_eml(file_path: str):
+    """Прежний разбор .eml: chardet по всему файлу и разбор текста после декодирования."""
+    import io
+    from email import message_from_file
+    import chardet
+
+    with open(file_path, 'rb') as f:
+        raw_data = f.read()
+    encoding = chardet.detect(raw_data)['encoding'] or 'utf-8'
+    for enc in [encoding, 'utf-8', 'cp1251', 'windows-1251', 'koi8-r', 'iso-8859-5', 'latin-1']:
+        try:
+            msg = message_from_file(io.StringIO(raw_data.decode(enc), newline=None))
+            break
+        except (UnicodeDecodeError, LookupError):
+            continue
+    else:
+        msg = message_from_file(io.StringIO(raw_data.decode('utf-8', errors='ignore'), newline=None))
+    return {"subject": msg.get("Subject", ""), "body": _legacy_email_body(msg)}
+
+
+def _legacy_email_body(msg) -> str:
+    """Прежнее извлечение тела: обход всех частей полностью разобранного письма."""
+    from parser import charset_key, decode_payload, html_to_text
+
+    body = ""
+    key = charset_key(msg)
+    
+    # Сначала пытаемся извлечь тему письма, так как она содержит важную информацию
+    subject = msg.get("Subject", "")
+    try:
+        # Пытаемся декодировать тему из формата =?UTF-8?B?...=
+        from email.header import decode_header
+        decoded_parts = decode_header(subject)
+        decoded_subject = ""
+        for part, encoding in decoded_parts:
+            if isinstance(part, bytes):
+                if encoding:
+                    decoded_subject += part.decode(encoding, errors='ignore')
+                else:
+                    decoded_subject += part.decode('utf-8', errors='ignore')
+            else:
+                decoded_subject += part
+        if decoded_subject.strip():
+            body += f"Тема письма: {decoded_subject}\n\n"
+    except Exception as e:
+        # Если декодирование не удалось, оставляем как есть
+        if subject.strip():
+            body += f"Тема письма: {subject}\n\n"
+    
+    if msg.is_multipart():
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition", ""))
+            
+            # Текстовое тело
+            if content_type == "text/plain" and "attachment" not in content_disposition:
+                payload = part.get_payload(decode=True)
+                if payload:
+                    body += decode_payload(payload, part.get_content_charset(), key)
+            
+            # HTML тело
+            elif content_type == "text/html" and "attachment" not in content_disposition:
+                try:
+                    html_content = part.get_payload(decode=True)
+                    if html_content:
+                        html_text = html_to_text(html_content, part.get_content_charset(), key)
+                        if html_text:
+                            body += html_text + "\n"
+                except Exception as e:
+                    print(f"⚠️  Ошибка при обработке HTML части: {e}")
+    else:
+        # Не multipart письмо - пытаемся получить содержимое напрямую
+        try:
+            payload = msg.get_payload(decode=True)
+            if payload:
+                content_type = msg.get_content_type()
+                
+                if content_type == 'text/plain':
+                    body += decode_payload(payload, msg.get_content_charset(), key)
+                
+                elif content_type == 'text/html':
+                    html_text = html_to_text(payload, msg.get_content_charset(), key)
+                    if html_text:
+                        body += html_text
+                
+                else:
+                    # Для других типов пытаемся декодировать как текст
+                    try:
+                        body += payload.decode('utf-8', errors='ignore')
+                    except:
+                        pass
+        except Exception as e:
+            print(f"⚠️  Ошибка при обработке не-multipart письма: {e}")
+    
+    return body.strip()
+
+
+def bench_parse(args) -> int:
+    """Скорость разбора .eml data_input: прежний текстовый разбор и разбор байтов."""
+    import time
+    from parser import DECODE_STATS, parse_eml, print_decode_stats
+
+    files = sorted(os.path.join(INPUT_FOLDER, f) for f in os.listdir(INPUT_FOLDER) if f.endswith(".eml"))
+    if not files:
+        print("❌ Нет .eml писем для замера")
+        return 1
+    total_mb = sum(os.path.getsize(path) for path in files) / (1024 * 1024)
+    parse_funcs = {
+        "legacy": _legacy_parse_eml,
+        "bytes": lambda path: parse_eml(path, header_rules=False),
+    }
+
+    rows = []
+    for mode in args.modes:
+        print(f"🔬 {mode}: {len(files)} писем, {total_mb:.1f} МБ...")
+        timings, per_file = [], []
+        DECODE_STATS.update(dict.fromkeys(DECODE_STATS, 0))  # Legacy тоже декодирует части через parser
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            for path in files:
+                file_started = time.perf_counter()
+                parse_funcs[mode](path)
+                per_file.append(time.perf_counter() - file_started)
+            timings.append(time.perf_counter() - started)
+        seconds = statistics.median(timings)
+        if mode == "bytes":
+            decode_stats = dict(DECODE_STATS)
+        rows.append({"mode": mode, "seconds": seconds, "ms_per_email": seconds / len(files) * 1000,
+                     "max_ms": max(per_file) * 1000, "mb_per_sec": total_mb / seconds if seconds > 0 else 0.0})
+
+    print("\n" + "=" * 70)
+    print(f"📊 РАЗБОР .EML (медиана {args.runs} прогонов)")
+    print("=" * 70)
+    print(f"{'Режим':>10}{'Секунд':>10}{'мс/письмо':>12}{'Макс. мс':>12}{'МБ/сек':>10}")
+    for row in rows:
+        print(f"{row['mode']:>10}{row['seconds']:>10.2f}{row['ms_per_email']:>12.1f}"
+              f"{row['max_ms']:>12.1f}{row['mb_per_sec']:>10.1f}")
+    if "bytes" in args.modes:
+        print_decode_stats(decode_stats)
+    if len(rows) == 2 and rows[1]["seconds"] > 0:
+        print(f"\n⚡ Ускорение {rows[1]['mode']} относительно {rows[0]['mode']}: "
+              f"x{rows[0]['seconds'] / rows[1]['seconds']:.1f}")
+    return 0
+
+
+_PARSE_MEMORY_PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {scripts_dir!r})
+from parser import parse_eml
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+started = time.perf_counter()
+email_data = parse_eml({eml_path!r}, header_rules=False)
+seconds = time.perf_counter() - started
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+with open({result_file!r}, "w") as f:
+    json.dump({{"seconds": seconds, "baseline_mb": baseline, "peak_mb": peak,
+               "body_chars": len(email_data["body"]), "attachments": email_data["attachment_meta"]}}, f)
+"""
+
+
+def bench_parse_memory(args) -> int:
+    """Пиковая память разбора письма с большим вложением (должна быть близка к размеру текста)."""
+    import base64
+    import tempfile
+
+    with tempfile.TemporaryDirectory(prefix="mail_lens_parse_memory_") as workdir:
+        # Письмо пишется порциями: процесс бенчмарка не держит вложение в памяти,
+        # а пик RSS родителя наследуется замеряющим подпроцессом
+        eml_path = os.path.join(workdir, "attachment.eml")
+        text = "Добрый день! Во вложении счет за текущий месяц.\n" * 50
+        html = "<p>Добрый день! Во вложении <b>счет</b> за текущий месяц.</p>" * 50
+        with open(eml_path, "wb") as f:
+            f.write(b"From: billing@example.com\nSubject: =?utf-8?b?" + base64.b64encode("Счет на оплату".encode())
+                    + b"?=\nMIME-Version: 1.0\nContent-Type: multipart/mixed; boundary=\"MIXED\"\n\n"
+                    b"--MIXED\nContent-Type: multipart/alternative; boundary=\"ALT\"\n\n"
+                    b"--ALT\nContent-Type: text/plain; charset=utf-8\nContent-Transfer-Encoding: 8bit\n\n"
+                    + text.encode("utf-8") + b"\n--ALT\nContent-Type: text/html; charset=utf-8\n"
+                    b"Content-Transfer-Encoding: 8bit\n\n" + html.encode("utf-8") + b"\n--ALT--\n\n"
+                    b"--MIXED\nContent-Type: application/octet-stream\nContent-Transfer-Encoding: base64\n"
+                    b"Content-Disposition: attachment; filename=\"attachment.bin\"\n\n")
+            for _ in range(args.attachment_mb * 1024 * 1024 // 57000):
+                chunk = base64.b64encode(os.urandom(57000))
+                f.write(b"\n".join(chunk[i:i + 76] for i in range(0, len(chunk), 76)) + b"\n")
+            f.write(b"--MIXED--\n")
+        file_mb = os.path.getsize(eml_path) / (1024 * 1024)
+
+        result_file = os.path.join(workdir, "result.json")
+        probe = _PARSE_MEMORY_PROBE.format(scripts_dir=current_dir, eml_path=eml_path, result_file=result_file)
+        completed = subprocess.run([sys.executable, "-c", probe], stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            print(f"❌ Разбор завершился ошибкой:\n{completed.stderr[-2000:]}")
+            return 1
+        with open(result_file, "r") as f:
+            measured = json.load(f)
+
+    print("\n" + "=" * 70)
+    print(f"📊 РАЗБОР ПИСЬМА С ВЛОЖЕНИЕМ {args.attachment_mb} МБ (файл {file_mb:.1f} МБ)")
+    print("=" * 70)
+    print(f"   Время: {measured['seconds']:.2f} с")
+    print(f"   Пик RSS: {measured['peak_mb']:.0f} МБ (до разбора {measured['baseline_mb']:.0f} МБ, "
+          f"прирост {measured['peak_mb'] - measured['baseline_mb']:.0f} МБ)")
+    print(f"   Текст: {measured['body_chars']} символов")
+    for attachment in measured["attachments"]:
+        print(f"   📎 {attachment['name']} ({attachment['content_type']}, {attachment['size']} байт)")
+    return 0
+
+
+def _percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def bench_service(args) -> int:
+    """Нагрузочный тест HTTP-сервиса (service.py): задержки p50/p95/p99 и RPS."""
+    import time
+    import urllib.error
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    url = args.url.rstrip("/")
+    deadline = time.time() + args.wait_ready
+    while True:
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=5) as response:
+                if response.status == 200:
+                    break
+        except (urllib.error.URLError, OSError):
+            pass
+        if time.time() >= deadline:
+            print(f"❌ Сервис {url} не готов за {args.wait_ready} с")
+            return 1
+        time.sleep(1)
+
+    bodies = []
+    for name in sorted(os.listdir(INPUT_FOLDER)):
+        if name.endswith((".eml", ".msg")):
+            with open(os.path.join(INPUT_FOLDER, name), "rb") as f:
+                bodies.append((name, f.read()))
+    if not bodies:
+        print("❌ Нет писем для отправки")
+        return 1
+
+    def send(i: int):
+        name, body = bodies[i % len(bodies)]
+        request = urllib.request.Request(f"{url}/classify?filename={urllib.request.quote(name)}", data=body,
+                                         headers={"Content-Type": "message/rfc822"}, method="POST")
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=args.timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    print(f"🔬 {args.requests} запросов, {args.concurrency} одновременно → {url}/classify")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        outcomes = list(executor.map(send, range(args.requests)))
+    seconds = time.perf_counter() - started
+
+    latencies = [latency * 1000 for latency, ok in outcomes if ok]
+    errors = sum(1 for _, ok in outcomes if not ok)
+    report = {
+        "url": url,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "seconds": seconds,
+        "rps": len(latencies) / seconds if seconds > 0 else 0.0,
+        "latency_ms": {f"p{p}": _percentile(latencies, p) for p in (50, 95, 99)},
+    }
+    try:
+        with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+            report["service_stats"] = json.loads(response.read())
+    except (urllib.error.URLError, OSError, ValueError):
+        pass
+
+    print("\n" + "=" * 70)
+    print("📊 НАГРУЗОЧНЫЙ ТЕСТ СЕРВИСА")
+    print("=" * 70)
+    print(f"   • RPS: {report['rps']:.1f} (ошибок {errors})")
+    for name, value in report["latency_ms"].items():
+        print(f"   • {name}: {value:.1f} мс")
+    if "service_stats" in report:
+        print(f"   • Средний микробатч: {report['service_stats'].get('avg_batch', 0):.1f} писем")
+
+    os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+    report_file = os.path.join(OUTPUT_FOLDER, "service_loadtest.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Отчет сохранен: {report_file}")
+    return 0 if errors == 0 else 1
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Бенчмарки Mail Lens")
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import-time", help="Время импорта classifier")
+    import_parser.add_argument("--runs", type=int, default=5, help="Количество запусков")
+    import_parser.add_argument("--max-ms", type=float, default=300.0, help="Допустимая медиана, мс")
+    import_parser.set_defaults(func=bench_import_time)
+
+    quantization_parser = subparsers.add_parser("quantization", help="Сравнение fp32 и int8 моделей")
+    quantization_parser.add_argument("--limit", type=int, default=None, help="Сколько писем взять")
+    quantization_parser.set_defaults(func=bench_quantization)
+
+    backends_parser = subparsers.add_parser("backends", help="Точность и скорость бэкендов инференса")
+    backends_parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"],
+                                 help="Какие бэкенды сравнить")
+    backends_parser.add_argument("--limit", type=int, default=None, help="Сколько писем взять")
+    backends_parser.set_defaults(func=bench_backends)
+
+    pool_parser = subparsers.add_parser("pool", help="Масштабирование многопроцессного кодирования")
+    pool_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                             help="Количество воркеров для замеров")
+    pool_parser.add_argument("--torch-threads", type=int, default=1, help="Потоков torch на воркер")
+    pool_parser.add_argument("--chunk-size", type=int, default=64, help="Текстов в одной задаче")
+    pool_parser.add_argument("--min-texts", type=int, default=1000,
+                             help="Размножить корпус минимум до стольких текстов")
+    pool_parser.add_argument("--limit", type=int, default=None, help="Сколько писем взять")
+    pool_parser.set_defaults(func=bench_pool)
+
+    cascade_parser = subparsers.add_parser("cascade", help="Каскад ключевых слов: скорость и точность")
+    cascade_parser.add_argument("--margin", type=float, default=None,
+                                help="Порог отрыва лучшей категории (по умолчанию KEYWORD_MARGIN)")
+    cascade_parser.add_argument("--min-score", type=int, default=None,
+                                help="Минимальный вес совпадений (по умолчанию KEYWORD_MIN_SCORE)")
+    cascade_parser.add_argument("--limit", type=int, default=None, help="Сколько писем взять")
+    cascade_parser.set_defaults(func=bench_cascade)
+
+    stream_parser = subparsers.add_parser("stream", help="Пиковая память потокового режима")
+    stream_parser.add_argument("--counts", type=int, nargs="+", default=[1000, 100000],
+                               help="Размеры корпуса (data_input дополняется синтетическими письмами)")
+    stream_parser.add_argument("--modes", nargs="+", choices=["stream", "staged", "list"], default=["stream", "list"],
+                               help="Режимы: потоковый, конвейер и со списком всех писем")
+    stream_parser.add_argument("--chunk-size", type=int, default=512, help="Писем в порции потокового режима")
+    stream_parser.set_defaults(func=bench_stream)
+
+    parse_parser = subparsers.add_parser("parse", help="Скорость разбора .eml: до и после")
+    parse_parser.add_argument("--runs", type=int, default=3, help="Количество прогонов")
+    parse_parser.add_argument("--modes", nargs="+", choices=["legacy", "bytes"], default=["legacy", "bytes"],
+                              help="Режимы: прежний текстовый разбор и разбор байтов")
+    parse_parser.set_defaults(func=bench_parse)
+
+    parse_memory_parser = subparsers.add_parser("parse-memory", help="Память разбора письма с большим вложением")
+    parse_memory_parser.add_argument("--attachment-mb", type=int, default=50, help="Размер вложения, МБ")
+    parse_memory_parser.set_defaults(func=bench_parse_memory)
+
+    service_parser = subparsers.add_parser("service", help="Нагрузочный тест HTTP-сервиса")
+    service_parser.add_argument("--url", default="http://127.0.0.1:8765", help="Адрес сервиса")
+    service_parser.add_argument("--concurrency", type=int, default=16, help="Одновременных запросов")
+    service_parser.add_argument("--requests", type=int, default=1000, help="Всего запросов")
+    service_parser.add_argument("--timeout", type=float, default=60.0, help="Таймаут запроса, с")
+    service_parser.add_argument("--wait-ready", type=float, default=300.0,
+                                help="Сколько ждать готовности сервиса, с")
+    service_parser.set_defaults(func=bench_service)
+
+    args = arg_parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+category_cache.py - Кэш категорий и их эмбеддингов.
+
+Категории и эмбеддинги вычисляются один раз на отпечаток
+(содержимое new_cats.txt, английские ключевые слова, модель) и держатся в памяти.
+На диске в model_cache/category_embeddings хранится эмбеддинг каждого описания
+под его собственным хэшем, поэтому при правке одной строки файла категорий
+перекодируется только эта категория.
+"""
+
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+
+from utils import load_categories, ENGLISH_KEYWORDS
+
+# === КОНФИГУРАЦИЯ ===
+CATEGORY_CACHE_SUBDIR = "category_embeddings"
+MAX_STORED_DESCRIPTIONS = 1000  # Сколько описаний (включая старые версии) хранить на диске
+
+_loaded = {}  # отпечаток -> (категории, эмбеддинги)
+
+
+def categories_fingerprint(categories_file: str, model_name: str, max_seq_length: int) -> str:
+    """Отпечаток набора категорий: хэш файла, английских ключевых слов и модели."""
+    digest = hashlib.sha256()
+    with open(categories_file, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps(ENGLISH_KEYWORDS, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    digest.update(f"\0{model_name}\0{max_seq_length}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def description_key(description: str, model_name: str, max_seq_length: int) -> str:
+    """Ключ эмбеддинга одного описания категории."""
+    text = f"{model_name}\0{max_seq_length}\0{description}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _store_path(cache_root: str, model_name: str, max_seq_length: int) -> str:
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    return os.path.join(cache_root, CATEGORY_CACHE_SUBDIR, f"{slug}_{max_seq_length}.npz")
+
+
+def _read_store(path: str) -> Dict[str, np.ndarray]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {str(key): vector for key, vector in zip(data['keys'], data['vectors'])}
+    except Exception as e:
+        print(f"⚠️  Не удалось прочитать кэш эмбеддингов категорий: {e}")
+        return {}
+
+
+def _write_store(path: str, stored: Dict[str, np.ndarray], current_keys: List[str]):
+    # Текущие описания храним всегда, старые версии - пока есть место
+    keys = list(dict.fromkeys(current_keys))
+    current = set(keys)
+    keys += [key for key in stored if key not in current][:max(0, MAX_STORED_DESCRIPTIONS - len(keys))]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, keys=np.array(keys), vectors=np.stack([stored[key] for key in keys]))
+    os.replace(tmp_path, path)
+
+
+def load_categories_cached(categories_file: str, model_name: str, max_seq_length: int) -> Tuple[str, dict]:
+    """
+    Загружает категории, переиспользуя уже разобранный файл с тем же отпечатком.
+    :return: (отпечаток, словарь категорий)
+    """
+    fingerprint = categories_fingerprint(categories_file, model_name, max_seq_length)
+    if fingerprint in _loaded:
+        return fingerprint, _loaded[fingerprint][0]
+    return fingerprint, load_categories(categories_file)
+
+
+def get_category_embeddings(fingerprint: str, categories: dict, model, model_name: str,
+                            cache_root: str, log=print) -> torch.Tensor:
+    """
+    Возвращает эмбеддинги описаний категорий (C x D).
+    Из памяти - если отпечаток уже встречался, иначе с диска; кодируются только
+    описания, которых еще нет в кэше. Сообщения о ходе работы идут через log.
+    """
+    if fingerprint in _loaded:
+        log("✅ Эмбеддинги категорий взяты из памяти")
+        return _loaded[fingerprint][1]
+
+    max_seq_length = model.max_seq_length
+    descriptions = list(categories.values())
+    keys = [description_key(description, model_name, max_seq_length) for description in descriptions]
+
+    path = _store_path(cache_root, model_name, max_seq_length)
+    stored = _read_store(path)
+    missing = [i for i, key in enumerate(keys) if key not in stored]
+
+    if missing:
+        log(f"🔧 Кодируем категорий: {len(missing)} из {len(keys)}")
+        encoded = model.encode([descriptions[i] for i in missing], convert_to_numpy=True,
+                               show_progress_bar=False)
+        for i, vector in zip(missing, encoded):
+            stored[keys[i]] = np.asarray(vector, dtype=np.float32)
+        try:
+            _write_store(path, stored, keys)
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить кэш эмбеддингов категорий: {e}")
+    else:
+        log(f"✅ Эмбеддинги категорий загружены из кэша: {path}")
+
+    embeddings = torch.from_numpy(np.stack([stored[key] for key in keys])).to(model.device)
+    _loaded[fingerprint] = (categories, embeddings)
+    return embeddings
@@ -1,72 +1,74 @@
-from sentence_transformers import SentenceTransformer, util
-from utils import load_categories, decode_subject
-import torch
-import numpy as np
 import os
 
+from utils import load_categories, decode_subject
+from batching import merge_encoding_stats, new_encoding_stats, print_encoding_stats
+from model_provider import MODEL_CACHE_DIR, PROJECT_ROOT, get_model, get_model_name, get_model_id, warm_up
+from header_rules import HEADER_RULES_ENABLED
+from domain_prior import DOMAIN_PRIOR_ENABLED
+from near_duplicates import NEAR_DUP_ENABLED
+
+# Тяжелые зависимости (torch, sentence_transformers, numpy) импортируются внутри функций,
+# а модель загружается при первом инференсе, чтобы импорт модуля был быстрым.
+
 # === КОНФИГУРАЦИЯ ===
 OTHER_CATEGORY_NAME = "Другое"  # Исключительная категория
 OTHER_CATEGORY_THRESHOLD = 0.6  # Порог
 MIN_CONFIDENCE_FOR_DISPLAY = 0.45  # Минимальная уверенность для нормального отображения
+ENCODE_BATCH_SIZE = 32  # Максимум писем в одном батче кодирования
+ENCODE_TOKEN_BUDGET = 8192  # Максимум токенов (с паддингом) в одном батче
+SCHEDULING_WINDOW = 1024  # Сколько писем планировщик раскладывает по батчам за раз
+EMBEDDING_CACHE_ENABLED = True  # Персистентный кэш эмбеддингов писем в model_cache/embeddings
+EMBEDDING_CACHE_MAX_MB = 512  # Лимит размера кэша эмбеддингов
+TOKEN_BUDGET_PREPROCESSING = True  # Обрезать текст по токенам модели, а не по символам
+PREPROCESS_MAX_CHARS = 4000  # Обрезка по символам, если TOKEN_BUDGET_PREPROCESSING выключен
+LONG_EMAIL_MODE = "truncate"  # "truncate" - одно окно, "windows" - несколько окон с пулингом
+MAX_WINDOWS_PER_EMAIL = 4  # Максимум окон на письмо в режиме "windows"
+WINDOW_POOLING = "mean"  # Пулинг эмбеддингов окон: "mean" или "max"
+KEYWORD_CASCADE_ENABLED = True  # Однозначные письма решаются ключевыми словами без модели (keyword_stage)
+
+
+def classification_settings() -> dict:
+    """
+    Настройки, от которых зависит результат классификации (кроме модели и файлов
+    категорий/правил): предобработка, окна, пороги и ступени каскада.
+    Используется в отпечатке инкрементальных запусков (incremental.run_fingerprint).
+    """
+    import domain_prior
+    import keyword_stage
+    import mime_reader
+    import near_duplicates
+
+    return {
+        'other_category': [OTHER_CATEGORY_NAME, OTHER_CATEGORY_THRESHOLD],
+        'preprocessing': {'token_budget': TOKEN_BUDGET_PREPROCESSING, 'max_chars': PREPROCESS_MAX_CHARS,
+                          'mime_text_budget': mime_reader.MIME_TEXT_BUDGET_CHARS,
+                          'mime_max_part_bytes': mime_reader.MIME_MAX_PART_BYTES,
+                          'mime_max_text_bytes': mime_reader.MIME_MAX_TEXT_BYTES},
+        'windows': [LONG_EMAIL_MODE, MAX_WINDOWS_PER_EMAIL, WINDOW_POOLING],
+        'keywords': [keyword_stage.KEYWORD_MIN_SCORE, keyword_stage.KEYWORD_MARGIN,
+                     keyword_stage.KEYWORD_SCAN_CHARS, keyword_stage.SUBJECT_WEIGHT,
+                     keyword_stage.KEYWORD_MAX_ENDING],
+        'domain_prior': [domain_prior.PRIOR_MODE, domain_prior.PRIOR_MIN_COUNT, domain_prior.PRIOR_MIN_SHARE],
+        'near_duplicates': [near_duplicates.NEAR_DUP_MAX_DISTANCE, near_duplicates.NEAR_DUP_SHINGLE_WORDS,
+                            near_duplicates.NEAR_DUP_MIN_SHINGLES, near_duplicates.NEAR_DUP_SCAN_CHARS],
+    }
 
-# === ПУТИ ===
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_CACHE_DIR = os.path.join(PROJECT_ROOT, 'model_cache')
-os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
-
-print(f"🤖 Кэш моделей: {MODEL_CACHE_DIR}")
 
-# === ЗАГРУЗКА МОДЕЛИ ===
-print("🤖 Загрузка модели Sentence Transformer...")
+def __getattr__(name):
+    """Обратная совместимость: classifier.model и classifier.model_name загружают модель лениво."""
+    if name == 'model':
+        return get_model()
+    if name == 'model_name':
+        return get_model_name()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-try:
-    model_name = 'sentence-transformers/paraphrase-multilingual-mpnet-base-v2'
-    model = SentenceTransformer(
-        model_name,
-        cache_folder=MODEL_CACHE_DIR,
-        device='cpu'
-    )
-    print(f"✅ Модель '{model_name}' загружена в {MODEL_CACHE_DIR}")
 
-except Exception as e:
-    print(f"⚠️ Ошибка загрузки основной модели: {e}")
-    try:
-        print("🔄 Пробуем упрощенную модель: paraphrase-multilingual-MiniLM-L12-v2")
-        model = SentenceTransformer(
-            'paraphrase-multilingual-MiniLM-L12-v2',
-            cache_folder=MODEL_CACHE_DIR,
-            device='cpu'
-        )
-        model_name = 'paraphrase-multilingual-MiniLM-L12-v2'
-        print("✅ Упрощенная модель загружена")
-    except Exception as e2:
-        print(f"⚠️ Ошибка загрузки упрощенной модели: {e2}")
-        try:
-            print("🔄 Пробуем легкую модель: all-MiniLM-L6-v2")
-            model = SentenceTransformer(
-                'all-MiniLM-L6-v2',
-                cache_folder=MODEL_CACHE_DIR,
-                device='cpu'
-            )
-            model_name = 'all-MiniLM-L6-v2'
-            print("✅ Легкая модель загружена")
-        except Exception as e3:
-            print(f"❌ Критическая ошибка: не удалось загрузить ни одну модель")
-            raise
-
-# === ИНФОРМАЦИЯ О ЗАГРУЖЕННОЙ МОДЕЛИ ===
-print(f"\n📊 Информация о модели:")
-print(f"   • Имя: {model_name}")
-print(f"   • Размерность эмбеддингов: {model.get_sentence_embedding_dimension()}")
-print(f"   • Макс. длина последовательности: {model.max_seq_length}")
-print(f"   • Поддерживаемые языки: мультиязычная (включая RU/EN)")
-print(f"\n⚙️  Логика категории '{OTHER_CATEGORY_NAME}':")
-print(f"   • Порог для '{OTHER_CATEGORY_NAME}': {OTHER_CATEGORY_THRESHOLD}")
-print(f"   • Если лучшая категория < {OTHER_CATEGORY_THRESHOLD} → '{OTHER_CATEGORY_NAME}'")
-
-
-def preprocess_text(text: str, subject: str = "") -> str:
-    """Очищает и предобрабатывает текст письма с учётом темы."""
+def preprocess_text(text: str, subject: str = "", max_length: int = 4000) -> str:
+    """
+    Очищает и предобрабатывает текст письма с учётом темы.
+    :param max_length: Ограничение длины в символах (None - без ограничения,
+                       когда текст дальше обрезается по токенам модели)
+    """
     if not text and not subject:
         return ""
 
@@ -83,8 +85,7 @@ def preprocess_text(text: str, subject: str = "") -> str:
     enhanced_text = ' '.join(enhanced_text.split())
 
     # Ограничиваем длину, но сохраняем важные части
-    max_length = 4000
-    if len(enhanced_text) > max_length:
+    if max_length and len(enhanced_text) > max_length:
         subject_part = f"{decoded_subject}. {decoded_subject}. {decoded_subject}."
         body_part = text[:max_length - len(subject_part) - 100]
         enhanced_text = subject_part + " " + body_part + "..."
@@ -92,8 +93,9 @@ def preprocess_text(text: str, subject: str = "") -> str:
     return enhanced_text
 
 
-def safe_encode_text(text: str, max_retries: int = 2) -> torch.Tensor:
+def safe_encode_text(text: str, max_retries: int = 2) -> "torch.Tensor":
     """Безопасное кодирование текста с обработкой ошибок."""
+    model = get_model()
     for attempt in range(max_retries):
         try:
             return model.encode(text, convert_to_tensor=True, show_progress_bar=False)
@@ -105,14 +107,461 @@ def safe_encode_text(text: str, max_retries: int = 2) -> torch.Tensor:
             text = text[:3000] + " [ТЕКСТ ОБРЕЗАН]"
 
 
-def classify_emails(emails: list, categories_file: str, top_n: int = 5, threshold: float = 0.1) -> list:
+def encode_texts(texts: list, batch_size: int = ENCODE_BATCH_SIZE,
+                 token_budget: int = ENCODE_TOKEN_BUDGET, stats: dict = None, window_ids: list = None) -> list:
+    """
+    Кодирует список текстов батчами, сгруппированными по длине в токенах.
+    Если настроен пул кодирования (encoding_pool), тексты кодируются в рабочих процессах.
+    :param batch_size: Максимум писем в одном батче
+    :param token_budget: Максимум токенов (с паддингом) в одном батче
+    :param stats: Словарь статистики кодирования для накопления (опционально)
+    :param window_ids: Id токенов текстов, уже токенизированных при нарезке (model_input_windows)
+    :return: Эмбеддинги в исходном порядке; None для текстов из упавших батчей
+    """
+    from batching import encode_bucketed
+    from encoding_pool import get_encoding_pool
+
+    pool = get_encoding_pool()
+    if pool is not None:
+        import torch
+
+        vectors, run_stats = pool.encode(texts, batch_size, token_budget, window_ids)
+        embeddings = [torch.from_numpy(vector) if vector is not None else None for vector in vectors]
+    else:
+        embeddings, run_stats = encode_bucketed(get_model(), texts, token_budget, batch_size, window_ids)
+    if stats is not None:
+        merge_encoding_stats(stats, run_stats)
+    return embeddings
+
+
+def safe_encode_batch(texts: list, batch_size: int = ENCODE_BATCH_SIZE,
+                      token_budget: int = ENCODE_TOKEN_BUDGET, stats: dict = None, window_ids: list = None) -> list:
+    """
+    Кодирует батч текстов с изоляцией ошибок.
+    Тексты из батчей, которые не удалось закодировать, кодируются по одному,
+    чтобы одно плохое письмо не ломало весь батч.
+    :return: Список той же длины: эмбеддинг или исключение для каждого текста
+    """
+    try:
+        encoded = encode_texts(texts, batch_size, token_budget, stats, window_ids)
+    except Exception as e:
+        print(f"⚠️  Ошибка батчевого кодирования ({len(texts)} писем): {e}")
+        encoded = [None] * len(texts)
+
+    failed = [i for i, emb in enumerate(encoded) if emb is None]
+    if failed:
+        print(f"🔄 Кодируем по одному писем: {len(failed)}")
+    for i in failed:
+        try:
+            encoded[i] = safe_encode_text(texts[i])
+        except Exception as e:
+            encoded[i] = e
+    return encoded
+
+
+def open_embedding_cache(log=print):
+    """Открывает кэш эмбеддингов текущей модели. При ошибке возвращает None."""
+    try:
+        from embedding_cache import get_embedding_cache
+
+        model = get_model()
+        return get_embedding_cache(MODEL_CACHE_DIR, get_model_id(), model.max_seq_length,
+                                   model.get_sentence_embedding_dimension(), EMBEDDING_CACHE_MAX_MB, log)
+    except Exception as e:
+        print(f"⚠️  Кэш эмбеддингов недоступен: {e}")
+        return None
+
+
+def encode_with_cache(texts: list, batch_size: int = ENCODE_BATCH_SIZE,
+                      token_budget: int = ENCODE_TOKEN_BUDGET, stats: dict = None, cache=None,
+                      window_ids: list = None) -> list:
+    """
+    Кодирует тексты с дедупликацией и кэшем эмбеддингов.
+    Одинаковые тексты кодируются один раз, уже известные берутся из кэша.
+    :param window_ids: Id токенов текстов из model_input_windows (None - тексты токенизируются)
+    :return: Список той же длины: эмбеддинг или исключение для каждого текста
+    """
+    import torch
+
+    positions = {}  # текст -> позиции во входном списке
+    for i, text in enumerate(texts):
+        positions.setdefault(text, []).append(i)
+    unique_texts = list(positions)
+    if stats is not None:
+        stats['deduplicated'] = stats.get('deduplicated', 0) + len(texts) - len(unique_texts)
+
+    keys = [cache.key_for(text) for text in unique_texts] if cache else []
+    unique_encoded = [None] * len(unique_texts)
+    if cache:
+        try:
+            for j, vector in enumerate(cache.get_many(keys)):
+                if vector is not None:
+                    unique_encoded[j] = torch.from_numpy(vector)
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать кэш эмбеддингов: {e}")
+
+    to_encode = [j for j, emb in enumerate(unique_encoded) if emb is None]
+    if to_encode:
+        fresh_ids = [window_ids[positions[unique_texts[j]][0]] for j in to_encode] if window_ids is not None else None
+        fresh = safe_encode_batch([unique_texts[j] for j in to_encode], batch_size, token_budget, stats, fresh_ids)
+        for j, emb in zip(to_encode, fresh):
+            unique_encoded[j] = emb
+
+        if cache:
+            stored = [(keys[j], emb) for j, emb in zip(to_encode, fresh) if not isinstance(emb, Exception)]
+            if stored:
+                try:
+                    cache.put_many([key for key, _ in stored],
+                                   torch.stack([emb for _, emb in stored]).float().cpu().numpy())
+                except Exception as e:
+                    print(f"⚠️  Не удалось записать эмбеддинги в кэш: {e}")
+
+    encoded = [None] * len(texts)
+    for text, emb in zip(unique_texts, unique_encoded):
+        for i in positions[text]:
+            encoded[i] = emb
+    return encoded
+
+
+def rank_categories(similarities, category_names: list, top_n: int = 5, threshold: float = 0.1) -> list:
+    """
+    Превращает строку косинусных сходств в отсортированный список (категория, уверенность).
+    Сходства нормализуются в [0, 1], затем применяются порог и top_n (см. scoring.score_batch).
+    """
+    from scoring import score_batch
+
+    return score_batch(similarities, category_names, top_n, threshold).category_scores(0)
+
+
+def model_input_windows(processed_text: str) -> list:
+    """
+    Тексты, которые реально увидит модель: текст, обрезанный по бюджету токенов,
+    или несколько окон по токенам в режиме LONG_EMAIL_MODE = "windows", - вместе
+    с id их токенов (без служебных), чтобы при кодировании текст не токенизировался второй раз.
+    :return: Список (текст окна, id токенов или None)
+    """
+    if not TOKEN_BUDGET_PREPROCESSING:
+        return [(processed_text, None)]
+
+    from token_windows import split_token_windows_with_ids
+
+    model = get_model()
+    tokenizer = model.tokenizer
+    window_tokens = model.max_seq_length - tokenizer.num_special_tokens_to_add()
+    max_windows = MAX_WINDOWS_PER_EMAIL if LONG_EMAIL_MODE == "windows" else 1
+    try:
+        return split_token_windows_with_ids(processed_text, tokenizer, window_tokens, max_windows)
+    except Exception as e:
+        print(f"⚠️  Ошибка нарезки текста по токенам: {e}")
+        return [(processed_text, None)]
+
+
+def _silent(*args, **kwargs):
+    pass
+
+
+def _prepare_email(email: dict, index: int, total: int, log=print):
+    """
+    Предобрабатывает одно письмо перед кодированием.
+    :return: (email_result, processed_text, decoded_subject); processed_text = None,
+             если письмо пустое и уже получило итоговый результат
+    """
+    filename = email.get("filename", f"email_{index}")
+    email_result = {
+        "filename": filename,
+        "subject": email.get("subject", ""),
+        "processed": False,
+        "categories": [],
+        "error": None
+    }
+
+    log(f"\n📨 Обработка {index}/{total}: {filename}")
+
+    subject = email.get("subject", "")
+    body = email.get("body", "")
+
+    # Проверяем наличие текста
+    if not body and not subject:
+        log(f"⚠️  Письмо пустое, пропускаем")
+        email_result.update({
+            "subject_decoded": "",
+            "body_preview": "",
+            "categories": [("Пустое письмо", 0.0)],
+            "error": "Пустое письмо"
+        })
+        return email_result, None, ""
+
+    # Усиливаем текст с помощью темы
+    try:
+        max_length = None if TOKEN_BUDGET_PREPROCESSING else PREPROCESS_MAX_CHARS
+        processed_text = preprocess_text(body, subject, max_length=max_length)
+        decoded_subject = decode_subject(subject) if subject else ""
+    except Exception as e:
+        print(f"⚠️  Ошибка предобработки текста: {e}")
+        # Пробуем использовать сырой текст
+        processed_text = body[:2000] if body else subject
+        decoded_subject = subject[:100] if subject else ""
+
+    log(f"📝 Текст: {len(processed_text)} символов")
+    if decoded_subject:
+        log(f"📄 Тема (декодирована): {decoded_subject[:100]}...")
+
+    if not processed_text.strip():
+        log(f"⚠️  Письмо пустое после предобработки")
+        email_result.update({
+            "subject_decoded": decoded_subject,
+            "body_preview": "",
+            "categories": [("Пустое письмо", 0.0)],
+            "error": "Пустое письмо после предобработки"
+        })
+        return email_result, None, decoded_subject
+
+    return email_result, processed_text, decoded_subject
+
+
+def _finalize_email_result(email_result: dict, category_scores: list, is_other: bool, processed_text: str,
+                           decoded_subject: str, threshold: float, stats: dict, log=print):
+    """
+    Заполняет результат письма.
+    :param is_other: Письмо уходит в категорию "ДРУГОЕ" (решение векторизованного скоринга)
+    """
+    log(f"\n📨 {email_result['filename']}")
+
+    stats['total'] += 1
+    stats['successful'] += 1
+
+    if category_scores:
+        best_category, best_confidence = category_scores[0]
+        stats['confidences'].append(best_confidence)
+
+        # Применяем логику с категорией "ДРУГОЕ"
+        if is_other:
+            # Письмо идет в категорию "ДРУГОЕ"
+            final_category_scores = [(OTHER_CATEGORY_NAME, best_confidence)]
+            stats['to_other'] += 1
+
+            if best_confidence < MIN_CONFIDENCE_FOR_DISPLAY:
+                quality_note = " (ОЧЕНЬ НИЗКАЯ УВЕРЕННОСТЬ)"
+            else:
+                quality_note = ""
+
+            log(f"🏷️  Категория: {OTHER_CATEGORY_NAME} ({best_confidence:.3f}){quality_note}")
+            if best_confidence > 0.1:  # Показываем только если была какая-то уверенность
+                log(f"   ⚠️  Исходная лучшая категория: '{best_category}' с уверенностью {best_confidence:.3f}")
+        else:
+            # Оставляем оригинальные категории
+            final_category_scores = category_scores
+            top_cat, top_score = category_scores[0]
+            log(f"🏷️  Топ категория: {top_cat} ({top_score:.3f})")
+
+            # Показываем дополнительные категории если они есть
+            if len(category_scores) > 1:
+                for j, (cat, score) in enumerate(category_scores[1:3], 2):
+                    if score > threshold:
+                        log(f"   {j}. {cat} ({score:.3f})")
+    else:
+        # Если нет категорий выше порога threshold
+        final_category_scores = [(OTHER_CATEGORY_NAME, 0.0)]
+        stats['to_other'] += 1
+        log(f"🏷️  Категория: {OTHER_CATEGORY_NAME} (0.000)")
+        log(f"   ⚠️  Нет категорий выше порога {threshold}")
+
+    confidence_score = final_category_scores[0][1] if final_category_scores else 0.0
+
+    email_result.update({
+        "subject_decoded": decoded_subject,
+        "body_preview": processed_text[:300],
+        "categories": final_category_scores,
+        "processed": True,
+        "confidence": confidence_score,
+        "is_other_category": (final_category_scores[0][0] == OTHER_CATEGORY_NAME if final_category_scores else False),
+        "decided_by": "model"
+    })
+
+
+def _safe_decode_subject(subject: str) -> str:
+    try:
+        return decode_subject(subject) if subject else ""
+    except Exception:
+        return subject[:100] if subject else ""
+
+
+def _direct_result(email: dict, category: str, confidence: float, decided_by: str,
+                   index: int, stats: dict) -> dict:
+    """Результат письма, решенного до предобработки и модели (правилом или по домену)."""
+    stats['total'] += 1
+    stats['successful'] += 1
+    if category == OTHER_CATEGORY_NAME:
+        stats['to_other'] += 1
+
+    subject = email.get("subject", "")
+    body = email.get("body", "")
+    return {
+        "filename": email.get("filename", f"email_{index}"),
+        "subject": subject,
+        "subject_decoded": _safe_decode_subject(subject),
+        "body_preview": body[:300] if body else "",
+        "categories": [(category, confidence)],
+        "processed": True,
+        "error": None,
+        "confidence": confidence,
+        "is_other_category": category == OTHER_CATEGORY_NAME,
+        "decided_by": decided_by
+    }
+
+
+def _rule_result(email: dict, rule: dict, index: int, total: int, stats: dict, log=print) -> dict:
+    """Результат письма, решенного правилом по заголовкам (без предобработки и модели)."""
+    log(f"\n📨 Обработка {index}/{total}: {email.get('filename', f'email_{index}')}")
+    log(f"📮 Правило по заголовкам '{rule['name']}': {rule['category']}")
+    stats['by_header_rules'] += 1
+    email_result = _direct_result(email, rule['category'], 1.0, "header_rule", index, stats)
+    email_result["rule"] = rule['name']
+    return email_result
+
+
+def _header_rule_stage(email: dict, rules, category_names: list) -> tuple:
+    """
+    Ступень 0: правило по заголовкам. Правило с категорией, которой нет в файле
+    категорий, отклоняется; тогда тело, которое парсер из-за правила не декодировал,
+    дочитывается, чтобы следующие ступени и модель видели письмо целиком.
+    :return: (правило или None, письмо)
+    """
+    headers = email.get("headers") or {}
+    rule = None
+    if rules is not None and headers:
+        rule = email.get("header_rule") or rules.match(headers)
+        if rule and rule['category'] not in category_names and rule['category'] != OTHER_CATEGORY_NAME:
+            rule = None
+    if not rule and email.get("body_source") is not None:
+        from parser import read_skipped_body
+        email = read_skipped_body(email)
+    return rule, email
+
+
+def _prior_confirmed(category: str, email: dict, matcher) -> bool:
+    """
+    Дешевая проверка категории домена ключевыми словами: категория отклоняется,
+    только если ключевые слова уверенно указывают на другую.
+    """
+    from keyword_stage import KEYWORD_MIN_SCORE
+
+    scores = matcher.score(_safe_decode_subject(email.get("subject", "")), email.get("body", ""))
+    if not scores:
+        return True
+    best = max(scores, key=scores.get)
+    return best == category or scores[best] < KEYWORD_MIN_SCORE
+
+
+def _finalize_keyword_result(email_result: dict, category_scores: list, processed_text: str,
+                             decoded_subject: str, top_n: int, stats: dict, log=print):
+    """Заполняет результат письма, решенного ключевыми словами (без модели)."""
+    top_cat, top_score = category_scores[0]
+    log(f"🔑 Решено ключевыми словами: {top_cat} ({top_score:.3f})")
+
+    stats['total'] += 1
+    stats['successful'] += 1
+    stats['by_keywords'] += 1
+
+    email_result.update({
+        "subject_decoded": decoded_subject,
+        "body_preview": processed_text[:300],
+        "categories": category_scores[:top_n],
+        "processed": True,
+        "confidence": top_score,
+        "is_other_category": False,
+        "decided_by": "keywords"
+    })
+
+
+def _finalize_reused_result(email_result: dict, entry: dict, processed_text: str,
+                            decoded_subject: str, stats: dict, log=print):
+    """Заполняет результат письма классификацией его почти точной копии."""
+    category_scores = list(entry['categories'])
+    log(f"🧬 {email_result['filename']}: как {entry['filename']} → {category_scores[0][0]}")
+
+    stats['total'] += 1
+    stats['successful'] += 1
+    stats['by_near_duplicate'] += 1
+    if entry['is_other']:
+        stats['to_other'] += 1
+
+    email_result.update({
+        "subject_decoded": decoded_subject,
+        "body_preview": processed_text[:300],
+        "categories": category_scores,
+        "processed": True,
+        "confidence": entry['confidence'],
+        "is_other_category": entry['is_other'],
+        "decided_by": "near_duplicate",
+        "reused": True,
+        "reused_from": entry['filename']
+    })
+
+
+def _mark_classification_error(email_result: dict, error: Exception, processed_text: str,
+                               decoded_subject: str, stats: dict):
+    """Заполняет результат письма, которое не удалось классифицировать."""
+    print(f"❌ Ошибка при классификации письма {email_result['filename']}: {error}")
+    stats['errors'] += 1
+    email_result.update({
+        "subject_decoded": decoded_subject,
+        "body_preview": processed_text[:100] if processed_text else "",
+        "categories": [("Ошибка классификации", 0.0)],
+        "error": f"Ошибка классификации: {str(error)[:100]}"
+    })
+
+
+def classify_emails(emails: list, categories_file: str, top_n: int = 5, threshold: float = 0.1,
+                    batch_size: int = ENCODE_BATCH_SIZE, token_budget: int = ENCODE_TOKEN_BUDGET,
+                    use_cache: bool = EMBEDDING_CACHE_ENABLED, workers: int = None,
+                    cascade: bool = KEYWORD_CASCADE_ENABLED, header_rules: bool = HEADER_RULES_ENABLED,
+                    domain_prior: bool = DOMAIN_PRIOR_ENABLED, near_duplicates: bool = NEAR_DUP_ENABLED,
+                    verbose: bool = True) -> list:
     """
     Классифицирует список писем по категориям.
+    Письма, для которых сработало правило по заголовкам, решаются сразу,
+    письма частых отправителей - по выученной гистограмме категорий домена,
+    почти точные копии уже классифицированных писем получают их результат.
+    Остальные предобрабатываются, однозначные решаются ключевыми словами,
+    остальные кодируются батчами близкой длины и сравниваются с эмбеддингами
+    категорий одним матричным произведением.
     :param threshold: Порог для фильтрации низких сходств
+    :param batch_size: Максимум писем в одном батче кодирования
+    :param token_budget: Максимум токенов (с паддингом) в одном батче кодирования
+    :param use_cache: Брать эмбеддинги уже виденных текстов из кэша в model_cache
+    :param workers: Количество процессов кодирования (None - как настроено в encoding_pool)
+    :param cascade: Решать письма с однозначными ключевыми словами без модели
+    :param header_rules: Решать письма правилами по заголовкам и отправителю (header_rules.py)
+    :param domain_prior: Решать письма уверенных доменов по гистограмме (domain_prior.py)
+    :param near_duplicates: Переиспользовать классификацию почти одинаковых писем (near_duplicates.py)
+    :param verbose: Выводить ход обработки и статистику (ошибки выводятся всегда)
     """
+    import torch
+    from category_cache import load_categories_cached, get_category_embeddings
+    from embedding_cache import print_cache_stats
+    from encoding_pool import configure_encoding_pool
+    from keyword_stage import KEYWORD_MARGIN, get_keyword_matcher
+    from header_rules import get_header_rules
+    from domain_prior import PRIOR_MODE, get_domain_prior, print_prior_stats, registered_domain
+    from token_windows import pool_window_embeddings
+    from scoring import cosine_matrix, normalize_rows, score_batch
+    from near_duplicates import get_near_duplicate_index, print_cluster_report, simhash
+
+    if workers is not None:
+        configure_encoding_pool(workers=workers)
+
+    model = get_model()
+    model_id = get_model_id()
+    log = print if verbose else _silent
+
+    log(f"\n⚙️  Логика категории '{OTHER_CATEGORY_NAME}':")
+    log(f"   • Порог для '{OTHER_CATEGORY_NAME}': {OTHER_CATEGORY_THRESHOLD}")
+    log(f"   • Если лучшая категория < {OTHER_CATEGORY_THRESHOLD} → '{OTHER_CATEGORY_NAME}'")
+
     try:
-        categories = load_categories(categories_file)
-        print(f"📂 Загружено категорий: {len(categories)}")
+        fingerprint, categories = load_categories_cached(categories_file, model_id, model.max_seq_length)
+        log(f"📂 Загружено категорий: {len(categories)}")
 
         if not categories:
             print("❌ Файл категорий пуст!")
@@ -125,176 +574,294 @@ def classify_emails(emails: list, categories_file: str, top_n: int = 5, threshol
     results = []
 
     # Подготавливаем эмбеддинги категорий один раз
-    print("🔧 Подготовка эмбеддингов категорий...")
+    log("🔧 Подготовка эмбеддингов категорий...")
     try:
         category_names = list(categories.keys())
-        category_descriptions = list(categories.values())
-        category_embeddings = model.encode(category_descriptions, convert_to_tensor=True)
-        print(f"✅ Эмбеддинги категорий подготовлены: {len(category_names)}")
+        category_embeddings = get_category_embeddings(fingerprint, categories, model, model_id, MODEL_CACHE_DIR, log)
+        normalized_categories = normalize_rows(category_embeddings)
+        log(f"✅ Эмбеддинги категорий подготовлены: {len(category_names)}")
     except Exception as e:
         print(f"❌ Ошибка подготовки эмбеддингов категорий: {e}")
         return results
 
+    rules = None
+    if header_rules:
+        try:
+            rules = get_header_rules()
+            log(f"📮 Правил по заголовкам: {len(rules.rules)}")
+            unknown = {rule.category for rule in rules.rules} - set(category_names) - {OTHER_CATEGORY_NAME}
+            if unknown:
+                print(f"⚠️  Правила ссылаются на неизвестные категории, они игнорируются: {', '.join(sorted(unknown))}")
+        except Exception as e:
+            print(f"⚠️  Правила по заголовкам недоступны: {e}")
+
+    prior = None
+    if domain_prior:
+        try:
+            prior = get_domain_prior(MODEL_CACHE_DIR)
+            prior.reset_stats()
+            log(f"🌐 Гистограммы доменов: {len(prior.domains)} доменов (режим {PRIOR_MODE})")
+        except Exception as e:
+            print(f"⚠️  Гистограммы доменов недоступны: {e}")
+
+    dup_index = None
+    if near_duplicates:
+        try:
+            dup_index = get_near_duplicate_index(MODEL_CACHE_DIR, fingerprint)
+            dup_index.reset_stats()
+            log(f"🧬 Индекс почти одинаковых писем: {len(dup_index.entries)} кластеров")
+        except Exception as e:
+            print(f"⚠️  Индекс почти одинаковых писем недоступен: {e}")
+
+    # Ключевые слова нужны и для каскада, и для проверки категории домена
+    matcher = None
+    if cascade or (prior is not None and PRIOR_MODE == "verify"):
+        try:
+            matcher = get_keyword_matcher(categories_file)
+            if cascade:
+                log(f"🔑 Каскад: ключевых слов {len(matcher.categories)}, порог отрыва {KEYWORD_MARGIN}")
+        except Exception as e:
+            print(f"⚠️  Ключевые слова недоступны: {e}")
+
     # Статистика
     stats = {
         'total': 0,
         'successful': 0,
         'to_other': 0,
         'errors': 0,
-        'confidences': []
+        'by_header_rules': 0,
+        'by_domain_prior': 0,
+        'by_near_duplicate': 0,
+        'by_keywords': 0,
+        'confidences': []  # Лучшее сходство писем, решенных моделью
     }
 
+    # Этап 1: предобработка всех писем
+    pending = []  # (email_result, processed_text, decoded_subject, model_windows)
+    sender_domains = []  # Зарегистрированный домен отправителя для каждого результата
+    dup_leaders = []  # (кластер, результат первого письма кластера), которое идет в модель
+    dup_followers = {}  # кластер -> близнецы из этого запуска, ждущие результат первого письма
     for i, email in enumerate(emails, 1):
-        email_result = {
-            "filename": email.get("filename", f"email_{i}"),
-            "subject": email.get("subject", ""),
-            "processed": False,
-            "categories": [],
-            "error": None
-        }
-        
-        try:
-            filename = email.get("filename", f"email_{i}")
-            print(f"\n📨 Обработка {i}/{len(emails)}: {filename}")
-
-            subject = email.get("subject", "")
-            body = email.get("body", "")
-
-            # Проверяем наличие текста
-            if not body and not subject:
-                print(f"⚠️  Письмо пустое, пропускаем")
-                email_result.update({
-                    "subject_decoded": "",
-                    "body_preview": "",
-                    "categories": [("Пустое письмо", 0.0)],
-                    "error": "Пустое письмо"
-                })
-                results.append(email_result)
-                continue
-
-            # Усиливаем текст с помощью темы
+        headers = (email.get("headers") or {}) if isinstance(email, dict) else {}
+        sender_domain = registered_domain(headers.get("from_domain", "")) if prior is not None else ""
+        sender_domains.append(sender_domain)
+
+        # Ступень 0: правило по заголовкам (парсер уже мог не декодировать тело такого письма)
+        rule = None
+        if isinstance(email, dict):
+            rule, email = _header_rule_stage(email, rules, category_names)
+        if rule:
+            results.append(_rule_result(email, rule, i, len(emails), stats, log))
+            continue
+
+        # Ступень 1: уверенная категория домена отправителя
+        known = prior.lookup(sender_domain) if prior is not None and sender_domain else None
+        if known and known[0] not in category_names and known[0] != OTHER_CATEGORY_NAME:
+            known = None
+        if known and PRIOR_MODE == "verify" and matcher is not None:
             try:
-                processed_text = preprocess_text(body, subject)
-                decoded_subject = decode_subject(subject) if subject else ""
+                if not _prior_confirmed(known[0], email, matcher):
+                    prior.stats['rejected'] += 1
+                    known = None
             except Exception as e:
-                print(f"⚠️  Ошибка предобработки текста: {e}")
-                # Пробуем использовать сырой текст
-                processed_text = body[:2000] if body else subject
-                decoded_subject = subject[:100] if subject else ""
-
-            print(f"📝 Текст: {len(processed_text)} символов")
-            if decoded_subject:
-                print(f"📄 Тема (декодирована): {decoded_subject[:100]}...")
-
-            if not processed_text.strip():
-                print(f"⚠️  Письмо пустое после предобработки")
-                email_result.update({
-                    "subject_decoded": decoded_subject,
-                    "body_preview": "",
-                    "categories": [("Пустое письмо", 0.0)],
-                    "error": "Пустое письмо после предобработки"
-                })
-                results.append(email_result)
-                continue
-
-            # Классификация
-            try:
-                category_scores = classify_text(
-                    processed_text,
-                    categories,
-                    category_embeddings,
-                    top_n,
-                    threshold
-                )
-                
-                stats['total'] += 1
-                stats['successful'] += 1
-
-                if category_scores:
-                    best_category, best_confidence = category_scores[0]
-                    stats['confidences'].append(best_confidence)
-                    
-                    # Применяем логику с категорией "ДРУГОЕ"
-                    if best_confidence < OTHER_CATEGORY_THRESHOLD:
-                        # Письмо идет в категорию "ДРУГОЕ"
-                        final_category_scores = [(OTHER_CATEGORY_NAME, best_confidence)]
-                        stats['to_other'] += 1
-                        
-                        if best_confidence < MIN_CONFIDENCE_FOR_DISPLAY:
-                            quality_note = " (ОЧЕНЬ НИЗКАЯ УВЕРЕННОСТЬ)"
-                        else:
-                            quality_note = ""
-                        
-                        print(f"🏷️  Категория: {OTHER_CATEGORY_NAME} ({best_confidence:.3f}){quality_note}")
-                        if best_confidence > 0.1:  # Показываем только если была какая-то уверенность
-                            print(f"   ⚠️  Исходная лучшая категория: '{best_category}' с уверенностью {best_confidence:.3f}")
-                    else:
-                        # Оставляем оригинальные категории
-                        final_category_scores = category_scores
-                        top_cat, top_score = category_scores[0]
-                        print(f"🏷️  Топ категория: {top_cat} ({top_score:.3f})")
-                        
-                        # Показываем дополнительные категории если они есть
-                        if len(category_scores) > 1:
-                            for j, (cat, score) in enumerate(category_scores[1:3], 2):
-                                if score > threshold:
-                                    print(f"   {j}. {cat} ({score:.3f})")
-                else:
-                    # Если нет категорий выше порога threshold
-                    final_category_scores = [(OTHER_CATEGORY_NAME, 0.0)]
-                    stats['to_other'] += 1
-                    print(f"🏷️  Категория: {OTHER_CATEGORY_NAME} (0.000)")
-                    print(f"   ⚠️  Нет категорий выше порога {threshold}")
-
-                confidence_score = final_category_scores[0][1] if final_category_scores else 0.0
-
-                email_result.update({
-                    "subject_decoded": decoded_subject,
-                    "body_preview": processed_text[:300],
-                    "categories": final_category_scores,
-                    "processed": True,
-                    "confidence": confidence_score,
-                    "is_other_category": (final_category_scores[0][0] == OTHER_CATEGORY_NAME if final_category_scores else False)
-                })
-
-            except Exception as e:
-                print(f"❌ Ошибка при классификации письма: {e}")
-                stats['errors'] += 1
-                email_result.update({
-                    "subject_decoded": decoded_subject,
-                    "body_preview": processed_text[:100] if processed_text else "",
-                    "categories": [("Ошибка классификации", 0.0)],
-                    "error": f"Ошибка классификации: {str(e)[:100]}"
-                })
+                print(f"⚠️  Ошибка проверки категории домена: {e}")
+                known = None
+        if known:
+            log(f"\n📨 Обработка {i}/{len(emails)}: {email.get('filename', f'email_{i}')}")
+            log(f"🌐 Домен {sender_domain}: {known[0]} ({known[1]:.3f})")
+            prior.stats['hits'] += 1
+            stats['by_domain_prior'] += 1
+            results.append(_direct_result(email, known[0], known[1], "domain_prior", i, stats))
+            continue
 
+        try:
+            email_result, processed_text, decoded_subject = _prepare_email(email, i, len(emails), log)
         except Exception as e:
             print(f"❌ Критическая ошибка при обработке письма: {e}")
             import traceback
             traceback.print_exc()
             stats['errors'] += 1
-            email_result["error"] = f"Критическая ошибка: {str(e)[:100]}"
+            email_result = {
+                "filename": email.get("filename", f"email_{i}") if isinstance(email, dict) else f"email_{i}",
+                "subject": email.get("subject", "") if isinstance(email, dict) else "",
+                "processed": False,
+                "categories": [],
+                "error": f"Критическая ошибка: {str(e)[:100]}"
+            }
+            processed_text = None
 
         results.append(email_result)
+        if processed_text is None:
+            continue
+
+        # Ступень 2: почти точная копия уже классифицированного письма
+        email_hash = None
+        if dup_index is not None:
+            try:
+                email_hash = simhash(email.get("body") or processed_text)
+                entry_id = dup_index.find(email_hash) if email_hash is not None else None
+            except Exception as e:
+                print(f"⚠️  Ошибка поиска почти одинаковых писем: {e}")
+                entry_id = None
+            if entry_id is not None:
+                dup_index.record_reuse(entry_id)
+                entry = dup_index.entries[entry_id]
+                if entry['categories']:
+                    _finalize_reused_result(email_result, entry, processed_text, decoded_subject, stats, log)
+                else:
+                    dup_followers.setdefault(entry_id, []).append((email_result, processed_text, decoded_subject))
+                continue
+
+        # Ступень 3: однозначные письма решаются ключевыми словами
+        decision = None
+        if cascade and matcher is not None:
+            try:
+                decision = matcher.decide(decoded_subject, email.get("body", ""))
+            except Exception as e:
+                print(f"⚠️  Ошибка поиска ключевых слов: {e}")
+        if decision:
+            _finalize_keyword_result(email_result, decision, processed_text, decoded_subject, top_n, stats, log)
+            if email_hash is not None:
+                dup_index.add(email_hash, email_result['filename'], email_result)
+            continue
+
+        if email_hash is not None:
+            dup_leaders.append((dup_index.add(email_hash, email_result['filename']), email_result))
+
+        model_windows = model_input_windows(processed_text)
+        if len(model_windows) > 1:
+            log(f"🪟 Окон по токенам: {len(model_windows)}")
+        pending.append((email_result, processed_text, decoded_subject, model_windows))
+
+    # Этап 2: батчевое кодирование и скоринг.
+    # Планировщик раскладывает окно писем по батчам близкой длины,
+    # затем всё окно скорится одним матричным произведением.
+    batch_size = max(1, int(batch_size))
+    encoding_stats = new_encoding_stats()
+    cache = open_embedding_cache(log) if use_cache else None
+    if cache:
+        cache.reset_stats()
+    log(f"\n🚀 Кодирование {len(pending)} писем (до {batch_size} писем / {token_budget} токенов в батче)...")
+
+    for start in range(0, len(pending), SCHEDULING_WINDOW):
+        batch = pending[start:start + SCHEDULING_WINDOW]
+
+        # Окна всех писем кодируются вместе, затем собираются в один эмбеддинг на письмо
+        window_texts, window_ids, owners = [], [], []
+        for j, (_, _, _, model_windows) in enumerate(batch):
+            for text, ids in model_windows:
+                window_texts.append(text)
+                window_ids.append(ids)
+            owners.extend([j] * len(model_windows))
+        encoded_windows = encode_with_cache(window_texts, batch_size, token_budget, encoding_stats, cache,
+                                            window_ids)
+        if len(window_texts) == len(batch):
+            encoded = encoded_windows
+        else:
+            encoded = pool_window_embeddings(encoded_windows, owners, len(batch), WINDOW_POOLING)
+            encoding_stats['windows'] = encoding_stats.get('windows', 0) + len(window_texts)
+
+        # Письма, которые удалось закодировать, скорим одним матричным произведением:
+        # top-k, порог и логика "ДРУГОЕ" применяются сразу ко всему окну
+        ok_positions = [j for j, emb in enumerate(encoded) if not isinstance(emb, Exception)]
+        scored = None
+        if ok_positions:
+            try:
+                similarity_matrix = cosine_matrix(torch.stack([encoded[j] for j in ok_positions]),
+                                                  normalized_categories)
+                scored = score_batch(similarity_matrix, category_names, top_n, threshold, OTHER_CATEGORY_THRESHOLD)
+            except Exception as e:
+                print(f"⚠️  Ошибка матричного скоринга батча: {e}")
+
+        row_by_position = {j: row for row, j in enumerate(ok_positions)}
+        for j, (email_result, processed_text, decoded_subject, _) in enumerate(batch):
+            try:
+                if isinstance(encoded[j], Exception):
+                    raise encoded[j]
+                if scored is not None:
+                    email_scores, row = scored, row_by_position[j]
+                else:
+                    email_scores, row = score_batch(cosine_matrix(encoded[j].unsqueeze(0), normalized_categories),
+                                                    category_names, top_n, threshold, OTHER_CATEGORY_THRESHOLD), 0
+                _finalize_email_result(email_result, email_scores.category_scores(row), bool(email_scores.is_other[row]),
+                                       processed_text, decoded_subject, threshold, stats, log)
+            except Exception as e:
+                _mark_classification_error(email_result, e, processed_text, decoded_subject, stats)
+
+    # Близнецы из этого запуска получают результат первого письма своего кластера
+    for entry_id, leader_result in dup_leaders:
+        dup_index.resolve(entry_id, leader_result)
+        entry = dup_index.entries.get(entry_id)
+        for email_result, processed_text, decoded_subject in dup_followers.get(entry_id, []):
+            if entry is not None:
+                _finalize_reused_result(email_result, entry, processed_text, decoded_subject, stats, log)
+            else:
+                _mark_classification_error(email_result, RuntimeError("Не классифицировано похожее письмо-образец"),
+                                           processed_text, decoded_subject, stats)
 
     # Вывод статистики
-    print(f"\n📊 СТАТИСТИКА ОБРАБОТКИ:")
-    print(f"   • Всего писем: {len(emails)}")
-    print(f"   • Успешно обработано: {stats['successful']}")
-    print(f"   • С ошибками: {stats['errors']}")
+    log(f"\n📊 СТАТИСТИКА ОБРАБОТКИ:")
+    log(f"   • Всего писем: {len(emails)}")
+    log(f"   • Успешно обработано: {stats['successful']}")
+    log(f"   • С ошибками: {stats['errors']}")
     
     if stats['successful'] > 0:
         success_rate = (stats['successful'] / len(emails)) * 100
-        print(f"   • Успешность: {success_rate:.1f}%")
+        log(f"   • Успешность: {success_rate:.1f}%")
     
+    # Только косинусные сходства модели: у правил, домена и ключевых слов своя шкала
     if stats['confidences']:
         avg_conf = sum(stats['confidences']) / len(stats['confidences'])
-        print(f"📊 Средняя уверенность: {avg_conf:.3f}")
-        print(f"📊 Минимальная уверенность: {min(stats['confidences']):.3f}")
-        print(f"📊 Максимальная уверенность: {max(stats['confidences']):.3f}")
+        log(f"📊 Средняя уверенность модели (писем: {len(stats['confidences'])}): {avg_conf:.3f}")
+        log(f"📊 Минимальная уверенность: {min(stats['confidences']):.3f}")
+        log(f"📊 Максимальная уверенность: {max(stats['confidences']):.3f}")
     
     if stats['total'] > 0:
         other_percentage = (stats['to_other'] / stats['total']) * 100
-        print(f"📊 Писем в категорию '{OTHER_CATEGORY_NAME}': {stats['to_other']}/{stats['total']} ({other_percentage:.1f}%)")
+        log(f"📊 Писем в категорию '{OTHER_CATEGORY_NAME}': {stats['to_other']}/{stats['total']} ({other_percentage:.1f}%)")
+        if rules is not None or prior is not None or dup_index is not None or cascade:
+            by_model = (stats['total'] - stats['by_header_rules'] - stats['by_domain_prior']
+                        - stats['by_near_duplicate'] - stats['by_keywords'])
+            for title, count in (("📮 Решено правилами по заголовкам", stats['by_header_rules']),
+                                 ("🌐 Решено по домену отправителя", stats['by_domain_prior']),
+                                 ("🧬 Взято у почти одинаковых писем", stats['by_near_duplicate']),
+                                 ("🔑 Решено ключевыми словами", stats['by_keywords']),
+                                 ("🤖 Решено моделью", by_model)):
+                log(f"{title}: {count}/{stats['total']} ({count / stats['total'] * 100:.1f}%)")
+
+    if verbose and encoding_stats['texts']:
+        print_encoding_stats(encoding_stats)
+    if encoding_stats.get('windows'):
+        log(f"🪟 Окон по токенам закодировано: {encoding_stats['windows']} (пулинг: {WINDOW_POOLING})")
+    if encoding_stats['deduplicated']:
+        log(f"♻️  Одинаковых текстов закодировано один раз: {encoding_stats['deduplicated']}")
+    if verbose and cache:
+        print_cache_stats(cache.stats)
+
+    # Гистограммы доменов учатся на решениях всех ступеней, кроме самой гистограммы
+    for email_result, sender_domain in zip(results, sender_domains):
+        if sender_domain:
+            email_result["sender_domain"] = sender_domain
+    if prior is not None:
+        try:
+            for email_result, sender_domain in zip(results, sender_domains):
+                if sender_domain and email_result.get("processed") and email_result.get("decided_by") != "domain_prior":
+                    prior.observe(sender_domain, email_result["categories"][0][0])
+            prior.prune(set(category_names) | {OTHER_CATEGORY_NAME})
+            prior.save()
+        except Exception as e:
+            print(f"⚠️  Не удалось обновить гистограммы доменов: {e}")
+        if verbose:
+            print_prior_stats(prior.stats, len(prior.domains))
+
+    if dup_index is not None:
+        try:
+            dup_index.evict()
+            dup_index.save()
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить индекс почти одинаковых писем: {e}")
+        if verbose:
+            print_cluster_report(dup_index)
 
     return results
 
@@ -306,38 +873,20 @@ def classify_text(text: str, categories: dict, category_embeddings=None, top_n:
         return [("Пустое письмо", 0.0)]
 
     try:
+        from sentence_transformers import util
+
         # Безопасное кодирование текста
         text_embedding = safe_encode_text(text)
 
         # Если эмбеддинги категорий не переданы, вычисляем их
         if category_embeddings is None:
             category_descriptions = list(categories.values())
-            category_embeddings = model.encode(category_descriptions, convert_to_tensor=True)
+            category_embeddings = get_model().encode(category_descriptions, convert_to_tensor=True)
 
         # Вычисляем косинусное сходство
         similarities = util.cos_sim(text_embedding, category_embeddings)[0]
-        
-        # Нормализуем в [0, 1]
-        similarities_np = similarities.cpu().numpy()
-        normalized_similarities = (similarities_np + 1) / 2
-
-        # Собираем результаты
-        results = []
-        category_names = list(categories.keys())
-
-        for i, category_name in enumerate(category_names):
-            confidence = float(normalized_similarities[i])
-            results.append((category_name, confidence))
-
-        # Сортируем по убыванию уверенности
-        results.sort(key=lambda x: x[1], reverse=True)
-
-        # Применяем порог
-        normalized_threshold = (threshold + 1) / 2 if threshold < 0 else threshold
-        filtered_results = [r for r in results if r[1] >= normalized_threshold]
 
-        # Ограничиваем количество результатов
-        return filtered_results[:top_n]
+        return rank_categories(similarities, list(categories.keys()), top_n, threshold)
 
     except Exception as e:
         print(f"❌ Ошибка при классификации текста: {e}")
@@ -0,0 +1,100 @@
+"""
+discovery.py - Ленивый обход входной папки с письмами.
+
+Архив писем - вложенное дерево с миллионами файлов, поэтому файлы не собираются
+в список заранее: iter_files обходит дерево через os.scandir и сразу отдает
+записи (path, size, mtime_ns), так что парсинг начинается с первого найденного файла.
+Содержимое каждой папки сортируется по имени, у папок - по имени с "/" на конце,
+поэтому порядок стабилен между запусками и совпадает с sorted() относительных путей
+через "/" (a.eml идет раньше a/x.eml, как и в строковой сортировке).
+
+Фильтры: include/exclude glob-шаблоны (сравниваются с именем и с путем относительно
+корня, exclude отсекает и папки целиком), минимальный и максимальный размер файла.
+Настройки по умолчанию меняет configure_discovery (ключи командной строки main.py).
+"""
+
+import os
+from fnmatch import fnmatchcase
+from typing import Iterator, NamedTuple, Sequence
+
+# === КОНФИГУРАЦИЯ ===
+DISCOVERY_INCLUDE = ("*.eml", "*.msg")  # Какие файлы считаются письмами
+DISCOVERY_EXCLUDE = (".*",)  # Скрытые файлы и папки (.git, .DS_Store, временные файлы клиентов)
+DISCOVERY_MIN_BYTES = 0  # Минимальный размер файла, байт
+DISCOVERY_MAX_BYTES = None  # Без ограничения сверху
+DISCOVERY_RECURSIVE = True
+
+_settings = {
+    'include': DISCOVERY_INCLUDE,
+    'exclude': DISCOVERY_EXCLUDE,
+    'min_bytes': DISCOVERY_MIN_BYTES,
+    'max_bytes': DISCOVERY_MAX_BYTES,
+    'recursive': DISCOVERY_RECURSIVE,
+}
+
+
+class FileRecord(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+
+
+def configure_discovery(include: Sequence[str] = None, exclude: Sequence[str] = None,
+                        min_bytes: int = None, max_bytes: int = None, recursive: bool = None):
+    """Меняет фильтры обхода по умолчанию (None - оставить как есть)."""
+    for key, value in (('include', include), ('exclude', exclude), ('min_bytes', min_bytes),
+                       ('max_bytes', max_bytes), ('recursive', recursive)):
+        if value is not None:
+            _settings[key] = tuple(value) if key in ('include', 'exclude') else value
+
+
+def _matches(name: str, relpath: str, patterns: Sequence[str]) -> bool:
+    return any(fnmatchcase(name, pattern) or fnmatchcase(relpath, pattern) for pattern in patterns)
+
+
+def iter_files(root: str, include: Sequence[str] = None, exclude: Sequence[str] = None,
+               min_bytes: int = None, max_bytes: int = None, recursive: bool = None) -> Iterator[FileRecord]:
+    """
+    Лениво обходит root и отдает FileRecord подходящих файлов в стабильном порядке.
+    Параметры, равные None, берутся из configure_discovery.
+    """
+    include = _settings['include'] if include is None else include
+    exclude = _settings['exclude'] if exclude is None else exclude
+    min_bytes = _settings['min_bytes'] if min_bytes is None else min_bytes
+    max_bytes = _settings['max_bytes'] if max_bytes is None else max_bytes
+    recursive = _settings['recursive'] if recursive is None else recursive
+    yield from _walk(root, "", include, exclude, min_bytes or 0, max_bytes, recursive)
+
+
+def _sort_key(entry) -> str:
+    try:
+        return entry.name + "/" if entry.is_dir() else entry.name
+    except OSError:
+        return entry.name
+
+
+def _walk(folder: str, prefix: str, include, exclude, min_bytes: int, max_bytes, recursive: bool):
+    try:
+        with os.scandir(folder) as iterator:
+            entries = sorted(iterator, key=_sort_key)
+    except OSError as e:
+        print(f"⚠️  Не удалось прочитать папку {folder}: {e}")
+        return
+
+    for entry in entries:
+        relpath = prefix + entry.name
+        if _matches(entry.name, relpath, exclude):
+            continue
+        try:
+            if entry.is_dir():
+                if recursive:
+                    yield from _walk(entry.path, relpath + "/", include, exclude, min_bytes, max_bytes, recursive)
+                continue
+            if not entry.is_file() or not _matches(entry.name, relpath, include):
+                continue
+            stat = entry.stat()
+        except OSError:
+            continue  # Файл удален или недоступен во время обхода
+        if stat.st_size < min_bytes or (max_bytes is not None and stat.st_size > max_bytes):
+            continue
+        yield FileRecord(entry.path, stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,167 @@
+"""
+domain_prior.py - Выученное распределение категорий по домену отправителя.
+
+Для каждого зарегистрированного домена (tldextract: news.cnn.com -> cnn.com)
+копится гистограмма категорий из результатов классификации. Если письма домена
+почти всегда попадают в одну категорию, новые письма от него решаются без модели
+(в режиме "verify" - после дешевой проверки ключевыми словами).
+
+Счетчики затухают экспоненциально (PRIOR_HALF_LIFE_DAYS), поэтому старые данные
+постепенно перестают влиять. Домены без писем дольше всех вытесняются при
+превышении PRIOR_MAX_DOMAINS. Гистограммы хранятся в model_cache/domain_prior.json.
+"""
+
+import heapq
+import json
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+# === КОНФИГУРАЦИЯ ===
+DOMAIN_PRIOR_ENABLED = True  # Решать письма частых отправителей по выученной гистограмме
+PRIOR_MODE = "verify"  # "verify" - проверять ключевыми словами, "skip" - сразу брать категорию домена
+PRIOR_MIN_COUNT = 5.0  # Минимальный (затухший) вес писем домена для решения
+PRIOR_MIN_SHARE = 0.9  # Минимальная доля лучшей категории домена
+PRIOR_HALF_LIFE_DAYS = 30.0  # Период полураспада счетчиков
+PRIOR_MIN_WEIGHT = 0.05  # Домены с меньшим суммарным весом удаляются
+PRIOR_MAX_DOMAINS = 5000  # Лимит доменов в хранилище
+
+_extractor = None
+_priors = {}  # путь файла -> DomainPrior
+
+
+def registered_domain(domain: str) -> str:
+    """Зарегистрированный домен: mail.news.example.co.uk -> example.co.uk."""
+    global _extractor
+    domain = (domain or "").strip().lower().rstrip('.')
+    if not domain:
+        return ""
+    if _extractor is None:
+        try:
+            import tldextract
+
+            # Встроенный снимок Public Suffix List, без обращения к сети
+            _extractor = tldextract.TLDExtract(suffix_list_urls=())
+        except ImportError:
+            print("⚠️  tldextract не установлен, домен определяется по двум последним меткам")
+            _extractor = False
+    if _extractor:
+        extracted = _extractor(domain)
+        if extracted.registered_domain:
+            return extracted.registered_domain
+        return domain
+    return '.'.join(domain.split('.')[-2:])
+
+
+class DomainPrior:
+    """Гистограммы категорий по доменам с затуханием и вытеснением."""
+
+    def __init__(self, path: str, max_domains: int = PRIOR_MAX_DOMAINS,
+                 half_life_days: float = PRIOR_HALF_LIFE_DAYS):
+        self.path = path
+        self.max_domains = max_domains
+        self.half_life = half_life_days * 86400
+        self.domains = {}  # домен -> {"counts": {категория: вес}, "updated": ts, "last_seen": ts}
+        self.stats = {'lookups': 0, 'hits': 0, 'rejected': 0, 'updates': 0, 'evictions': 0}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.domains = json.load(f).get('domains', {})
+        except Exception as e:
+            print(f"⚠️  Гистограммы доменов повреждены, начинаем заново: {e}")
+            self.domains = {}
+
+    def save(self):
+        """Атомарно записывает гистограммы на диск."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'domains': self.domains}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset_stats(self):
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def _decayed(self, entry: dict, now: float) -> dict:
+        """Счетчики записи, затухшие к моменту now (запись обновляется на месте)."""
+        elapsed = now - entry.get('updated', now)
+        if elapsed > 0 and self.half_life > 0:
+            factor = 0.5 ** (elapsed / self.half_life)
+            entry['counts'] = {category: count * factor for category, count in entry['counts'].items()}
+            entry['updated'] = now
+        return entry['counts']
+
+    def lookup(self, domain: str, min_count: float = PRIOR_MIN_COUNT,
+               min_share: float = PRIOR_MIN_SHARE) -> Optional[Tuple[str, float]]:
+        """
+        Уверенная категория домена.
+        :return: (категория, доля) или None, если данных мало или распределение размыто
+        """
+        if not domain:
+            return None
+        self.stats['lookups'] += 1
+        entry = self.domains.get(domain)
+        if not entry:
+            return None
+
+        counts = self._decayed(entry, time.time())
+        total = sum(counts.values())
+        if total < min_count:
+            return None
+        category, count = max(counts.items(), key=lambda x: x[1])
+        share = count / total
+        if share < min_share:
+            return None
+        return category, share
+
+    def observe(self, domain: str, category: str):
+        """Учитывает итоговую категорию письма от домена."""
+        if not domain or not category:
+            return
+        now = time.time()
+        entry = self.domains.setdefault(domain, {'counts': {}, 'updated': now, 'last_seen': now})
+        counts = self._decayed(entry, now)
+        counts[category] = counts.get(category, 0.0) + 1.0
+        entry['last_seen'] = now
+        self.stats['updates'] += 1
+
+    def prune(self, allowed_categories=None):
+        """
+        Удаляет затухшие домены и категории, которых больше нет в файле категорий,
+        затем вытесняет давно не встречавшиеся домены сверх лимита.
+        """
+        now = time.time()
+        for domain in list(self.domains):
+            counts = self._decayed(self.domains[domain], now)
+            if allowed_categories is not None:
+                for category in [c for c in counts if c not in allowed_categories]:
+                    del counts[category]
+            if sum(counts.values()) < PRIOR_MIN_WEIGHT:
+                del self.domains[domain]
+
+        overflow = len(self.domains) - self.max_domains
+        if overflow > 0:
+            oldest = heapq.nsmallest(overflow, self.domains, key=lambda d: self.domains[d].get('last_seen', 0))
+            for domain in oldest:
+                del self.domains[domain]
+            self.stats['evictions'] += overflow
+
+
+def get_domain_prior(cache_root: str) -> DomainPrior:
+    """Гистограммы доменов из model_cache (одни на процесс)."""
+    path = os.path.join(cache_root, 'domain_prior.json')
+    if path not in _priors:
+        _priors[path] = DomainPrior(path)
+    return _priors[path]
+
+
+def print_prior_stats(stats: Dict[str, int], domains: int):
+    lookups = stats['lookups']
+    hit_rate = stats['hits'] / lookups * 100 if lookups else 0.0
+    print(f"🌐 Гистограммы доменов: {domains} доменов, попаданий {stats['hits']}/{lookups} ({hit_rate:.1f}%), "
+          f"отклонено проверкой {stats['rejected']}, обновлений {stats['updates']}, вытеснено {stats['evictions']}")
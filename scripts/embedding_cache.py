@@ -0,0 +1,171 @@
+"""
+embedding_cache.py - Персистентный кэш эмбеддингов писем.
+
+Ключ записи - SHA-256 от имени модели, max_seq_length и предобработанного
+текста, поэтому повторный запуск кодирует только новые или измененные письма.
+Векторы хранятся в float16 в SQLite (WAL): новые записи дописываются транзакцией,
+а файл целиком не переписывается. Кэш могут одновременно открыть пакетный запуск,
+демон и HTTP-сервис - блокировки и согласованность обеспечивает SQLite.
+Время использования записи обновляется не чаще CACHE_TOUCH_SEC, поэтому попадания
+почти не пишут на диск. При превышении лимита размера вытесняются давно не
+использованные записи.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+# === КОНФИГУРАЦИЯ ===
+DEFAULT_MAX_SIZE_MB = 512  # Лимит размера векторов в кэше
+CACHE_TOUCH_SEC = 3600  # Как часто обновлять время использования записи при попаданиях
+CACHE_BUSY_TIMEOUT_SEC = 30  # Ожидание блокировки, пока пишет другой процесс
+SQL_BATCH = 500  # Ключей в одном запросе IN (...)
+
+DB_FILE = "embeddings.sqlite"
+
+_open_caches = {}  # Открытые кэши по директории, чтобы не переоткрывать базу
+
+
+class EmbeddingCache:
+    """Кэш эмбеддингов на диске: float16 векторы в SQLite с приблизительным LRU вытеснением."""
+
+    def __init__(self, cache_root: str, model_name: str, max_seq_length: int, dim: int,
+                 max_size_mb: float = DEFAULT_MAX_SIZE_MB, log=print):
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.directory = os.path.join(cache_root, 'embeddings', f"{slug}_{max_seq_length}")
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.dim = dim
+        self.max_entries = max(1, int(max_size_mb * 1024 * 1024 // (dim * 2)))
+        self.stats = {'hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        self._log = log
+        self._lock = threading.Lock()  # Одно соединение на процесс, вызовы из разных потоков
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = self._connect(os.path.join(self.directory, DB_FILE))
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        db = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT_SEC, isolation_level=None,
+                             check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                   "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, used_at INTEGER NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS embeddings_used_at ON embeddings (used_at)")
+
+        row = db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        if row is not None and int(row[0]) != self.dim:
+            self._log("⚠️  Кэш эмбеддингов создан для другой размерности, сбрасываем")
+            db.execute("DELETE FROM embeddings")
+        db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+        return db
+
+    # --- Ключи ---
+
+    def key_for(self, text: str) -> str:
+        """Ключ записи: хэш модели, длины последовательности и текста."""
+        digest = hashlib.sha256()
+        digest.update(f"{self.model_name}\0{self.max_seq_length}\0".encode('utf-8'))
+        digest.update(text.encode('utf-8', errors='surrogatepass'))
+        return digest.hexdigest()
+
+    def reset_stats(self):
+        """Обнуляет счетчики перед новым запуском."""
+        self.stats = {key: 0 for key in self.stats}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # --- Чтение и запись ---
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Возвращает float32 векторы для найденных ключей и None для отсутствующих."""
+        rows = {}
+        now = int(time.time())
+        with self._lock:
+            for start in range(0, len(keys), SQL_BATCH):
+                chunk = list(set(keys[start:start + SQL_BATCH]))
+                placeholders = ','.join('?' * len(chunk))
+                rows.update((key, (vector, used_at)) for key, vector, used_at in self._db.execute(
+                    f"SELECT key, vector, used_at FROM embeddings WHERE key IN ({placeholders})", chunk))
+            stale = [(now, key) for key, (_, used_at) in rows.items() if now - used_at >= CACHE_TOUCH_SEC]
+            if stale:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany("UPDATE embeddings SET used_at = ? WHERE key = ?", stale)
+
+        found = []
+        for key in keys:
+            row = rows.get(key)
+            if row is None or len(row[0]) != self.dim * 2:
+                self.stats['misses'] += 1
+                found.append(None)
+                continue
+            self.stats['hits'] += 1
+            found.append(np.frombuffer(row[0], dtype=np.float16).astype(np.float32))
+        return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """Сохраняет векторы (N x dim) под указанными ключами одной транзакцией."""
+        vectors_by_key = dict(zip(keys, vectors))
+        if not vectors_by_key:
+            return
+        # Не храним больше, чем позволяет лимит
+        items = list(vectors_by_key.items())[-self.max_entries:]
+        now = int(time.time())
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                before = self._db.total_changes
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float16).tobytes(), now) for key, vector in items])
+                self.stats['writes'] += self._db.total_changes - before
+                self._evict()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _evict(self):
+        """Вытесняет давно не использованные записи сверх лимита (внутри транзакции)."""
+        count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return
+        self._db.execute("DELETE FROM embeddings WHERE key IN "
+                         "(SELECT key FROM embeddings ORDER BY used_at, rowid LIMIT ?)", (excess,))
+        self.stats['evictions'] += excess
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def size_mb(self) -> float:
+        """Текущий объем векторов в мегабайтах."""
+        return len(self) * self.dim * 2 / (1024 * 1024)
+
+
+def get_embedding_cache(cache_root: str, model_name: str, max_seq_length: int, dim: int,
+                        max_size_mb: float = DEFAULT_MAX_SIZE_MB, log=print) -> EmbeddingCache:
+    """Возвращает открытый кэш для модели, открывая его при первом обращении."""
+    key = (cache_root, model_name, max_seq_length)
+    if key not in _open_caches:
+        _open_caches[key] = EmbeddingCache(cache_root, model_name, max_seq_length, dim, max_size_mb, log)
+    return _open_caches[key]
+
+
+def print_cache_stats(stats: Dict[str, Any], title: str = "Кэш эмбеддингов"):
+    """Выводит счетчики кэша в консоль."""
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    hit_rate = stats.get('hits', 0) / lookups if lookups else 0.0
+    print(f"💾 {title}: попаданий {stats.get('hits', 0)}, промахов {stats.get('misses', 0)} "
+          f"({hit_rate:.1%}), записано {stats.get('writes', 0)}, вытеснено {stats.get('evictions', 0)}")
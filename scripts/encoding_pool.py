@@ -0,0 +1,214 @@
+"""
+encoding_pool.py - Многопроцессное кодирование писем.
+
+Тексты режутся на чанки, которые кодируют рабочие процессы; результаты
+собираются в исходном порядке. Веса torch-модели передаются воркерам через
+разделяемую память (torch.multiprocessing), поэтому RAM не растет линейно
+с числом воркеров. Упакованные веса int8-квантованной модели share_memory()
+не переносит, поэтому с QUANTIZE_INT8, как и для onnx/openvino, каждый воркер
+загружает модель сам (квантованная берется из model_cache) и память не разделяется.
+
+Если воркер умирает (OOM, падение токенизатора или torch) или чанк не готов за
+POOL_CHUNK_TIMEOUT_SEC, пул останавливается, а незакодированные тексты
+возвращаются как None - classifier докодирует их по одному в основном процессе.
+Следующий вызов запускает новый пул.
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Tuple
+
+# === КОНФИГУРАЦИЯ ===
+DEFAULT_WORKERS = 1  # 1 = кодирование в основном процессе без пула
+DEFAULT_TORCH_THREADS = 1  # Потоков torch на воркер
+DEFAULT_CHUNK_SIZE = 64  # Текстов в одной задаче воркеру
+POOL_CHUNK_TIMEOUT_SEC = 600  # Сколько ждать следующий готовый чанк, прежде чем считать пул зависшим
+
+_settings = {
+    'workers': DEFAULT_WORKERS,
+    'torch_threads': DEFAULT_TORCH_THREADS,
+    'chunk_size': DEFAULT_CHUNK_SIZE,
+}
+_pool = None
+_lock = threading.Lock()
+
+_worker_model = None  # Модель внутри рабочего процесса
+
+
+def _init_worker(shared_model, backend: str, quantize_int8: bool, torch_threads: int, scripts_dir: str):
+    """Инициализация рабочего процесса: потоки torch и модель (один раз на процесс)."""
+    global _worker_model
+    import torch
+
+    if scripts_dir not in sys.path:
+        sys.path.insert(0, scripts_dir)
+    torch.set_num_threads(max(1, torch_threads))
+
+    if shared_model is not None:
+        _worker_model = shared_model
+    else:
+        import model_provider
+
+        model_provider.configure(quantize_int8=quantize_int8, backend=backend)
+        _worker_model = model_provider.get_model()
+    _worker_model.eval()
+
+
+def _encode_chunk(task):
+    """Кодирует чанк текстов в рабочем процессе. Возвращает numpy векторы и статистику."""
+    texts, batch_size, token_budget, window_ids = task
+    from batching import encode_bucketed
+
+    embeddings, stats = encode_bucketed(_worker_model, texts, token_budget, batch_size, window_ids)
+    vectors = [emb.float().cpu().numpy() if emb is not None else None for emb in embeddings]
+    return vectors, stats
+
+
+class EncodingPool:
+    """Пул процессов, кодирующих тексты общей моделью."""
+
+    def __init__(self, workers: int, torch_threads: int = DEFAULT_TORCH_THREADS,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        import torch.multiprocessing as torch_mp
+        import model_provider
+
+        self.workers = workers
+        self.torch_threads = torch_threads
+        self.chunk_size = max(1, chunk_size)
+
+        model = model_provider.get_model()
+        shared_model = None
+        if model_provider.INFERENCE_BACKEND == "torch" and not model_provider.QUANTIZE_INT8:
+            # Веса уходят в разделяемую память и не копируются в каждый воркер
+            model.share_memory()
+            shared_model = model
+
+        print(f"🧵 Запуск пула кодирования: {workers} воркеров x {torch_threads} потоков torch, "
+              f"чанк {self.chunk_size} текстов" + ("" if shared_model is not None else
+                                                  ", модель загружается в каждом воркере"))
+        self.broken = False
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=torch_mp.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(shared_model, model_provider.INFERENCE_BACKEND, model_provider.QUANTIZE_INT8,
+                      torch_threads, os.path.dirname(os.path.abspath(__file__))),
+        )
+
+    def process_ids(self) -> List[int]:
+        """PID рабочих процессов (для замеров памяти)."""
+        return list(getattr(self._executor, '_processes', None) or {})
+
+    def encode(self, texts: List[str], batch_size: int, token_budget: int,
+               window_ids: list = None) -> Tuple[list, Dict[str, Any]]:
+        """
+        Кодирует тексты в воркерах.
+        Тексты сортируются по длине, чтобы в чанке оказались письма близкой длины,
+        а результаты возвращаются в исходном порядке.
+        :param window_ids: Id токенов окон из token_windows (воркеры не токенизируют их заново)
+        :return: (numpy векторы или None для упавших чанков, статистика)
+        """
+        from batching import new_encoding_stats, merge_encoding_stats
+
+        stats = new_encoding_stats()
+        vectors = [None] * len(texts)
+        if not texts:
+            return vectors, stats
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        chunks = [order[start:start + self.chunk_size] for start in range(0, len(order), self.chunk_size)]
+        tasks = [([texts[i] for i in chunk], batch_size, token_budget,
+                  [window_ids[i] for i in chunk] if window_ids is not None else None) for chunk in chunks]
+
+        started = time.perf_counter()
+        try:
+            futures = {self._executor.submit(_encode_chunk, task): chunk for task, chunk in zip(tasks, chunks)}
+        except BrokenProcessPool as e:
+            print(f"⚠️  Пул кодирования недоступен: {e}")
+            self.broken = True
+            stats['failed_batches'] += len(chunks)
+            return vectors, stats
+
+        not_done, lost = set(futures), 0
+        while not_done:
+            done, not_done = wait(not_done, timeout=POOL_CHUNK_TIMEOUT_SEC, return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"⚠️  Воркеры не вернули чанк за {POOL_CHUNK_TIMEOUT_SEC} с, пул останавливается")
+                self.broken = True
+                lost += len(not_done)
+                break
+            for future in done:
+                chunk = futures[future]
+                try:
+                    chunk_vectors, chunk_stats = future.result()
+                except BrokenProcessPool:
+                    self.broken = True
+                    lost += 1
+                    continue
+                except Exception as e:
+                    print(f"⚠️  Воркер не смог закодировать чанк ({len(chunk)} текстов): {e}")
+                    stats['failed_batches'] += 1
+                    continue
+                merge_encoding_stats(stats, chunk_stats)
+                for i, vector in zip(chunk, chunk_vectors):
+                    vectors[i] = vector
+
+        if self.broken:
+            print(f"⚠️  Пул кодирования остановлен после сбоя воркера, чанков без результата: {lost}; "
+                  f"они будут докодированы в основном процессе")
+            stats['failed_batches'] += lost
+            self.close()
+
+        # Время воркеров складывается параллельно, поэтому берем настенное время
+        stats['seconds'] = time.perf_counter() - started
+        return vectors, stats
+
+    def close(self):
+        processes = list((getattr(self._executor, '_processes', None) or {}).values())
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            # Зависший воркер shutdown не остановит
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+
+
+def configure_encoding_pool(workers: int = None, torch_threads: int = None, chunk_size: int = None):
+    """Меняет настройки пула. Запущенный пул с другими настройками будет пересоздан."""
+    new_settings = dict(_settings)
+    for key, value in (('workers', workers), ('torch_threads', torch_threads), ('chunk_size', chunk_size)):
+        if value is not None:
+            new_settings[key] = max(1, int(value))
+
+    if new_settings != _settings:
+        shutdown_encoding_pool()
+        _settings.update(new_settings)
+
+
+def get_encoding_pool():
+    """Возвращает пул кодирования или None, если кодирование идет в основном процессе."""
+    global _pool
+    if _settings['workers'] <= 1:
+        return None
+    with _lock:
+        if _pool is not None and _pool.broken:
+            _pool = None  # Упавший пул уже остановлен, запускаем новый
+        if _pool is None:
+            _pool = EncodingPool(_settings['workers'], _settings['torch_threads'], _settings['chunk_size'])
+    return _pool
+
+
+@atexit.register
+def shutdown_encoding_pool():
+    """Останавливает пул, если он запущен."""
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -47,6 +47,41 @@ def export_to_json(results: List[Dict[str, Any]], output_file: str) -> str:
         print(f"❌ Ошибка при экспорте в JSON: {e}")
         raise
 
+# Колонки CSV в порядке вывода (потоковый экспорт пишет заголовок до первой строки)
+CSV_FIELDS = ['filename', 'subject', 'body_preview', 'processed', 'decided_by', 'rule', 'sender_domain',
+              'reused_from', 'error'] + \
+             [f'{name}_{i}' for i in range(1, 6) for name in ('category', 'score')] + \
+             ['top_category', 'top_score', 'confidence']
+
+def _csv_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Плоская строка CSV для одного результата."""
+    row = {
+        'filename': result.get('filename', ''),
+        'subject': result.get('subject_decoded', result.get('subject', '')[:200]),
+        'body_preview': result.get('body_preview', '')[:300],
+        'processed': result.get('processed', False),
+        'decided_by': result.get('decided_by', ''),
+        'rule': result.get('rule', ''),
+        'sender_domain': result.get('sender_domain', ''),
+        'reused_from': result.get('reused_from', ''),
+        'error': result.get('error', '')
+    }
+
+    # Добавляем категории
+    categories = result.get('categories', [])
+    if categories:
+        for i, (category, score) in enumerate(categories[:5]):  # Топ-5 категорий
+            row[f'category_{i+1}'] = category
+            row[f'score_{i+1}'] = f"{score:.4f}"
+
+        row['top_category'] = categories[0][0]
+        row['top_score'] = f"{categories[0][1]:.4f}"
+        row['confidence'] = result.get('confidence', 0.0)
+    else:
+        row['top_category'] = 'Не определено'
+        row['top_score'] = 0.0
+    return row
+
 def export_to_csv(results: List[Dict[str, Any]], output_file: str) -> str:
     """
     Экспортирует результаты в CSV файл.
@@ -63,29 +98,7 @@ def export_to_csv(results: List[Dict[str, Any]], output_file: str) -> str:
         flat_data = []
         
         for result in results:
-            row = {
-                'filename': result.get('filename', ''),
-                'subject': result.get('subject_decoded', result.get('subject', '')[:200]),
-                'body_preview': result.get('body_preview', '')[:300],
-                'processed': result.get('processed', False),
-                'error': result.get('error', '')
-            }
-            
-            # Добавляем категории
-            categories = result.get('categories', [])
-            if categories:
-                for i, (category, score) in enumerate(categories[:5]):  # Топ-5 категорий
-                    row[f'category_{i+1}'] = category
-                    row[f'score_{i+1}'] = f"{score:.4f}"
-                
-                row['top_category'] = categories[0][0]
-                row['top_score'] = f"{categories[0][1]:.4f}"
-                row['confidence'] = result.get('confidence', 0.0)
-            else:
-                row['top_category'] = 'Не определено'
-                row['top_score'] = 0.0
-            
-            flat_data.append(row)
+            flat_data.append(_csv_row(result))
         
         # Создаем DataFrame и сохраняем в CSV
         df = pd.DataFrame(flat_data)
@@ -184,6 +197,137 @@ def export_results(results: List[Dict[str, Any]],
     
     return exported_files
 
+class StreamingExporter:
+    """
+    Пишет результаты в файлы по одному, не держа весь список в памяти.
+    JSON содержит те же "results" и "metadata", что и export_to_json; метаданные
+    дописываются в конце, когда известно число писем.
+    """
+
+    def __init__(self, output_dir: str, formats: List[str] = ['json', 'csv'],
+                 filename_prefix: str = 'mail_lens_results'):
+        print(f"\n💾 Потоковый экспорт результатов в форматы: {', '.join(formats)}")
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        self.files = {}
+        self._handles = {}
+        self._csv_writer = None
+        self.total = 0
+        self.successful = 0
+        for fmt in (f.lower() for f in formats):
+            if fmt not in ('json', 'csv', 'jsonl'):
+                print(f"⚠️  Неподдерживаемый формат: {fmt}")
+                continue
+            output_file = os.path.join(output_dir, f"{filename_prefix}_{timestamp}.{fmt}")
+            # utf-8-sig для CSV - как в export_to_csv, чтобы Excel понимал кириллицу
+            handle = open(output_file, 'w', encoding='utf-8-sig' if fmt == 'csv' else 'utf-8', newline='')
+            self.files[fmt] = output_file
+            self._handles[fmt] = handle
+            if fmt == 'json':
+                handle.write('{\n  "results": [')
+            elif fmt == 'csv':
+                self._csv_writer = csv.DictWriter(handle, fieldnames=CSV_FIELDS, extrasaction='ignore')
+                self._csv_writer.writeheader()
+
+    def write(self, result: Dict[str, Any]):
+        """Дописывает один результат во все открытые файлы."""
+        if 'json' in self._handles:
+            prefix = ',\n    ' if self.total else '\n    '
+            self._handles['json'].write(prefix + json.dumps(result, ensure_ascii=False))
+        if self._csv_writer is not None:
+            self._csv_writer.writerow(_csv_row(result))
+        if 'jsonl' in self._handles:
+            result_with_meta = {**result, "export_timestamp": datetime.now().isoformat()}
+            self._handles['jsonl'].write(json.dumps(result_with_meta, ensure_ascii=False) + '\n')
+        self.total += 1
+        if result.get('processed', False):
+            self.successful += 1
+
+    def close(self) -> Dict[str, str]:
+        """Закрывает файлы (JSON дописывается метаданными) и возвращает пути к ним."""
+        if 'json' in self._handles:
+            metadata = {
+                "export_date": datetime.now().isoformat(),
+                "total_emails": self.total,
+                "successful_emails": self.successful,
+                "format": "json"
+            }
+            self._handles['json'].write(f'\n  ],\n  "metadata": {json.dumps(metadata, ensure_ascii=False)}\n}}\n')
+        for fmt, handle in self._handles.items():
+            handle.close()
+            print(f"✅ {fmt.upper()} экспортирован: {self.files[fmt]}")
+        self._handles = {}
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class StatsAccumulator:
+    """Статистика классификации, накапливаемая по одному результату."""
+
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.category_stats = {}
+        self.stage_stats = {}
+        self.with_domain = 0
+        self.confidence_count = 0
+        self.confidence_sum = 0.0
+        self.confidence_min = None
+        self.confidence_max = None
+
+    def add(self, result: Dict[str, Any]):
+        self.total += 1
+        if not result.get('processed', False):
+            return
+        self.successful += 1
+
+        stage = result.get('decided_by')
+        if result.get('categories'):
+            top_category, top_score = result['categories'][0][0], result['categories'][0][1]
+            self.category_stats[top_category] = self.category_stats.get(top_category, 0) + 1
+            # Уверенность - косинусное сходство модели; у правил, домена и ключевых слов своя шкала
+            if stage in (None, 'model'):
+                self.confidence_count += 1
+                self.confidence_sum += top_score
+                self.confidence_min = top_score if self.confidence_min is None else min(self.confidence_min, top_score)
+                self.confidence_max = top_score if self.confidence_max is None else max(self.confidence_max, top_score)
+
+        # Какой ступенью решены письма и как часто срабатывает гистограмма доменов
+        if stage:
+            self.stage_stats[stage] = self.stage_stats.get(stage, 0) + 1
+        if result.get('sender_domain'):
+            self.with_domain += 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Статистика в формате generate_stats."""
+        # Сортируем категории по частоте
+        sorted_categories = sorted(self.category_stats.items(), key=lambda x: x[1], reverse=True)
+        prior_hits = self.stage_stats.get('domain_prior', 0)
+        return {
+            "total_emails": self.total,
+            "successful": self.successful,
+            "failed": self.total - self.successful,
+            "success_rate": f"{(self.successful / self.total * 100):.1f}%" if self.total else "0%",
+            "top_categories": dict(sorted_categories[:10]),  # Топ-10 категорий
+            "confidence": {
+                "average": self.confidence_sum / self.confidence_count,
+                "min": self.confidence_min,
+                "max": self.confidence_max,
+                "emails": self.confidence_count
+            } if self.confidence_count else {},
+            "decided_by": dict(self.stage_stats),
+            "domain_prior": {
+                "hits": prior_hits,
+                "emails_with_domain": self.with_domain,
+                "hit_rate": prior_hits / self.with_domain if self.with_domain else 0.0
+            }
+        }
+
 def generate_stats(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     Генерирует статистику по результатам классификации.
@@ -194,38 +338,10 @@ def generate_stats(results: List[Dict[str, Any]]) -> Dict[str, Any]:
     Returns:
         Dict[str, Any]: Статистика
     """
-    successful = [r for r in results if r.get('processed', False)]
-    failed = [r for r in results if not r.get('processed', False)]
-    
-    # Статистика по категориям
-    category_stats = {}
-    confidence_scores = []
-    
-    for result in successful:
-        if result.get('categories'):
-            top_category = result['categories'][0][0]
-            top_score = result['categories'][0][1]
-            
-            category_stats[top_category] = category_stats.get(top_category, 0) + 1
-            confidence_scores.append(top_score)
-    
-    # Сортируем категории по частоте
-    sorted_categories = sorted(category_stats.items(), key=lambda x: x[1], reverse=True)
-    
-    stats = {
-        "total_emails": len(results),
-        "successful": len(successful),
-        "failed": len(failed),
-        "success_rate": f"{(len(successful) / len(results) * 100):.1f}%" if results else "0%",
-        "top_categories": dict(sorted_categories[:10]),  # Топ-10 категорий
-        "confidence": {
-            "average": sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0,
-            "min": min(confidence_scores) if confidence_scores else 0,
-            "max": max(confidence_scores) if confidence_scores else 0
-        } if confidence_scores else {}
-    }
-    
-    return stats
+    accumulator = StatsAccumulator()
+    for result in results:
+        accumulator.add(result)
+    return accumulator.summary()
 
 def print_stats(stats: Dict[str, Any]):
     """
@@ -242,11 +358,21 @@ def print_stats(stats: Dict[str, Any]):
     
     if 'confidence' in stats and stats['confidence']:
         conf = stats['confidence']
-        print(f"   📈 Уверенность классификации:")
+        print(f"   📈 Уверенность модели (писем: {conf.get('emails', stats['successful'])}):")
         print(f"      • Средняя: {conf['average']:.3f}")
         print(f"      • Минимальная: {conf['min']:.3f}")
         print(f"      • Максимальная: {conf['max']:.3f}")
     
+    if stats.get('decided_by'):
+        print(f"   🪜 Решено ступенями:")
+        for stage, count in stats['decided_by'].items():
+            print(f"      • {stage}: {count}")
+
+    prior = stats.get('domain_prior')
+    if prior and prior['emails_with_domain']:
+        print(f"   🌐 Попадания по домену отправителя: {prior['hits']}/{prior['emails_with_domain']} "
+              f"({prior['hit_rate']:.1%})")
+
     if stats['top_categories']:
         print(f"   🏷️  Топ категории:")
         for category, count in stats['top_categories'].items():
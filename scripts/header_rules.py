@@ -0,0 +1,162 @@
+"""
+header_rules.py - Правила классификации по заголовкам и отправителю.
+
+Парсер сохраняет компактную запись заголовков письма (header_record), а правила
+из categories/header_rules.json назначают категорию по ней еще до декодирования
+тела и кодирования моделью. Правила компилируются один раз (регулярные выражения
+готовятся при загрузке файла), проверка письма - несколько поисков по коротким строкам.
+
+Формат правила:
+    {"name": "promo_bulk_sender", "category": "Рекламная рассылка",
+     "all": [{"field": "bulk", "present": true}],
+     "any": [{"field": "from_local", "regex": "^(sales|promo)$"}]}
+Правило срабатывает, если выполнены все условия "all" и хотя бы одно из "any"
+(если "any" задан). Срабатывает первое подходящее правило по порядку в файле.
+
+Правила по умолчанию опираются только на признаки массовой рассылки и служебные
+имена ящиков. Правила по конкретным доменам отправителей живут в своем файле
+(пример - categories/header_rules_senders.example.json), его подключают через HEADER_RULES_FILE.
+"""
+
+import hashlib
+import json
+import os
+import re
+from email.utils import parseaddr
+from typing import Dict, List, Optional
+
+# === КОНФИГУРАЦИЯ ===
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADER_RULES_FILE = os.path.join(PROJECT_ROOT, 'categories', 'header_rules.json')
+HEADER_RULES_ENABLED = True  # Решать письма правилами по заголовкам без модели
+MAX_HEADER_VALUE = 200  # Сколько символов значения заголовка хранить в записи
+
+# Заголовок -> поле записи
+RECORD_HEADERS = {
+    'List-Id': 'list_id',
+    'List-Unsubscribe': 'list_unsubscribe',
+    'Precedence': 'precedence',
+    'Auto-Submitted': 'auto_submitted',
+    'Feedback-ID': 'feedback_id',
+    'X-Mailer': 'x_mailer',
+    'Return-Path': 'return_path',
+}
+
+# Заголовки, по которым узнается сервис рассылок (ESP)
+ESP_HEADERS = {
+    'X-SG-EID': 'sendgrid',
+    'X-SES-Outgoing': 'amazonses',
+    'X-Mailgun-Tag': 'mailgun',
+    'X-Mailgun-Sid': 'mailgun',
+    'X-MC-User': 'mailchimp',
+    'X-Mailru-Msgtype': 'mailru',
+    'X-CSA-Complaints': 'csa',
+    'X-Campaign': 'campaign',
+}
+
+BULK_PRECEDENCE = ('bulk', 'list', 'junk')  # Precedence массовой рассылки
+
+_engines = {}  # (путь, хэш содержимого) -> HeaderRuleEngine
+
+
+def header_record(msg) -> Dict[str, str]:
+    """
+    Компактная запись заголовков письма для правил: отправитель, списки рассылки, ESP.
+    Поле bulk перечисляет признаки массовой рассылки (list_unsubscribe, list_id,
+    precedence, esp). Хранятся только непустые поля.
+    """
+    record = {}
+    sender = str(msg.get('From', '') or '')
+    address = parseaddr(sender)[1].strip().lower()
+    if address:
+        local, _, domain = address.rpartition('@')
+        record['from_address'] = address
+        record['from_local'] = local
+        record['from_domain'] = domain
+
+    for header, field in RECORD_HEADERS.items():
+        value = msg.get(header)
+        if value:
+            record[field] = ' '.join(str(value).split())[:MAX_HEADER_VALUE]
+
+    esp = sorted({name for header, name in ESP_HEADERS.items() if msg.get(header) is not None})
+    if esp:
+        record['esp'] = ','.join(esp)
+
+    bulk = [field for field in ('list_unsubscribe', 'list_id') if field in record]
+    if record.get('precedence', '').lower() in BULK_PRECEDENCE:
+        bulk.append('precedence')
+    if esp:
+        bulk.append('esp')
+    if bulk:
+        record['bulk'] = ','.join(bulk)
+    return record
+
+
+def _compile_condition(condition: dict):
+    field = condition.get('field')
+    if not field:
+        raise ValueError(f"Условие без поля: {condition}")
+    if 'regex' in condition:
+        return field, re.compile(condition['regex'], re.IGNORECASE), None
+    return field, None, bool(condition.get('present', True))
+
+
+def _check(condition, record: Dict[str, str]) -> bool:
+    field, pattern, present = condition
+    value = record.get(field)
+    if pattern is None:
+        return bool(value) == present
+    return value is not None and pattern.search(value) is not None
+
+
+class HeaderRule:
+    """Одно скомпилированное правило."""
+
+    def __init__(self, spec: dict):
+        if not spec.get('name') or not spec.get('category'):
+            raise ValueError(f"У правила должны быть name и category: {spec}")
+        self.name = spec['name']
+        self.category = spec['category']
+        self.all = [_compile_condition(c) for c in spec.get('all', [])]
+        self.any = [_compile_condition(c) for c in spec.get('any', [])]
+        if not self.all and not self.any:
+            raise ValueError(f"У правила '{self.name}' нет условий")
+
+    def matches(self, record: Dict[str, str]) -> bool:
+        return (all(_check(c, record) for c in self.all)
+                and (not self.any or any(_check(c, record) for c in self.any)))
+
+
+class HeaderRuleEngine:
+    """Набор правил, проверяемых по порядку."""
+
+    def __init__(self, specs: List[dict]):
+        self.rules = [HeaderRule(spec) for spec in specs]
+
+    def match(self, record: Dict[str, str]) -> Optional[Dict[str, str]]:
+        """
+        Первое сработавшее правило.
+        :return: {"name": имя правила, "category": категория} или None
+        """
+        if not record:
+            return None
+        for rule in self.rules:
+            if rule.matches(record):
+                return {"name": rule.name, "category": rule.category}
+        return None
+
+
+def get_header_rules(rules_file: str = None) -> HeaderRuleEngine:
+    """Возвращает скомпилированные правила; файл компилируется один раз на содержимое."""
+    rules_file = rules_file or HEADER_RULES_FILE
+    if not os.path.exists(rules_file):
+        return HeaderRuleEngine([])
+
+    with open(rules_file, 'rb') as f:
+        content = f.read()
+    key = (os.path.abspath(rules_file), hashlib.sha256(content).hexdigest())
+    if key not in _engines:
+        specs = json.loads(content.decode('utf-8-sig'))
+        _engines[key] = HeaderRuleEngine(specs.get('rules', []) if isinstance(specs, dict) else specs)
+    return _engines[key]
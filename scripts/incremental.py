@@ -0,0 +1,210 @@
+"""
+incremental.py - Инкрементальные повторные запуски над растущим архивом писем.
+
+Рядом с результатами (data_output) хранится манифест: для каждого входного файла -
+размер, mtime, sha256 содержимого и id результата, плюс отпечаток запуска (модель,
+категории, правила и параметры классификации) и идентификатор модели, которой
+получены результаты. Результаты лежат в results_store.jsonl.
+
+Повторный запуск классифицирует только новые и измененные файлы (файл с прежними
+размером и mtime не хэшируется повторно), удаляет результаты удаленных файлов
+и объединяет остальное с прежними результатами. При смене отпечатка
+переклассифицируется все.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List
+from discovery import FileRecord
+
+# === КОНФИГУРАЦИЯ ===
+MANIFEST_FILE = "manifest.json"
+RESULTS_STORE_FILE = "results_store.jsonl"
+HASH_CHUNK_SIZE = 1 << 20  # Чтение файла при хэшировании порциями по 1 МБ
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADER_RULES_FILE = os.path.join(PROJECT_ROOT, "categories", "header_rules.json")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_fingerprint(categories_file: str, options: dict, model_id: str) -> str:
+    """
+    Отпечаток всего, от чего зависит результат: файлы категорий и правил, модель,
+    бэкенд и квантизация, настройки предобработки, окон, порогов и каскада
+    (classifier.classification_settings) и параметры вызова classify_emails.
+    :param model_id: Идентификатор модели (model_provider.get_model_id или configured_model_id)
+    """
+    import model_provider
+    from classifier import classification_settings
+
+    digest = hashlib.sha256()
+    for path in (categories_file, HEADER_RULES_FILE):
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        digest.update(b'\0')
+    model = {
+        'id': model_id,
+        'backend': model_provider.INFERENCE_BACKEND,
+        'int8': model_provider.QUANTIZE_INT8,
+    }
+    digest.update(json.dumps({'model': model, 'settings': classification_settings(), 'options': options},
+                             sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Манифест входных файлов и хранилище их результатов."""
+
+    def __init__(self, output_folder: str):
+        self.manifest_path = os.path.join(output_folder, MANIFEST_FILE)
+        self.store_path = os.path.join(output_folder, RESULTS_STORE_FILE)
+        self.fingerprint = None
+        self.model_id = None  # Модель, которой получены сохраненные результаты
+        self.files = {}  # относительный путь -> {"size", "mtime_ns", "sha256", "result_id"}
+        self.results = {}  # result_id -> результат
+        self._planned = {}  # относительный путь -> {"size", "mtime_ns", "sha256"} на момент plan()
+        self.stats = {'unchanged': 0, 'new': 0, 'changed': 0, 'deleted': 0, 'hashed': 0}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            results = {}
+            if os.path.exists(self.store_path):
+                with open(self.store_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            results[record['result_id']] = record['result']
+        except Exception as e:
+            print(f"⚠️  Манифест поврежден, все файлы будут обработаны заново: {e}")
+            return
+        self.fingerprint = stored.get('fingerprint')
+        self.model_id = stored.get('model_id')
+        self.files = stored.get('files', {})
+        self.results = results
+
+    def plan(self, input_folder: str, records: Iterable, fingerprint: str, model_id: str = None) -> List[FileRecord]:
+        """
+        Файлы, которые нужно классифицировать (новые и измененные), - записи FileRecord,
+        чтобы parse_files не запрашивал размеры повторно.
+        Записи удаленных файлов и, при смене отпечатка, все записи удаляются.
+        Можно вызвать повторно с другим отпечатком (например, загрузилась другая модель).
+        :param records: Записи (path, size, mtime_ns) обхода папки (discovery.iter_files)
+        :param model_id: Модель, которой будут получены результаты этого запуска
+        """
+        self.stats = {key: 0 for key in self.stats}
+        if fingerprint != self.fingerprint:
+            if self.files:
+                print("🔄 Модель, категории или параметры изменились - обрабатываются все файлы")
+            self.files, self.results = {}, {}
+            self.fingerprint = fingerprint
+        self.model_id = model_id
+        self._planned = {}
+
+        to_process = []
+        seen = set()
+        for path, size, mtime_ns in records:
+            key = os.path.relpath(path, input_folder)
+            entry = self.files.get(key)
+            # Письма, которые не удалось классифицировать, повторяются при каждом запуске
+            reusable = entry is not None and self.results.get(entry['result_id'], {}).get('processed', False)
+            if reusable and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+                seen.add(key)
+                self.stats['unchanged'] += 1
+                continue
+            # Хэш снимается до парсинга: файл, измененный во время запуска,
+            # не совпадет с записью манифеста и будет обработан снова
+            try:
+                sha256 = file_sha256(path)
+            except OSError:
+                continue  # Файл удален после обхода папки
+            seen.add(key)
+            if reusable and entry['size'] == size:
+                # mtime изменился (копирование, touch) - сверяем содержимое
+                self.stats['hashed'] += 1
+                if sha256 == entry['sha256']:
+                    entry['mtime_ns'] = mtime_ns
+                    self.stats['unchanged'] += 1
+                    continue
+            self.stats['changed' if entry else 'new'] += 1
+            self._planned[key] = {'size': size, 'mtime_ns': mtime_ns, 'sha256': sha256}
+            to_process.append(FileRecord(path, size, mtime_ns))
+
+        for key in [key for key in self.files if key not in seen]:
+            self.results.pop(self.files.pop(key)['result_id'], None)
+            self.stats['deleted'] += 1
+        return to_process
+
+    def record(self, input_folder: str, path: str, result: dict):
+        """
+        Запоминает результат обработанного файла (заменяя прежний) с размером, mtime
+        и sha256, снятыми в plan(), то есть с состоянием файла до парсинга.
+        """
+        key = os.path.relpath(path, input_folder)
+        state = self._planned.pop(key, None)
+        if state is None:
+            stat = os.stat(path)
+            state = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+        old = self.files.get(key)
+        if old:
+            self.results.pop(old['result_id'], None)
+        result_id = hashlib.sha256(f"{key}\0{state['sha256']}".encode('utf-8')).hexdigest()[:20]
+        self.files[key] = dict(state, result_id=result_id)
+        self.results[result_id] = result
+
+    def forget(self, input_folder: str, path: str):
+        """Удаляет запись файла, который не удалось распарсить (он будет обработан снова)."""
+        entry = self.files.pop(os.path.relpath(path, input_folder), None)
+        if entry:
+            self.results.pop(entry['result_id'], None)
+
+    def merged_results(self) -> List[dict]:
+        """Все актуальные результаты в порядке путей файлов."""
+        return [self.results[self.files[key]['result_id']] for key in sorted(self.files)
+                if self.files[key]['result_id'] in self.results]
+
+    def save(self):
+        """Атомарно записывает хранилище результатов и манифест."""
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_store = self.store_path + '.tmp'
+        with open(tmp_store, 'w', encoding='utf-8') as f:
+            for entry in self.files.values():
+                result = self.results.get(entry['result_id'])
+                if result is not None:
+                    f.write(json.dumps({'result_id': entry['result_id'], 'result': result},
+                                       ensure_ascii=False, default=str) + '\n')
+        tmp_manifest = self.manifest_path + '.tmp'
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'fingerprint': self.fingerprint, 'model_id': self.model_id,
+                       'files': self.files},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_store, self.store_path)
+        os.replace(tmp_manifest, self.manifest_path)
+
+
+def remove_previous_exports(output_folder: str, prefixes=('mail_lens_results_',)):
+    """Удаляет прежние выгрузки: объединенные результаты выгружаются заново."""
+    if not os.path.isdir(output_folder):
+        return
+    for name in os.listdir(output_folder):
+        if name.startswith(prefixes):
+            os.remove(os.path.join(output_folder, name))
+
+
+def print_manifest_stats(stats: Dict[str, int]):
+    print(f"📒 Манифест: без изменений {stats['unchanged']}, новых {stats['new']}, "
+          f"измененных {stats['changed']}, удаленных {stats['deleted']} "
+          f"(хэшировано повторно {stats['hashed']})")
@@ -0,0 +1,136 @@
+"""
+keyword_stage.py - Первая (дешевая) ступень каскада классификации.
+
+Ключевые слова категорий из new_cats.txt собираются в префиксное дерево,
+которое компилируется в одно регулярное выражение: текст письма
+просматривается за один проход, без цикла по ключевым словам.
+Русское ключевое слово совпадает со словом с окончанием до KEYWORD_MAX_ENDING букв
+("вакансия" находит "вакансии", основа "помещ" - "помещение"), остальные -
+только целым словом или с окончанием -s/-es ("file" находит "files", но не "filesystem").
+
+Письмо решается ключевыми словами, только если лучшая категория набрала
+достаточно совпадений и заметно опережает вторую (отрыв KEYWORD_MARGIN).
+Неоднозначные письма уходят в Sentence Transformer.
+"""
+
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from utils import load_category_keywords
+
+# === КОНФИГУРАЦИЯ ===
+KEYWORD_MIN_SCORE = 3  # Минимальный вес совпадений лучшей категории
+KEYWORD_MARGIN = 0.5  # Минимальный отрыв от второй категории: (лучшая - вторая) / лучшая
+KEYWORD_SCAN_CHARS = 20000  # Сколько символов тела письма просматривать
+SUBJECT_WEIGHT = 2  # Вес совпадения в теме письма
+KEYWORD_MAX_ENDING = 4  # Сколько букв окончания допускается после русского ключевого слова
+
+_NON_WORD = re.compile(r'[\W_]+')
+_CYRILLIC = re.compile(r'[а-я]')
+
+_matchers = {}  # отпечаток файла категорий -> KeywordMatcher
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё -> е, любые разделители -> один пробел."""
+    return _NON_WORD.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+def _build_trie(phrases: List[str]) -> dict:
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return trie
+
+
+def _trie_to_pattern(node: dict) -> str:
+    """Превращает префиксное дерево в регулярное выражение с общими префиксами."""
+    terminal = '' in node
+    branches = [re.escape(char) + _trie_to_pattern(child)
+                for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if terminal:
+        # Жадный опциональный хвост: при наложении берется самое длинное ключевое слово
+        return '(?:' + body + ')?'
+    return body
+
+
+class KeywordMatcher:
+    """Скомпилированный поиск ключевых слов всех категорий за один проход."""
+
+    def __init__(self, category_keywords: Dict[str, List[str]]):
+        self.categories = {}  # нормализованное ключевое слово -> категории
+        for category, keywords in category_keywords.items():
+            for keyword in keywords:
+                phrase = normalize_text(keyword)
+                if phrase:
+                    self.categories.setdefault(phrase, set()).add(category)
+
+        # Окончание зависит от последней буквы ключевого слова: у русских - до
+        # KEYWORD_MAX_ENDING букв, у остальных - только -s/-es; дальше граница слова
+        russian = [phrase for phrase in self.categories if _CYRILLIC.match(phrase[-1])]
+        other = [phrase for phrase in self.categories if not _CYRILLIC.match(phrase[-1])]
+        branches = []
+        if russian:
+            branches.append(f'(?P<ru>{_trie_to_pattern(_build_trie(russian))})[а-я]{{0,{KEYWORD_MAX_ENDING}}}')
+        if other:
+            branches.append(f'(?P<other>{_trie_to_pattern(_build_trie(other))})(?:e?s)?')
+        self.pattern = re.compile(r'(?<!\w)(?:' + '|'.join(branches) + r')(?!\w)') if branches else None
+
+    def find(self, text: str) -> set:
+        """Множество ключевых слов, найденных в тексте."""
+        if not self.pattern or not text:
+            return set()
+        return {match.group(match.lastgroup) for match in self.pattern.finditer(normalize_text(text))}
+
+    def score(self, subject: str, body: str) -> Dict[str, int]:
+        """Вес категорий: число разных найденных ключевых слов (совпадения в теме весомее)."""
+        subject_hits = self.find(subject)
+        body_hits = self.find(body[:KEYWORD_SCAN_CHARS] if body else "") - subject_hits
+
+        scores = {}
+        for hits, weight in ((subject_hits, SUBJECT_WEIGHT), (body_hits, 1)):
+            for phrase in hits:
+                for category in self.categories[phrase]:
+                    scores[category] = scores.get(category, 0) + weight
+        return scores
+
+    def decide(self, subject: str, body: str, min_score: int = None,
+               margin: float = None) -> Optional[List[Tuple[str, float]]]:
+        """
+        Решает письмо ключевыми словами, если ответ однозначен.
+        :return: Список (категория, доля веса совпадений) по убыванию или None,
+                 если письмо нужно отдать модели
+        """
+        min_score = KEYWORD_MIN_SCORE if min_score is None else min_score
+        margin = KEYWORD_MARGIN if margin is None else margin
+
+        scores = self.score(subject, body)
+        if not scores:
+            return None
+
+        ranked = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        best = ranked[0][1]
+        second = ranked[1][1] if len(ranked) > 1 else 0
+        if best < min_score or (best - second) / best < margin:
+            return None
+
+        total = sum(scores.values())
+        return [(category, value / total) for category, value in ranked]
+
+
+def get_keyword_matcher(categories_file: str) -> KeywordMatcher:
+    """Возвращает matcher для файла категорий; компилируется один раз на содержимое файла."""
+    with open(categories_file, 'rb') as f:
+        fingerprint = hashlib.sha256(f.read()).hexdigest()
+    key = (os.path.abspath(categories_file), fingerprint)
+    if key not in _matchers:
+        _matchers[key] = KeywordMatcher(load_category_keywords(categories_file))
+    return _matchers[key]
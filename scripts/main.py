@@ -1,16 +1,81 @@
+import argparse
 import os
 import sys
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from parser import parse_emails
+from parser import PARSE_WORKERS, parse_files, print_decode_stats, print_parse_stats
 from classifier import classify_emails
 from utils import clear_output_folder, decode_subject
 from exporter import export_results, generate_stats, print_stats
 from metrics import calculate_metrics, save_metrics_to_file  # Импортируем новый модуль
+import model_provider
+from model_provider import configure as configure_model
+from encoding_pool import configure_encoding_pool
+import keyword_stage
+from watcher import (WATCH_BATCH_MAX, WATCH_DEBOUNCE_SEC, WATCH_DOMAIN_PRIOR, WATCH_MAX_WAIT_SEC,
+                     WATCH_NEAR_DUPLICATES, run_daemon)
+from incremental import (MANIFEST_FILE, RESULTS_STORE_FILE, Manifest, print_manifest_stats,
+                         remove_previous_exports, run_fingerprint)
+from discovery import configure_discovery, iter_files
+from pipeline import PARSER_WORKERS, STREAM_CHUNK_SIZE, print_stage_stats, run_staged, run_streaming
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser(description="Mail Lens - классификация писем")
+    arg_parser.add_argument("--int8", action="store_true",
+                            help="Int8 квантизация модели для ускорения на CPU")
+    arg_parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default=None,
+                            help="Бэкенд инференса (по умолчанию torch)")
+    arg_parser.add_argument("--workers", type=int, default=None,
+                            help="Количество процессов кодирования (1 - без пула)")
+    arg_parser.add_argument("--torch-threads", type=int, default=None,
+                            help="Потоков torch на процесс кодирования")
+    arg_parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Текстов в одной задаче процессу кодирования")
+    arg_parser.add_argument("--no-cascade", action="store_true",
+                            help="Не решать однозначные письма ключевыми словами, все письма через модель")
+    arg_parser.add_argument("--keyword-margin", type=float, default=None,
+                            help="Порог отрыва лучшей категории для ступени ключевых слов")
+    arg_parser.add_argument("--no-header-rules", action="store_true",
+                            help="Не применять правила по заголовкам (categories/header_rules.json)")
+    arg_parser.add_argument("--no-domain-prior", action="store_true",
+                            help="Не решать письма по выученным категориям доменов отправителей")
+    arg_parser.add_argument("--no-near-duplicates", action="store_true",
+                            help="Не переиспользовать классификацию почти одинаковых писем")
+    arg_parser.add_argument("--full", action="store_true",
+                            help="Очистить data_output и обработать все письма заново (без манифеста)")
+    arg_parser.add_argument("--watch", action="store_true",
+                            help="Демон: классифицировать письма по мере появления в data_input")
+    arg_parser.add_argument("--watch-batch", type=int, default=WATCH_BATCH_MAX,
+                            help="Писем в микробатче демона")
+    arg_parser.add_argument("--watch-wait", type=float, default=WATCH_MAX_WAIT_SEC,
+                            help="Максимальное ожидание первого письма микробатча, с")
+    arg_parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE_SEC,
+                            help="Сколько секунд файл должен не меняться перед обработкой")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="Потоковый режим: письма читаются, классифицируются и пишутся порциями")
+    arg_parser.add_argument("--stream-chunk", type=int, default=STREAM_CHUNK_SIZE,
+                            help="Писем в одной порции потокового режима")
+    arg_parser.add_argument("--staged", action="store_true",
+                            help="Конвейер: парсинг, кодирование и запись работают одновременно")
+    arg_parser.add_argument("--parser-workers", type=int, default=PARSER_WORKERS,
+                            help="Процессов парсинга в режиме --staged")
+    arg_parser.add_argument("--unordered", action="store_true",
+                            help="В режиме --staged писать результаты по мере готовности, а не в порядке файлов")
+    arg_parser.add_argument("--parse-processes", type=int, default=PARSE_WORKERS,
+                            help="Процессов парсинга (1 = в основном процессе)")
+    arg_parser.add_argument("--include", nargs="+", default=None,
+                            help="Glob-шаблоны писем (по умолчанию *.eml *.msg)")
+    arg_parser.add_argument("--exclude", nargs="+", default=None,
+                            help="Glob-шаблоны исключаемых файлов и папок (по умолчанию .*)")
+    arg_parser.add_argument("--min-bytes", type=int, default=None, help="Пропускать файлы меньше, байт")
+    arg_parser.add_argument("--max-bytes", type=int, default=None, help="Пропускать файлы больше, байт")
+    arg_parser.add_argument("--flat", action="store_true", help="Не заходить в подпапки data_input")
+    return arg_parser.parse_args()
 
 def main():
+    args = parse_args()
     base_dir = os.path.dirname(current_dir)
     
     input_folder = os.path.join(base_dir, "data_input")
@@ -24,43 +89,122 @@ def main():
     print(f"📁 Выходная папка: {output_folder}")
     print(f"📄 Файл категорий: {categories_file}")
     print("-" * 70)
+
+    if args.int8:
+        configure_model(quantize_int8=True)
+        print("⚙️  Режим: int8 квантизация")
+    if args.backend:
+        configure_model(backend=args.backend)
+        print(f"⚙️  Бэкенд инференса: {args.backend}")
+    if args.workers or args.torch_threads or args.chunk_size:
+        configure_encoding_pool(workers=args.workers, torch_threads=args.torch_threads,
+                                chunk_size=args.chunk_size)
+        if args.workers:
+            print(f"⚙️  Процессов кодирования: {args.workers}")
+    if args.keyword_margin is not None:
+        keyword_stage.KEYWORD_MARGIN = args.keyword_margin
+    if args.no_cascade:
+        print("⚙️  Каскад ключевых слов отключен")
+    if args.no_header_rules:
+        print("⚙️  Правила по заголовкам отключены")
+    if args.no_domain_prior:
+        print("⚙️  Категории доменов отправителей отключены")
+    if args.no_near_duplicates:
+        print("⚙️  Поиск почти одинаковых писем отключен")
+    configure_discovery(include=args.include, exclude=args.exclude, min_bytes=args.min_bytes,
+                        max_bytes=args.max_bytes, recursive=False if args.flat else None)
     
     # Проверка существования путей
     if not os.path.exists(input_folder):
         print(f"❌ Папка {input_folder} не существует!")
         return
     
-    files = [f for f in os.listdir(input_folder) if f.endswith(('.eml', '.msg'))]
-    if not files:
-        print(f"❌ В папке нет .eml или .msg файлов!")
+    if args.watch:
+        run_daemon(input_folder, output_folder, categories_file,
+                   debounce=args.debounce, batch_max=args.watch_batch, max_wait=args.watch_wait,
+                   header_rules=not args.no_header_rules, top_n=5, threshold=0.25,
+                   cascade=not args.no_cascade, domain_prior=WATCH_DOMAIN_PRIOR and not args.no_domain_prior,
+                   near_duplicates=WATCH_NEAR_DUPLICATES and not args.no_near_duplicates)
         return
     
-    print(f"📧 Найдено файлов: {len(files)}")
+    # Обход ленивый: здесь проверяется только наличие хотя бы одного письма
+    if next(iter_files(input_folder), None) is None:
+        print(f"❌ В папке нет .eml или .msg файлов!")
+        return
     
-    # Очистка выходной папки (опционально, можно закомментировать)
-    clear_output_folder(output_folder)
+    # Полный прогон очищает выходную папку вместе с манифестом. Потоковые режимы
+    # обрабатывают все письма, но манифест не трогают: следующий обычный запуск
+    # продолжит с него, а не переклассифицирует весь архив
+    if args.full or args.stream or args.staged:
+        clear_output_folder(output_folder, keep=() if args.full else (MANIFEST_FILE, RESULTS_STORE_FILE))
+
+    if args.stream or args.staged:
+        run_stream_mode(args, input_folder, output_folder, categories_file)
+        return
+
+    # Манифест: обрабатываются только новые и измененные файлы
+    classify_options = dict(top_n=5, threshold=0.25, cascade=not args.no_cascade,
+                            header_rules=not args.no_header_rules,
+                            domain_prior=not args.no_domain_prior,
+                            near_duplicates=not args.no_near_duplicates)
+    manifest = Manifest(output_folder)
+    # Без изменений модель не загружается: отпечаток считается по модели из настроек.
+    # Если прошлый запуск работал на запасной модели, узнаем, какая загрузится сейчас
+    model_id = model_provider.configured_model_id()
+    if manifest.model_id not in (None, model_id):
+        model_id = model_provider.get_model_id()
+    to_process = manifest.plan(input_folder, iter_files(input_folder),
+                               run_fingerprint(categories_file, classify_options, model_id), model_id)
+    if to_process and model_provider.get_model_id() != model_id:
+        # Загрузилась запасная модель: прежние результаты получены другой моделью
+        model_id = model_provider.get_model_id()
+        to_process = manifest.plan(input_folder, iter_files(input_folder),
+                                   run_fingerprint(categories_file, classify_options, model_id), model_id)
+    found = manifest.stats['unchanged'] + manifest.stats['new'] + manifest.stats['changed']
+    print(f"📧 Найдено файлов: {found}")
+    print_manifest_stats(manifest.stats)
     
     # Парсинг писем
-    print("\n🔍 Парсинг писем...")
-    try:
-        emails = parse_emails(input_folder)
-        print(f"✅ Распарсено писем: {len(emails)}")
-    except Exception as e:
-        print(f"❌ Ошибка при парсинге писем: {e}")
-        return
+    print(f"\n🔍 Парсинг писем: {len(to_process)}...")
+    parsed, parse_errors, parse_stats = parse_files(to_process, header_rules=not args.no_header_rules,
+                                                    workers=args.parse_processes)
+    for error in parse_errors:
+        manifest.forget(input_folder, error['path'])
+    parsed_paths = [path for path, _ in parsed]
+    emails = [email_data for _, email_data in parsed]
+    for path, email_data in parsed:
+        # Обход рекурсивный: a/x.eml и b/x.eml - разные письма, имя берется с подпапкой
+        email_data['filename'] = os.path.relpath(path, input_folder)
+    print(f"✅ Распарсено писем: {len(emails)}")
+    print_parse_stats(parse_stats, parse_errors)
+    print_decode_stats()
     
     # Классификация писем
-    print("\n🤖 Классификация писем...")
-    try:
-        results = classify_emails(emails, categories_file, top_n=5, threshold=0.25)
-        print(f"✅ Классифицировано писем: {len(results)}")
-    except Exception as e:
-        print(f"❌ Ошибка при классификации: {e}")
-        return
+    results = []
+    if emails:
+        print("\n🤖 Классификация писем...")
+        try:
+            results = classify_emails(emails, categories_file, **classify_options)
+            print(f"✅ Классифицировано писем: {len(results)}")
+        except Exception as e:
+            print(f"❌ Ошибка при классификации: {e}")
+            return
+    else:
+        print("✅ Новых и измененных писем нет, модель не загружается")
     
     # Добавляем декодированные темы в результаты (для удобства)
-    for result in results:
+    for path, result in zip(parsed_paths, results):
         result['subject_decoded'] = decode_subject(result.get('subject', ''))
+        manifest.record(input_folder, path, result)
+
+    # Объединяем с результатами прошлых запусков; прежние выгрузки заменяются новой
+    try:
+        manifest.save()
+    except Exception as e:
+        print(f"⚠️  Не удалось сохранить манифест: {e}")
+    results = manifest.merged_results()
+    remove_previous_exports(output_folder)
+    print(f"📒 Результатов в объединенном наборе: {len(results)}")
     
     # === ВЫЗОВ ЭКСПОРТЕРА ===
     print("\n" + "=" * 70)
@@ -88,7 +232,51 @@ def main():
     stats = generate_stats(results)
     print_stats(stats)
     
-    # РАСЧЕТ МЕТРИК
+    report_metrics(results, output_folder)
+    print_brief_results(results[:5], len(results))
+    
+    print("\n" + "=" * 70)
+    print(f"🎯 Готово! Проверьте папку: {output_folder}")
+    print("=" * 70)
+
+def run_stream_mode(args, input_folder: str, output_folder: str, categories_file: str):
+    """Потоковый прогон: результаты пишутся в файлы порциями, корпус не держится в памяти."""
+    classify_kwargs = dict(formats=['json', 'csv'], chunk_size=args.stream_chunk,
+                           header_rules=not args.no_header_rules,
+                           top_n=5, threshold=0.25, cascade=not args.no_cascade,
+                           domain_prior=not args.no_domain_prior,
+                           near_duplicates=not args.no_near_duplicates)
+    try:
+        if args.staged:
+            print(f"\n🏭 Конвейер: {args.parser_workers} процессов парсинга, порции по {args.stream_chunk} писем...")
+            run = run_staged(input_folder, output_folder, categories_file,
+                             parser_workers=args.parser_workers, ordered=not args.unordered, **classify_kwargs)
+        else:
+            print(f"\n🌊 Потоковая обработка порциями по {args.stream_chunk} писем...")
+            run = run_streaming(input_folder, output_folder, categories_file, **classify_kwargs)
+    except Exception as e:
+        print(f"❌ Ошибка потоковой обработки: {e}")
+        return
+
+    print(f"\n✅ Экспорт завершен!")
+    for fmt, filepath in run['files'].items():
+        print(f"   📄 {fmt.upper()}: {filepath}")
+
+    print("\n" + "=" * 70)
+    print_stats(run['stats'])
+    if 'stages' in run:
+        print_stage_stats(run['stages'])
+    print_decode_stats()
+
+    report_metrics(run['metric_records'], output_folder)
+    print_brief_results(run['preview'], run['stats']['total_emails'])
+
+    print("\n" + "=" * 70)
+    print(f"🎯 Готово! Проверьте папку: {output_folder}")
+    print("=" * 70)
+
+def report_metrics(results: list, output_folder: str):
+    """Расчет и сохранение метрик классификации."""
     print("\n" + "=" * 70)
     print("📊 РАСЧЕТ МЕТРИК КЛАССИФИКАЦИИ")
     print("=" * 70)
@@ -109,13 +297,14 @@ def main():
                 print(f"\n✅ Метрики успешно рассчитаны и сохранены")
     except Exception as e:
         print(f"⚠️ Ошибка при расчете метрик: {e}")
-    
-    # Краткий вывод результатов
+
+def print_brief_results(preview: list, total: int):
+    """Краткий вывод первых результатов."""
     print("\n" + "=" * 70)
     print("📋 КРАТКИЕ РЕЗУЛЬТАТЫ:")
     print("=" * 70)
     
-    for i, result in enumerate(results[:5], 1):  # Показываем первые 5 результатов
+    for i, result in enumerate(preview, 1):  # Показываем первые 5 результатов
         if result.get('processed', False):
             categories = result.get('categories', [])
             if categories:
@@ -123,12 +312,8 @@ def main():
                 print(f"   📝 Тема: {result['subject_decoded'][:80]}...")
                 print(f"   🏷️  Топ категория: {categories[0][0]} ({categories[0][1]:.3f})")
     
-    if len(results) > 5:
-        print(f"\n... и еще {len(results) - 5} писем")
-    
-    print("\n" + "=" * 70)
-    print(f"🎯 Готово! Проверьте папку: {output_folder}")
-    print("=" * 70)
+    if total > len(preview):
+        print(f"\n... и еще {total - len(preview)} писем")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
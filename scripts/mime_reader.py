@@ -0,0 +1,212 @@
+"""
+mime_reader.py - Ленивое чтение .eml: в памяти только текстовые части.
+
+Письмо читается построчно из бинарного потока. Для каждой MIME-части разбираются
+только заголовки; тело text/plain и text/html (не вложение) накапливается с лимитом
+байт на часть и на письмо и декодируется через email.feedparser. Тела остальных
+частей (вложения, картинки) пропускаются без декодирования и хранения - от них
+остаются метаданные: имя, тип и размер. Когда набрано MIME_TEXT_BUDGET_CHARS
+непробельных символов текста (с запасом больше, чем модель берет из письма),
+чтение письма прекращается.
+
+Использование:
+    reader = MimeReader(file)
+    headers = reader.read_headers()      # Заголовки письма (EmailMessage без тела)
+    reader.read_body(decode)             # decode(content_type, payload, charset) -> str
+    reader.texts, reader.attachments, reader.stats
+"""
+
+from email import policy
+from email.parser import BytesFeedParser, BytesParser
+from typing import Callable
+
+# === КОНФИГУРАЦИЯ ===
+MIME_MAX_LINE_BYTES = 64 * 1024  # Более длинные строки читаются частями
+MIME_MAX_HEADER_BYTES = 256 * 1024  # Заголовки части сверх лимита отбрасываются
+MIME_MAX_PART_BYTES = 1024 * 1024  # Закодированных байт с одной текстовой части
+MIME_MAX_TEXT_BYTES = 4 * 1024 * 1024  # Закодированных байт текстовых частей со всего письма
+# Непробельных символов текста, после которых чтение письма прекращается: модель берет
+# max_seq_length токенов x MAX_WINDOWS_PER_EMAIL окон, это заметно меньше
+MIME_TEXT_BUDGET_CHARS = 32000
+MIME_MAX_DEPTH = 10  # Вложенность multipart и message/rfc822
+
+TEXT_TYPES = ('text/plain', 'text/html')
+
+
+class _BudgetFilled(Exception):
+    pass
+
+
+class MimeReader:
+    """Потоковый разбор одного письма из бинарного файла (или io.BytesIO)."""
+
+    def __init__(self, source, email_policy=policy.default):
+        self.source = source
+        self.policy = email_policy
+        self.headers = None
+        self.texts = []  # Декодированный текст частей в порядке письма
+        self.attachments = []  # {"name", "content_type", "size"}
+        self.stats = {'text_bytes': 0, 'skipped_bytes': 0, 'truncated_parts': 0, 'stopped_early': False}
+        self._boundaries = []  # Разделители открытых multipart, внешние первыми
+        self._pushback = None
+        self._decode = None
+        self._text_chars = 0
+        self._header_bytes = b""
+
+    # --- Чтение строк ---
+
+    def _readline(self) -> bytes:
+        if self._pushback is not None:
+            line, self._pushback = self._pushback, None
+            return line
+        return self.source.readline(MIME_MAX_LINE_BYTES)
+
+    def _delimiter(self, line: bytes):
+        """(разделитель, закрывающий ли) для строки-разделителя открытого multipart, иначе None."""
+        if not line.startswith(b'--') or not self._boundaries:
+            return None
+        stripped = line.rstrip(b' \t\r\n')
+        for boundary in reversed(self._boundaries):
+            if stripped == b'--' + boundary:
+                return boundary, False
+            if stripped == b'--' + boundary + b'--':
+                return boundary, True
+        return None
+
+    def _lines(self):
+        """Строки тела текущей части - до разделителя (он возвращается в поток) или конца файла."""
+        while True:
+            line = self._readline()
+            if not line:
+                return
+            if self._delimiter(line):
+                self._pushback = line
+                return
+            yield line
+
+    # --- Заголовки ---
+
+    def _read_header_block(self) -> bytes:
+        lines, size = [], 0
+        while True:
+            line = self._readline()
+            if not line or line in (b'\r\n', b'\n'):
+                break
+            if self._delimiter(line):
+                self._pushback = line
+                break
+            size += len(line)
+            if size <= MIME_MAX_HEADER_BYTES:
+                lines.append(line)
+        return b"".join(lines) + b"\n"  # Пустая строка - конец заголовков
+
+    def _parse_headers(self, raw: bytes):
+        return BytesParser(policy=self.policy).parsebytes(raw, headersonly=True)
+
+    def read_headers(self):
+        """Читает и разбирает заголовки письма (тело не читается)."""
+        self._header_bytes = self._read_header_block()
+        self.headers = self._parse_headers(self._header_bytes)
+        return self.headers
+
+    # --- Тело ---
+
+    def read_body(self, decode: Callable[[str, bytes, str], str]) -> "MimeReader":
+        """
+        Читает тело письма после read_headers.
+        :param decode: Декодирует текстовую часть: (content_type, payload, charset) -> текст
+        """
+        if self.headers is None:
+            self.read_headers()
+        self._decode = decode
+        try:
+            self._read_entity(self.headers, self._header_bytes, depth=0)
+        except _BudgetFilled:
+            self.stats['stopped_early'] = True
+        return self
+
+    def _read_entity(self, headers, raw_headers: bytes, depth: int):
+        maintype = headers.get_content_maintype()
+        if maintype == 'multipart' and depth < MIME_MAX_DEPTH:
+            boundary = headers.get_boundary()
+            if boundary:
+                self._read_multipart(boundary.encode('utf-8', errors='replace'), depth)
+            else:
+                self._read_text('text/plain', raw_headers)  # Как в email: без boundary - текст
+            return
+        if headers.get_content_type() == 'message/rfc822' and depth < MIME_MAX_DEPTH:
+            raw = self._read_header_block()
+            self._read_entity(self._parse_headers(raw), raw, depth + 1)
+            return
+        self._read_leaf(headers, raw_headers)
+
+    def _read_multipart(self, boundary: bytes, depth: int):
+        self._boundaries.append(boundary)
+        try:
+            for _ in self._lines():  # Преамбула
+                pass
+            while True:
+                line = self._readline()
+                delimiter = self._delimiter(line) if line else None
+                if delimiter is None or delimiter[0] != boundary:
+                    # Конец файла или разделитель внешнего multipart (часть не закрыта)
+                    if line:
+                        self._pushback = line
+                    return
+                if delimiter[1]:
+                    break
+                raw = self._read_header_block()
+                self._read_entity(self._parse_headers(raw), raw, depth + 1)
+        finally:
+            self._boundaries.pop()
+        if not self._boundaries:
+            return  # Эпилог письма не читается
+        for _ in self._lines():  # Эпилог до разделителя внешнего multipart
+            pass
+
+    def _read_leaf(self, headers, raw_headers: bytes):
+        content_type = headers.get_content_type()
+        if content_type in TEXT_TYPES and headers.get_content_disposition() != 'attachment':
+            self._read_text(content_type, raw_headers)
+            return
+
+        encoded = headers.get('Content-Transfer-Encoding', '').strip().lower() == 'base64'
+        size = 0
+        for line in self._lines():
+            size += len(line.strip()) if encoded else len(line)
+        self.stats['skipped_bytes'] += size
+        self.attachments.append({
+            "name": headers.get_filename(),
+            "content_type": content_type,
+            "size": size * 3 // 4 if encoded else size,  # base64 - оценка по длине кода
+        })
+
+    def _read_text(self, content_type: str, raw_headers: bytes):
+        limit = min(MIME_MAX_PART_BYTES, MIME_MAX_TEXT_BYTES - self.stats['text_bytes'])
+        feed_parser = BytesFeedParser(policy=self.policy)
+        feed_parser.feed(raw_headers)  # Уже заканчиваются пустой строкой
+        size, truncated, last = 0, False, None
+        for line in self._lines():
+            if size + len(line) > limit:
+                truncated = True
+                self.stats['skipped_bytes'] += len(line)
+                continue
+            size += len(line)
+            if last is not None:
+                feed_parser.feed(last)
+            last = line
+        if last is not None:
+            # Перевод строки перед разделителем относится к разделителю (RFC 2046)
+            feed_parser.feed(last.rstrip(b'\r\n') if self._pushback is not None else last)
+        part = feed_parser.close()
+        self.stats['text_bytes'] += size
+        self.stats['truncated_parts'] += truncated
+
+        payload = part.get_payload(decode=True)
+        if payload:
+            text = self._decode(content_type, payload, part.get_content_charset())
+            if text:
+                self.texts.append(text)
+                self._text_chars += sum(map(len, text.split()))  # Пробелы модель все равно схлопывает
+        if self._text_chars >= MIME_TEXT_BUDGET_CHARS or self.stats['text_bytes'] >= MIME_MAX_TEXT_BYTES:
+            raise _BudgetFilled()
@@ -0,0 +1,185 @@
+"""
+model_provider.py - Ленивая загрузка модели Sentence Transformer.
+
+Модель загружается при первом обращении к get_model(), а не при импорте,
+поэтому импорт classifier и вспомогательных модулей остается быстрым.
+Загрузка потокобезопасна: параллельные запросы дождутся одной загрузки.
+Для сервисов есть явный прогрев warm_up().
+Бэкенд инференса (torch / onnx / openvino) выбирается конфигурацией (см. backends.py),
+цепочка запасных моделей работает для каждого бэкенда.
+Опционально torch-модель квантуется в int8 (см. quantization.py).
+"""
+
+import os
+import threading
+
+# === ПУТИ ===
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_CACHE_DIR = os.path.join(PROJECT_ROOT, 'model_cache')
+
+# === ЦЕПОЧКА МОДЕЛЕЙ ===
+# Если основная модель не загрузилась, пробуем следующие по списку
+MODEL_CANDIDATES = [
+    ('sentence-transformers/paraphrase-multilingual-mpnet-base-v2', "основная модель"),
+    ('paraphrase-multilingual-MiniLM-L12-v2', "упрощенная модель"),
+    ('all-MiniLM-L6-v2', "легкая модель"),
+]
+
+# === РЕЖИМ ИНФЕРЕНСА ===
+INFERENCE_BACKEND = "torch"  # torch / onnx / openvino
+QUANTIZE_INT8 = False  # Int8 динамическая квантизация линейных слоев (CPU, только torch)
+
+_model = None
+_model_name = None
+_model_id = None
+_lock = threading.Lock()
+
+
+def configure(quantize_int8: bool = None, backend: str = None):
+    """
+    Меняет режим загрузки модели.
+    Если модель уже загружена в другом режиме, она перезагрузится при следующем обращении.
+    """
+    global QUANTIZE_INT8, INFERENCE_BACKEND, _model, _model_name, _model_id
+    with _lock:
+        changed = False
+        if quantize_int8 is not None and bool(quantize_int8) != QUANTIZE_INT8:
+            QUANTIZE_INT8 = bool(quantize_int8)
+            changed = True
+        if backend is not None and backend != INFERENCE_BACKEND:
+            from backends import INFERENCE_BACKENDS
+
+            if backend not in INFERENCE_BACKENDS:
+                raise ValueError(f"Неизвестный бэкенд '{backend}'. Доступны: {', '.join(INFERENCE_BACKENDS)}")
+            INFERENCE_BACKEND = backend
+            changed = True
+        if changed:
+            _model, _model_name, _model_id = None, None, None
+
+
+def _quantization_enabled() -> bool:
+    """Int8 квантизация через torch применяется только к torch-бэкенду."""
+    return QUANTIZE_INT8 and INFERENCE_BACKEND == "torch"
+
+
+def _load_candidate(name: str):
+    """Загружает одну модель из цепочки с учетом режима инференса."""
+    from backends import load_backend_model
+
+    if _quantization_enabled():
+        from quantization import load_quantized_model
+
+        model = load_quantized_model(MODEL_CACHE_DIR, name)
+        if model is not None:
+            return model
+
+    model = load_backend_model(name, INFERENCE_BACKEND, MODEL_CACHE_DIR)
+
+    if _quantization_enabled():
+        from quantization import quantize_model, save_quantized_model
+
+        print("🔧 Int8 квантизация линейных слоев...")
+        model = quantize_model(model)
+        try:
+            save_quantized_model(model, MODEL_CACHE_DIR, name)
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить квантованную модель: {e}")
+    return model
+
+
+def _load_model():
+    """Загружает первую доступную модель из цепочки MODEL_CANDIDATES."""
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    print(f"🤖 Кэш моделей: {MODEL_CACHE_DIR}")
+    print(f"🤖 Загрузка модели Sentence Transformer (бэкенд: {INFERENCE_BACKEND})...")
+    if QUANTIZE_INT8 and not _quantization_enabled():
+        print(f"⚠️  Int8 квантизация поддерживается только для бэкенда torch, игнорируем")
+
+    from backends import check_backend_available
+
+    check_backend_available(INFERENCE_BACKEND)
+
+    last_error = None
+    for i, (name, description) in enumerate(MODEL_CANDIDATES):
+        if i > 0:
+            print(f"🔄 Пробуем {description}: {name}")
+        try:
+            model = _load_candidate(name)
+            print(f"✅ Модель '{name}' загружена в {MODEL_CACHE_DIR}")
+            _print_model_info(model, name)
+            return model, name
+        except Exception as e:
+            print(f"⚠️ Ошибка загрузки модели '{name}': {e}")
+            last_error = e
+
+    print(f"❌ Критическая ошибка: не удалось загрузить ни одну модель")
+    raise RuntimeError("Не удалось загрузить ни одну модель") from last_error
+
+
+def _print_model_info(model, name: str):
+    print(f"\n📊 Информация о модели:")
+    print(f"   • Имя: {name}")
+    print(f"   • Размерность эмбеддингов: {model.get_sentence_embedding_dimension()}")
+    print(f"   • Макс. длина последовательности: {model.max_seq_length}")
+    print(f"   • Поддерживаемые языки: мультиязычная (включая RU/EN)")
+    print(f"   • Бэкенд: {INFERENCE_BACKEND}")
+    print(f"   • Int8 квантизация: {'да' if _quantization_enabled() else 'нет'}")
+
+
+def _make_model_id(name: str) -> str:
+    model_id = name
+    if INFERENCE_BACKEND != "torch":
+        model_id += f"@{INFERENCE_BACKEND}"
+    if _quantization_enabled():
+        model_id += "+int8"
+    return model_id
+
+
+def configured_model_id() -> str:
+    """
+    Идентификатор модели, которую загрузит get_model(), если основная модель доступна.
+    Не загружает модель: фактический идентификатор (с учетом запасных моделей) - get_model_id().
+    """
+    return _model_id or _make_model_id(MODEL_CANDIDATES[0][0])
+
+
+def get_model():
+    """Возвращает модель, загружая ее при первом вызове."""
+    global _model, _model_name, _model_id
+    if _model is None:
+        with _lock:
+            if _model is None:
+                model, name = _load_model()
+                _model_name = name
+                _model_id = _make_model_id(name)
+                _model = model
+    return _model
+
+
+def get_model_name() -> str:
+    """Имя загруженной модели (загружает модель при необходимости)."""
+    get_model()
+    return _model_name
+
+
+def get_model_id() -> str:
+    """
+    Идентификатор модели вместе с бэкендом и режимом инференса.
+    Используется в ключах кэшей: эмбеддинги разных бэкендов и квантованной модели
+    немного отличаются от эталонных fp32.
+    """
+    get_model()
+    return _model_id
+
+
+def is_loaded() -> bool:
+    """Загружена ли модель."""
+    return _model is not None
+
+
+def warm_up():
+    """Загружает модель и прогоняет через нее короткий текст, чтобы первый запрос не ждал."""
+    model = get_model()
+    model.encode(["прогрев модели"], show_progress_bar=False)
+    print("🔥 Модель прогрета")
+    return model
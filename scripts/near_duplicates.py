@@ -0,0 +1,230 @@
+"""
+near_duplicates.py - Поиск почти одинаковых писем (шаблонных рассылок, чеков, подтверждений).
+
+Тело письма нормализуется (нижний регистр, числа и ссылки заменяются метками),
+режется на шинглы по NEAR_DUP_SHINGLE_WORDS слов, и по ним считается 64-битный SimHash.
+Письма-близнецы отличаются не больше чем на NEAR_DUP_MAX_DISTANCE бит. Для поиска хэш
+делится на NEAR_DUP_MAX_DISTANCE + 1 полос: у близнецов хотя бы одна полоса совпадает
+целиком (принцип Дирихле), поэтому поиск - несколько обращений к словарю.
+
+Индекс хранит классификацию первого письма кластера и размер кластера. Он привязан
+к отпечатку категорий и модели и хранится в model_cache/near_duplicates/.
+"""
+
+import hashlib
+import heapq
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+# === КОНФИГУРАЦИЯ ===
+NEAR_DUP_ENABLED = True  # Переиспользовать классификацию почти одинаковых писем
+NEAR_DUP_MAX_DISTANCE = 3  # Максимальное расстояние Хэмминга между SimHash близнецов (из 64 бит)
+NEAR_DUP_SHINGLE_WORDS = 3  # Слов в шингле
+NEAR_DUP_MIN_SHINGLES = 16  # Короче - SimHash ненадежен, письмо не индексируется
+NEAR_DUP_SCAN_CHARS = 20000  # Сколько символов тела учитывать
+NEAR_DUP_MAX_ENTRIES = 50000  # Лимит кластеров в индексе
+
+HASH_BITS = 64
+
+_URL = re.compile(r'(?:https?://|www\.)\S+|[\w.+-]+@[\w-]+(?:\.[\w-]+)+', re.IGNORECASE)
+_NUMBER = re.compile(r'\d+([.,:/-]\d+)*')
+_WORD = re.compile(r'\w+')
+
+_indexes = {}  # путь -> NearDuplicateIndex
+
+
+def shingles(text: str) -> List[str]:
+    """Шинглы нормализованного текста: ссылки, адреса и числа заменены метками."""
+    text = text[:NEAR_DUP_SCAN_CHARS].lower()
+    text = _NUMBER.sub(' 0 ', _URL.sub(' url ', text))
+    words = _WORD.findall(text)
+    size = NEAR_DUP_SHINGLE_WORDS
+    return [' '.join(words[i:i + size]) for i in range(max(0, len(words) - size + 1))]
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-битный SimHash текста или None, если текст слишком короткий."""
+    import numpy as np
+
+    grams = set(shingles(text or ""))
+    if len(grams) < NEAR_DUP_MIN_SHINGLES:
+        return None
+    digests = b''.join(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest() for gram in grams)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(grams), HASH_BITS)
+    # Бит SimHash = большинство голосов шинглов по этому биту
+    majority = bits.sum(axis=0) * 2 > len(grams)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+
+class NearDuplicateIndex:
+    """Индекс кластеров почти одинаковых писем с их классификацией."""
+
+    def __init__(self, path: str, max_distance: int = NEAR_DUP_MAX_DISTANCE,
+                 max_entries: int = NEAR_DUP_MAX_ENTRIES):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.entries = {}  # id -> {"simhash", "categories", "confidence", "is_other", "filename", "count", "last_seen"}
+        self._next_id = 0
+        self._bands = {}  # (номер полосы, значение полосы) -> set(id)
+        band_count = max_distance + 1
+        width = HASH_BITS // band_count
+        self._band_shifts = [(i * width, width if i < band_count - 1 else HASH_BITS - i * width)
+                             for i in range(band_count)]
+        self.stats = {'lookups': 0, 'reused': 0, 'added': 0, 'evictions': 0}
+        self._load()
+
+    def _band_keys(self, value: int):
+        return [(i, (value >> shift) & ((1 << width) - 1)) for i, (shift, width) in enumerate(self._band_shifts)]
+
+    def _index(self, entry_id: int, value: int):
+        for key in self._band_keys(value):
+            self._bands.setdefault(key, set()).add(entry_id)
+
+    def _unindex(self, entry_id: int, value: int):
+        for key in self._band_keys(value):
+            ids = self._bands.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del self._bands[key]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f).get('entries', [])
+        except Exception as e:
+            print(f"⚠️  Индекс почти одинаковых писем поврежден, начинаем заново: {e}")
+            return
+        for entry in stored:
+            entry['simhash'] = int(entry['simhash'], 16)
+            entry['categories'] = [tuple(pair) for pair in entry['categories']]
+            self._add_entry(entry)
+
+    def save(self):
+        """Атомарно записывает индекс (только кластеры с готовой классификацией)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        stored = [dict(entry, simhash=f"{entry['simhash']:016x}")
+                  for entry in self.entries.values() if entry.get('categories')]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'entries': stored}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset_stats(self):
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def _add_entry(self, entry: dict) -> int:
+        entry_id = self._next_id
+        self._next_id += 1
+        self.entries[entry_id] = entry
+        self._index(entry_id, entry['simhash'])
+        return entry_id
+
+    def find(self, value: int) -> Optional[int]:
+        """Ближайший кластер не дальше max_distance бит или None."""
+        self.stats['lookups'] += 1
+        best_id, best_distance = None, self.max_distance + 1
+        for key in self._band_keys(value):
+            for entry_id in self._bands.get(key, ()):
+                distance = (self.entries[entry_id]['simhash'] ^ value).bit_count()
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+        return best_id
+
+    def add(self, value: int, filename: str, result: dict = None) -> int:
+        """
+        Новый кластер. Без result кластер ждет классификации своего первого письма
+        (resolve), чтобы близнецы из того же запуска не кодировались повторно.
+        """
+        self.stats['added'] += 1
+        entry_id = self._add_entry({'simhash': value, 'categories': None, 'confidence': 0.0,
+                                    'is_other': False, 'filename': filename, 'count': 1,
+                                    'last_seen': time.time()})
+        if result is not None:
+            self.resolve(entry_id, result)
+        return entry_id
+
+    def resolve(self, entry_id: int, result: dict):
+        """Сохраняет классификацию первого письма кластера."""
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return
+        if not result.get('processed'):
+            # Первое письмо не классифицировано - кластер не переиспользуется
+            self._unindex(entry_id, entry['simhash'])
+            del self.entries[entry_id]
+            return
+        entry['categories'] = list(result['categories'])
+        entry['confidence'] = result.get('confidence', result['categories'][0][1])
+        entry['is_other'] = bool(result.get('is_other_category', False))
+
+    def record_reuse(self, entry_id: int):
+        entry = self.entries[entry_id]
+        entry['count'] += 1
+        entry['last_seen'] = time.time()
+        self.stats['reused'] += 1
+
+    def evict(self):
+        """Вытесняет давно не встречавшиеся кластеры сверх лимита."""
+        overflow = len(self.entries) - self.max_entries
+        if overflow <= 0:
+            return
+        for entry_id in heapq.nsmallest(overflow, self.entries, key=lambda i: self.entries[i]['last_seen']):
+            self._unindex(entry_id, self.entries[entry_id]['simhash'])
+            del self.entries[entry_id]
+        self.stats['evictions'] += overflow
+
+    def cluster_sizes(self) -> List[int]:
+        return sorted((entry['count'] for entry in self.entries.values()), reverse=True)
+
+
+def get_near_duplicate_index(cache_root: str, fingerprint: str) -> NearDuplicateIndex:
+    """Индекс для текущих категорий и модели (fingerprint из category_cache)."""
+    path = os.path.join(cache_root, 'near_duplicates', f"{fingerprint[:16]}.json")
+    index = _indexes.get(path)
+    if index is None or index.max_distance != NEAR_DUP_MAX_DISTANCE:
+        index = _indexes[path] = NearDuplicateIndex(path)
+    return index
+
+
+def cluster_report(index: NearDuplicateIndex, top: int = 10) -> Dict[str, object]:
+    """Отчет о размерах кластеров: распределение по корзинам и самые крупные кластеры."""
+    sizes = index.cluster_sizes()
+    buckets = {'1': 0, '2-5': 0, '6-20': 0, '21-100': 0, '101+': 0}
+    for size in sizes:
+        if size == 1:
+            buckets['1'] += 1
+        elif size <= 5:
+            buckets['2-5'] += 1
+        elif size <= 20:
+            buckets['6-20'] += 1
+        elif size <= 100:
+            buckets['21-100'] += 1
+        else:
+            buckets['101+'] += 1
+    largest = sorted(index.entries.values(), key=lambda entry: entry['count'], reverse=True)[:top]
+    return {
+        'clusters': len(sizes),
+        'emails': sum(sizes),
+        'buckets': buckets,
+        'largest': [{'filename': entry['filename'], 'size': entry['count'],
+                     'category': entry['categories'][0][0] if entry.get('categories') else None}
+                    for entry in largest if entry['count'] > 1],
+    }
+
+
+def print_cluster_report(index: NearDuplicateIndex):
+    report = cluster_report(index)
+    stats = index.stats
+    print(f"🧬 Почти одинаковые письма: переиспользовано {stats['reused']}/{stats['lookups']}, "
+          f"кластеров {report['clusters']} (писем в них {report['emails']}), вытеснено {stats['evictions']}")
+    print(f"   • Размеры кластеров: " + ", ".join(f"{name}: {count}" for name, count in report['buckets'].items()))
+    for cluster in report['largest'][:5]:
+        print(f"   • {cluster['size']} писем как {cluster['filename']} → {cluster['category']}")
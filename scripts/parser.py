@@ -1,89 +1,482 @@
+import codecs
+import collections
+import io
+import itertools
 import os
 import re
-from email import message_from_file
+import signal
+import sys
+import time
+from email import policy
+from email.utils import parseaddr
+from functools import lru_cache
+from typing import Iterable, Iterator
+from discovery import FileRecord, iter_files
 from extract_msg import Message as MsgFile
-import chardet  # Для автоопределения кодировки
+from header_rules import HEADER_RULES_ENABLED, get_header_rules, header_record
+from mime_reader import MimeReader
 
-def parse_emails(folder_path: str) -> list:
+# === КОНФИГУРАЦИЯ ===
+CHARDET_SAMPLE_BYTES = 64 * 1024  # chardet смотрит только на начало части
+# Кодировки, которые пробуются строго до chardet (windows-1251 - синоним cp1251)
+FALLBACK_ENCODINGS = ['utf-8', 'cp1251']
+EMAIL_POLICY = policy.default  # Заголовки декодируются парсером (RFC 2047)
+LEARNED_CHARSETS_MAX = 10000  # Отправителей/почтовых клиентов в кэше выученных кодировок
+PARSE_WORKERS = 1  # Процессов парсинга (1 = в основном процессе)
+PARSE_CHUNK_SIZE = 32  # Файлов в одной задаче процессу парсинга
+PARSE_FILE_TIMEOUT_SEC = 120  # Лимит на один файл в процессе парсинга (только Unix)
+
+# Метки кодировок из писем, которые codecs не знает или которые на практике означают надмножество
+CHARSET_ALIASES = {
+    'win-1251': 'cp1251',
+    'x-cp1251': 'cp1251',
+    'cp-1251': 'cp1251',
+    'windows-1251': 'cp1251',
+    'koi8r': 'koi8_r',
+    'x-mac-cyrillic': 'mac_cyrillic',
+    'iso-8859-1': 'cp1252',  # Почтовые клиенты Windows пишут cp1252 под меткой latin-1
+    'gb2312': 'gb18030',
+    'ks_c_5601-1987': 'cp949',
+    'unicode-1-1-utf-8': 'utf-8',
+}
+
+# Какой путь декодирования сработал для частей письма (см. print_decode_stats)
+DECODE_STATS = {'ascii': 0, 'declared': 0, 'declared_failed': 0, 'learned': 0,
+                'cascade': 0, 'chardet': 0, 'latin1': 0}
+_learned_charsets = {}  # ключ отправителя/клиента -> кодировка, найденная каскадом
+
+def parse_emails(folder_path: str, header_rules: bool = HEADER_RULES_ENABLED,
+                 workers: int = PARSE_WORKERS) -> list:
     """
     Парсит все .eml и .msg файлы из указанной папки.
     :param folder_path: Путь к папке с входящими письмами.
-    :return: Список словарей с данными писем.
-    """
-    emails = []
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
-        if file_name.endswith(".eml"):
-            email_data = parse_eml(file_path)
-        elif file_name.endswith(".msg"):
-            email_data = parse_msg(file_path)
+    :param header_rules: Не декодировать тело писем, которые решены правилами по заголовкам.
+    :param workers: Процессов парсинга (1 = в основном процессе).
+    :return: Список словарей с данными писем в порядке обхода папки (discovery.iter_files).
+    """
+    parsed, errors, stats = parse_files(iter_files(folder_path), header_rules, workers)
+    print(f"✅ Успешно распарсено писем: {len(parsed)}")
+    print_parse_stats(stats, errors)
+    return [email_data for _, email_data in parsed]
+
+def parse_files(files: Iterable, header_rules: bool = HEADER_RULES_ENABLED, workers: int = PARSE_WORKERS,
+                chunk_size: int = PARSE_CHUNK_SIZE):
+    """
+    Парсит файлы (последовательно или пулом процессов) в порядке входа.
+    Вход читается лениво: с генератором discovery.iter_files парсинг начинается
+    с первого найденного файла, а размеры из FileRecord не запрашиваются повторно.
+    Ошибка, зависание или падение процесса на одном файле дает запись об ошибке
+    только для этого файла.
+    :param files: Пути или FileRecord (discovery.iter_files)
+    :return: ([(путь, письмо)], [{"filename", "path", "error"}], статистика)
+    """
+    stats = new_parse_stats(workers)
+    order = []  # Пути в порядке входа
+
+    def paths():
+        for item in files:
+            path, size = (item.path, item.size) if isinstance(item, FileRecord) else (item, None)
+            if size is None:
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    size = 0
+            order.append(path)
+            stats['files'] += 1
+            stats['bytes'] += size
+            yield path
+
+    started = time.perf_counter()
+    by_path = {path: (email_data, error)
+               for path, email_data, error in iter_parsed(paths(), header_rules, workers, chunk_size, stats)}
+    stats['seconds'] = time.perf_counter() - started
+
+    parsed, errors = [], []
+    for path in order:
+        email_data, error = by_path[path]
+        if email_data:
+            parsed.append((path, email_data))
         else:
-            continue  # Пропускаем неподдерживаемые форматы
-        
-        if email_data:  # Добавляем только если парсинг успешен
-            emails.append(email_data)
-    
-    print(f"✅ Успешно распарсено писем: {len(emails)}")
-    return emails
-
-def parse_eml(file_path: str) -> dict:
-    """Парсит .eml файл."""
-    try:
-        # Определяем кодировку файла
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-            detected = chardet.detect(raw_data)
-            encoding = detected['encoding'] or 'utf-8'
-        
-        # Пробуем разные кодировки если обнаружена неправильная
-        for enc in [encoding, 'utf-8', 'cp1251', 'windows-1251', 'koi8-r', 'iso-8859-5', 'latin-1']:
+            errors.append({"filename": os.path.basename(path), "path": path, "error": error})
+    stats['parsed'], stats['errors'] = len(parsed), len(errors)
+    return parsed, errors, stats
+
+def new_parse_stats(workers: int = PARSE_WORKERS) -> dict:
+    """Счетчики parse_files / iter_parsed (busy_sec - суммарное время разбора файлов по процессам)."""
+    return {'files': 0, 'parsed': 0, 'errors': 0, 'crashes': 0, 'workers': max(1, workers),
+            'bytes': 0, 'seconds': 0.0, 'busy_sec': 0.0}
+
+def iter_parsed(paths: Iterable[str], header_rules: bool = HEADER_RULES_ENABLED, workers: int = PARSE_WORKERS,
+                chunk_size: int = PARSE_CHUNK_SIZE, stats: dict = None) -> Iterator[tuple]:
+    """
+    Генератор parse_files: (путь, письмо или None, ошибка или None) по мере готовности.
+    Вход читается лениво; порядок - порядок входа, кроме файлов, повторенных после
+    падения процесса. Изоляция ошибок та же, что у parse_files.
+    :param stats: Счетчики (new_parse_stats): дополняются crashes и busy_sec
+    """
+    stats = stats if stats is not None else new_parse_stats(workers)
+    if workers <= 1:
+        for path in paths:
+            outputs, _, seconds = _parse_chunk([path], header_rules)
+            stats['busy_sec'] += seconds
+            yield from outputs
+    else:
+        yield from _parse_in_pool(iter(paths), header_rules, workers, max(1, chunk_size), stats)
+
+class _FileTimeout(BaseException):
+    """Не Exception: обработчики ошибок внутри парсера не должны его перехватывать."""
+
+def _on_timeout(signum, frame):
+    raise _FileTimeout()
+
+def _init_parse_worker(scripts_dir: str):
+    """Инициализация процесса парсинга: путь к модулям и лимит времени на файл."""
+    if scripts_dir not in sys.path:
+        sys.path.insert(0, scripts_dir)
+    if hasattr(signal, 'SIGALRM'):
+        signal.signal(signal.SIGALRM, _on_timeout)
+
+def _parse_chunk(paths: Iterable, header_rules: bool, timeout: float = None):
+    """
+    Парсит пачку файлов. Исключения и превышение лимита времени превращаются
+    в ошибку файла. Возвращает [(путь, письмо или None, ошибка или None)], прирост DECODE_STATS
+    и время разбора пачки.
+    """
+    started = time.perf_counter()
+    decode_before = dict(DECODE_STATS)
+    use_alarm = timeout and hasattr(signal, 'SIGALRM')
+    outputs = []
+    for path in paths:
+        try:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, timeout)
+            email_data = parse_file(path, header_rules)
+            error = None if email_data else "Не удалось распарсить"
+        except _FileTimeout:
+            email_data, error = None, f"Превышен лимит {timeout:.0f} с на файл"
+        except Exception as e:
+            email_data, error = None, f"{type(e).__name__}: {e}"
+        finally:
+            if use_alarm:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+        outputs.append((path, email_data, error))
+    return (outputs, {name: DECODE_STATS[name] - decode_before[name] for name in DECODE_STATS},
+            time.perf_counter() - started)
+
+def _parse_in_pool(paths: Iterator[str], header_rules: bool, workers: int, chunk_size: int,
+                   stats: dict) -> Iterator[tuple]:
+    """
+    Генератор: раздает файлы пачками пулу процессов по мере чтения входа (в работе не больше
+    двух пачек на процесс). Если процесс упал (BrokenProcessPool), незавершенные файлы
+    повторяются по одному в пуле из одного процесса: задачи там выполняются по порядку,
+    поэтому первая сломанная задача - файл, из-за которого процесс упал. Он получает
+    запись об ошибке, остальные снова идут пачками, затем продолжается чтение входа.
+    """
+    stream = _chunks(paths, chunk_size)
+    retry = []
+    while True:
+        if retry:
+            pending = iter(retry)
+            broken = yield from _run_pool(([path] for path in pending), header_rules, 1, stats)
+            retry = []
+            if broken:
+                stats['crashes'] += 1
+                culprit = broken[0]
+                print(f"❌ Процесс парсинга упал на файле {os.path.basename(culprit)}")
+                yield culprit, None, "Процесс парсинга аварийно завершился"
+                rest = iter(broken[1:] + list(pending))  # Оборванные и еще не отданные пулу
+                stream = itertools.chain(_chunks(rest, chunk_size), stream)
+            continue
+        broken = yield from _run_pool(stream, header_rules, workers, stats)
+        if not broken:
+            return
+        stats['crashes'] += 1
+        print(f"⚠️  Процесс парсинга упал, {len(broken)} файлов повторяются по одному")
+        retry = broken
+
+def _chunks(paths: Iterator[str], chunk_size: int) -> Iterator[list]:
+    return iter(lambda: list(itertools.islice(paths, chunk_size)), [])
+
+def _run_pool(tasks: Iterator[list], header_rules: bool, workers: int, stats: dict):
+    """
+    Генератор: выполняет задачи в одном пуле процессов и отдает результаты файлов
+    по мере готовности пачек. После падения процесса новые задачи не берутся.
+    :return: (значение генератора) файлы задач, оборванных падением процесса
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    context = multiprocessing.get_context("spawn")
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    broken = []
+
+    def collect(task, future):
+        try:
+            chunk_outputs, decode_delta, seconds = future.result()
+        except BrokenProcessPool:
+            broken.extend(task)
+            return []
+        except Exception as e:
+            chunk_outputs, decode_delta, seconds = [(path, None, f"{type(e).__name__}: {e}") for path in task], {}, 0.0
+        stats['busy_sec'] += seconds
+        for name, value in decode_delta.items():
+            DECODE_STATS[name] += value
+        return chunk_outputs
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_parse_worker, initargs=(scripts_dir,)) as executor:
+        in_flight = collections.deque()
+        for task in tasks:
             try:
-                with open(file_path, 'r', encoding=enc) as f:
-                    msg = message_from_file(f)
+                in_flight.append((task, executor.submit(_parse_chunk, task, header_rules, PARSE_FILE_TIMEOUT_SEC)))
+            except BrokenProcessPool:
+                broken.extend(task)
                 break
-            except UnicodeDecodeError:
-                continue
-        else:
-            # Если все кодировки не подошли, пробуем с игнорированием ошибок
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                msg = message_from_file(f)
-        
+            while len(in_flight) >= 2 * workers or (broken and in_flight):
+                yield from collect(*in_flight.popleft())
+            if broken:
+                break
+        while in_flight:
+            yield from collect(*in_flight.popleft())
+    return broken
+
+def print_parse_stats(stats: dict, errors: list = ()):
+    """Пропускная способность парсинга и ошибки по файлам."""
+    seconds = stats['seconds']
+    files_per_sec = stats['files'] / seconds if seconds > 0 else 0.0
+    mb_per_sec = stats['bytes'] / (1024 * 1024) / seconds if seconds > 0 else 0.0
+    print(f"⚡ Парсинг: {stats['files']} файлов за {seconds:.2f} с ({stats['workers']} проц.) - "
+          f"{files_per_sec:.1f} файлов/сек, {mb_per_sec:.1f} МБ/сек; "
+          f"ошибок {stats['errors']}, падений процессов {stats['crashes']}")
+    for error in list(errors)[:5]:
+        print(f"   ❌ {error['filename']}: {error['error']}")
+    if len(errors) > 5:
+        print(f"   ... и еще {len(errors) - 5}")
+
+def iter_emails(folder_path: str, header_rules: bool = HEADER_RULES_ENABLED):
+    """
+    Лениво парсит .eml и .msg файлы папки (с подпапками) по одному, по мере обхода
+    (для потоковой обработки).
+    :return: Генератор словарей с данными писем.
+    """
+    for record in iter_files(folder_path):
+        email_data = parse_file(record.path, header_rules)
+        if email_data:  # Отдаем только успешно распарсенные
+            yield email_data
+
+def parse_file(file_path: str, header_rules: bool = HEADER_RULES_ENABLED) -> dict:
+    """Парсит один .eml или .msg файл. None - если парсинг не удался."""
+    if file_path.endswith(".msg"):
+        return parse_msg(file_path, header_rules)
+    return parse_eml(file_path, header_rules)
+
+OLE_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # Сигнатура .msg (OLE2)
+
+def parse_bytes(data: bytes, filename: str = "message.eml", header_rules: bool = HEADER_RULES_ENABLED) -> dict:
+    """Парсит письмо из байтов (например, из HTTP-запроса); .msg определяется по сигнатуре."""
+    if data[:8] == OLE_MAGIC or filename.endswith(".msg"):
+        return _parse_msg_source(data, filename, header_rules)
+    return parse_eml_bytes(data, filename, header_rules)
+
+def read_skipped_body(email_data: dict) -> dict:
+    """
+    Дочитывает тело письма, которое парсер пропустил из-за правила по заголовкам
+    (например, если классификатор отклонил правило с неизвестной категорией).
+    :return: Письмо с телом или исходное письмо, если дочитать не удалось.
+    """
+    source = email_data.get("body_source")
+    if source is None:
+        return email_data
+    if isinstance(source, bytes):
+        full = parse_bytes(source, email_data.get("filename", "message.eml"), header_rules=False)
+    else:
+        full = parse_file(source, header_rules=False)
+    if not full:
+        return email_data
+    full["filename"] = email_data.get("filename", full["filename"])
+    return full
+
+def match_header_rules(record: dict):
+    """Правило по заголовкам, сработавшее для письма, или None."""
+    try:
+        return get_header_rules().match(record)
+    except Exception as e:
+        print(f"⚠️  Ошибка правил по заголовкам: {e}")
+        return None
+
+def parse_eml(file_path: str, header_rules: bool = HEADER_RULES_ENABLED) -> dict:
+    """Парсит .eml файл. Тело письма, решенного правилом по заголовкам, не читается."""
+    filename = os.path.basename(file_path)
+    try:
+        with open(file_path, 'rb') as f:
+            return _read_email(f, filename, header_rules, file_path)
+    except OSError as e:
+        print(f"❌ Ошибка чтения файла {filename}: {e}")
+        return None
+
+def parse_eml_bytes(raw_data: bytes, filename: str, header_rules: bool = HEADER_RULES_ENABLED) -> dict:
+    """Парсит .eml из байтов."""
+    return _read_email(io.BytesIO(raw_data), filename, header_rules, raw_data)
+
+def _read_email(source, filename: str, header_rules: bool = HEADER_RULES_ENABLED, body_source=None) -> dict:
+    """
+    Читает письмо из бинарного потока через MimeReader: сначала заголовки, затем,
+    если правило по заголовкам не сработало, только текстовые части.
+    Вложения не декодируются, от них остаются метаданные.
+    :param body_source: Путь или байты письма, по которым тело можно дочитать (read_skipped_body)
+    """
+    try:
+        reader = MimeReader(source, EMAIL_POLICY)
+        msg = reader.read_headers()
+        headers = header_record(msg)
+        rule = match_header_rules(headers) if header_rules else None
+        subject = str(msg.get("Subject", "") or "")
+        body = ""
+        if not rule:
+            key = charset_key(msg)
+            reader.read_body(lambda content_type, payload, charset: _part_text(content_type, payload, charset, key))
+            body = (f"Тема письма: {subject}\n\n" if subject.strip() else "") + "".join(reader.texts)
         return {
-            "filename": os.path.basename(file_path),
-            "subject": msg.get("Subject", ""),
-            "body": get_email_body(msg),
-            "attachments": []  # (Добавьте обработку вложений при необходимости)
+            "filename": filename,
+            "subject": subject,
+            "body": body.strip(),
+            "attachments": [attachment["name"] for attachment in reader.attachments if attachment["name"]],
+            "attachment_meta": reader.attachments,  # {"name", "content_type", "size"}
+            "headers": headers,
+            "header_rule": rule,
+            "body_source": body_source if rule else None
         }
     except Exception as e:
-        print(f"❌ Ошибка парсинга файла {os.path.basename(file_path)}: {e}")
+        print(f"❌ Ошибка парсинга файла {filename}: {e}")
         return None
 
-def parse_msg(file_path: str) -> dict:
+def _part_text(content_type: str, payload: bytes, charset: str, key: str) -> str:
+    """Текст текстовой части письма: text/html переводится в текст, text/plain декодируется."""
+    if content_type == "text/html":
+        html_text = html_to_text(payload, charset, key)
+        return html_text + "\n" if html_text else ""
+    return decode_payload(payload, charset, key)
+
+def parse_msg(file_path: str, header_rules: bool = HEADER_RULES_ENABLED) -> dict:
     """Парсит .msg файл."""
+    return _parse_msg_source(file_path, os.path.basename(file_path), header_rules)
+
+def _parse_msg_source(source, filename: str, header_rules: bool = HEADER_RULES_ENABLED) -> dict:
+    """Парсит .msg по пути к файлу или из байтов (extract_msg принимает и то, и другое)."""
     try:
-        msg = MsgFile(file_path)
+        msg = MsgFile(source)
+        headers = header_record(msg.header) if msg.header is not None else {}
+        rule = match_header_rules(headers) if header_rules else None
         return {
-            "filename": os.path.basename(file_path),
+            "filename": filename,
             "subject": msg.subject,
-            "body": msg.body,
-            "attachments": [att.longFilename for att in msg.attachments]
+            "body": "" if rule else msg.body,
+            "attachments": [att.longFilename for att in msg.attachments],
+            "headers": headers,
+            "header_rule": rule,
+            "body_source": source if rule else None
         }
     except Exception as e:
-        print(f"❌ Ошибка парсинга .msg файла {os.path.basename(file_path)}: {e}")
+        print(f"❌ Ошибка парсинга .msg файла {filename}: {e}")
         return None
 
-def html_to_text(html_content: bytes) -> str:
-    """Конвертирует HTML в текст без использования BeautifulSoup."""
+@lru_cache(maxsize=256)
+def normalize_charset(charset: str):
+    """Каноническое имя кодека для метки charset из письма или None, если кодек неизвестен."""
+    if not charset:
+        return None
+    label = charset.strip().strip('"\'').lower()
+    label = CHARSET_ALIASES.get(label, label)
     try:
-        # Пробуем разные кодировки
-        for encoding in ['utf-8', 'cp1251', 'windows-1251', 'koi8-r', 'iso-8859-5', 'latin-1']:
-            try:
-                html_decoded = html_content.decode(encoding, errors='strict')
-                break
-            except UnicodeDecodeError:
-                continue
-        else:
-            html_decoded = html_content.decode('utf-8', errors='ignore')
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+def charset_key(msg) -> str:
+    """Ключ кэша выученных кодировок: почтовый клиент, а если он не указан - домен отправителя."""
+    mailer = msg.get('X-Mailer') or msg.get('User-Agent')
+    if mailer:
+        return f"mailer:{' '.join(str(mailer).split())[:100]}"
+    address = parseaddr(str(msg.get('From', '') or ''))[1].lower()
+    return f"domain:{address.rpartition('@')[2]}" if address else None
+
+def decode_payload(payload: bytes, charset: str = None, key: str = None) -> str:
+    """
+    Декодирует содержимое части письма (переводы строк \r\n -> \n).
+    Порядок: объявленный charset части, кодировка, выученная для отправителя (key),
+    затем медленный каскад FALLBACK_ENCODINGS и chardet по началу части.
+    """
+    return _decode_bytes(payload, charset, key).replace('\r\n', '\n')
+
+def _decode_bytes(payload: bytes, charset: str = None, key: str = None) -> str:
+    if payload.isascii():
+        DECODE_STATS['ascii'] += 1
+        return payload.decode('ascii')
+
+    declared = normalize_charset(charset)
+    if declared:
+        try:
+            text = payload.decode(declared)
+            DECODE_STATS['declared'] += 1
+            return text
+        except UnicodeDecodeError:
+            DECODE_STATS['declared_failed'] += 1
+
+    learned = _learned_charsets.get(key) if key else None
+    if learned and learned != declared:
+        try:
+            text = payload.decode(learned)
+            DECODE_STATS['learned'] += 1
+            return text
+        except UnicodeDecodeError:
+            pass
+
+    DECODE_STATS['cascade'] += 1
+    for encoding in FALLBACK_ENCODINGS:
+        if encoding in (declared, learned):
+            continue
+        try:
+            text = payload.decode(encoding)
+            _learn_charset(key, encoding)
+            return text
+        except UnicodeDecodeError:
+            continue
+    try:
+        import chardet  # Только для частей, которые не декодировались
+
+        encoding = normalize_charset(chardet.detect(payload[:CHARDET_SAMPLE_BYTES])['encoding'])
+        if encoding:
+            DECODE_STATS['chardet'] += 1
+            _learn_charset(key, encoding)
+            return payload.decode(encoding, errors='replace')
+    except ImportError:
+        pass
+    DECODE_STATS['latin1'] += 1
+    return payload.decode('latin-1')
+
+def _learn_charset(key: str, encoding: str):
+    if not key:
+        return
+    if key not in _learned_charsets and len(_learned_charsets) >= LEARNED_CHARSETS_MAX:
+        _learned_charsets.pop(next(iter(_learned_charsets)))  # Самый старый ключ
+    _learned_charsets[key] = encoding
+
+def print_decode_stats(stats: dict = None):
+    """Сколько частей декодировано по объявленной, выученной кодировке и медленным каскадом."""
+    stats = stats or DECODE_STATS
+    total = sum(stats[name] for name in ('ascii', 'declared', 'learned', 'cascade'))
+    if not total:
+        return
+    print(f"🔤 Декодирование частей: {total} (ASCII {stats['ascii']}, по charset {stats['declared']}, "
+          f"выученная кодировка {stats['learned']}, каскад {stats['cascade']} "
+          f"[{stats['cascade'] / total * 100:.1f}%], из них chardet {stats['chardet']}, "
+          f"latin-1 {stats['latin1']}; charset не подошел {stats['declared_failed']})")
+
+def html_to_text(html_content: bytes, charset: str = None, key: str = None) -> str:
+    """Конвертирует HTML в текст без использования BeautifulSoup (charset, key - см. decode_payload)."""
+    try:
+        html_decoded = decode_payload(html_content, charset, key)
         
         # Простая очистка HTML тегов с использованием регулярных выражений
         # Удаляем скрипты и стили
@@ -111,93 +504,3 @@ def html_to_text(html_content: bytes) -> str:
             return html_content.decode('utf-8', errors='ignore')[:1000]
         except:
             return ""
-
-def get_email_body(msg) -> str:
-    """Извлекает тело письма из объекта email."""
-    body = ""
-    
-    # Сначала пытаемся извлечь тему письма, так как она содержит важную информацию
-    subject = msg.get("Subject", "")
-    try:
-        # Пытаемся декодировать тему из формата =?UTF-8?B?...=
-        from email.header import decode_header
-        decoded_parts = decode_header(subject)
-        decoded_subject = ""
-        for part, encoding in decoded_parts:
-            if isinstance(part, bytes):
-                if encoding:
-                    decoded_subject += part.decode(encoding, errors='ignore')
-                else:
-                    decoded_subject += part.decode('utf-8', errors='ignore')
-            else:
-                decoded_subject += part
-        if decoded_subject.strip():
-            body += f"Тема письма: {decoded_subject}\n\n"
-    except Exception as e:
-        # Если декодирование не удалось, оставляем как есть
-        if subject.strip():
-            body += f"Тема письма: {subject}\n\n"
-    
-    if msg.is_multipart():
-        for part in msg.walk():
-            content_type = part.get_content_type()
-            content_disposition = str(part.get("Content-Disposition", ""))
-            
-            # Текстовое тело
-            if content_type == "text/plain" and "attachment" not in content_disposition:
-                payload = part.get_payload(decode=True)
-                if payload:
-                    # Пробуем разные кодировки
-                    for encoding in ['utf-8', 'cp1251', 'windows-1251', 'koi8-r', 'iso-8859-5', 'latin-1']:
-                        try:
-                            body += payload.decode(encoding, errors='strict')
-                            break
-                        except UnicodeDecodeError:
-                            continue
-                    else:
-                        # Если ни одна кодировка не подошла, используем игнорирование ошибок
-                        body += payload.decode('utf-8', errors='ignore')
-            
-            # HTML тело
-            elif content_type == "text/html" and "attachment" not in content_disposition:
-                try:
-                    html_content = part.get_payload(decode=True)
-                    if html_content:
-                        html_text = html_to_text(html_content)
-                        if html_text:
-                            body += html_text + "\n"
-                except Exception as e:
-                    print(f"⚠️  Ошибка при обработке HTML части: {e}")
-    else:
-        # Не multipart письмо - пытаемся получить содержимое напрямую
-        try:
-            payload = msg.get_payload(decode=True)
-            if payload:
-                content_type = msg.get_content_type()
-                
-                if content_type == 'text/plain':
-                    # Пробуем разные кодировки
-                    for encoding in ['utf-8', 'cp1251', 'windows-1251', 'koi8-r', 'iso-8859-5', 'latin-1']:
-                        try:
-                            body += payload.decode(encoding, errors='strict')
-                            break
-                        except UnicodeDecodeError:
-                            continue
-                    else:
-                        body += payload.decode('utf-8', errors='ignore')
-                
-                elif content_type == 'text/html':
-                    html_text = html_to_text(payload)
-                    if html_text:
-                        body += html_text
-                
-                else:
-                    # Для других типов пытаемся декодировать как текст
-                    try:
-                        body += payload.decode('utf-8', errors='ignore')
-                    except:
-                        pass
-        except Exception as e:
-            print(f"⚠️  Ошибка при обработке не-multipart письма: {e}")
-    
-    return body.strip()
\ No newline at end of file
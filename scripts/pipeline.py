@@ -0,0 +1,348 @@
+"""
+pipeline.py - Потоковая обработка: парсинг -> предобработка -> классификация -> экспорт.
+
+Письма читаются генератором (parser.iter_emails), классифицируются порциями по
+STREAM_CHUNK_SIZE и сразу дописываются в выходные файлы (exporter.StreamingExporter).
+В памяти одновременно находится только одна порция, поэтому расход памяти не
+растет с размером корпуса. Для метрик хранится лишь имя файла и топ-категория.
+
+run_staged - конвейер со стадиями, работающими одновременно: парсинг пулом процессов
+(parser.iter_parsed), стадия кодирования (основной поток) и поток записи результатов
+обмениваются через ограниченные очереди. Пока модель кодирует порцию, парсеры читают
+следующие письма; заполненная очередь останавливает предыдущую стадию (backpressure).
+"""
+
+import os
+import queue
+import threading
+import time
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+from classifier import classify_emails
+from discovery import iter_files
+
+# === КОНФИГУРАЦИЯ ===
+STREAM_CHUNK_SIZE = 512  # Писем в одной порции классификации
+STREAM_PREVIEW = 5  # Сколько результатов сохранить для краткого вывода
+PARSER_WORKERS = 4  # Процессов парсинга в run_staged (1 = в потоке стадии парсинга)
+PARSED_QUEUE_SIZE = 1024  # Писем между парсерами и кодированием
+RESULT_QUEUE_SIZE = 4  # Порций результатов между кодированием и записью
+STAGED_ORDERED = True  # Писать результаты в порядке файлов (иначе - по мере готовности)
+QUEUE_POLL_SEC = 0.5  # Как часто ждущие на очереди потоки проверяют сигнал остановки
+
+_DONE = object()  # Маркер конца потока в очередях
+
+
+def chunked(items: Iterable, size: int) -> Iterator[list]:
+    """Разбивает итератор на списки по size элементов."""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def classify_stream(emails: Iterable[dict], categories_file: str, chunk_size: int = STREAM_CHUNK_SIZE,
+                    **classify_kwargs) -> Iterator[dict]:
+    """
+    Классифицирует поток писем порциями.
+    :param emails: Итератор словарей писем (например, parser.iter_emails)
+    :param classify_kwargs: Параметры classify_emails (top_n, threshold, cascade, ...)
+    :return: Генератор результатов в порядке писем
+    """
+    for chunk in chunked(emails, chunk_size):
+        yield from classify_emails(chunk, categories_file, **classify_kwargs)
+
+
+def run_streaming(input_folder: str, output_folder: str, categories_file: str,
+                  formats: List[str] = ['json', 'csv'], chunk_size: int = STREAM_CHUNK_SIZE,
+                  header_rules: bool = True, filename_prefix: str = 'mail_lens_results',
+                  **classify_kwargs) -> Dict[str, object]:
+    """
+    Полный потоковый прогон папки с письмами.
+    :return: {"files": пути экспорта, "stats": статистика как у generate_stats,
+              "metric_records": компактные записи для calculate_metrics, "preview": первые результаты}
+    """
+    from parser import iter_emails
+
+    emails = iter_emails(input_folder, header_rules)
+    with ResultSink(output_folder, formats, filename_prefix) as sink:
+        for result in classify_stream(emails, categories_file, chunk_size,
+                                      header_rules=header_rules, **classify_kwargs):
+            sink.add(result)
+    return sink.report()
+
+
+class ResultSink:
+    """Запись результатов в файлы и накопление статистики, метрик и превью."""
+
+    def __init__(self, output_folder: str, formats: List[str], filename_prefix: str):
+        from exporter import StatsAccumulator, StreamingExporter
+
+        self.exporter = StreamingExporter(output_folder, formats, filename_prefix)
+        self.accumulator = StatsAccumulator()
+        self.metric_records = []
+        self.preview = []
+
+    def add(self, result: dict):
+        from utils import decode_subject
+
+        result['subject_decoded'] = decode_subject(result.get('subject', ''))
+        self.exporter.write(result)
+        self.accumulator.add(result)
+        if result.get('processed', False) and result.get('categories'):
+            self.metric_records.append({'filename': result.get('filename', ''), 'processed': True,
+                                        'categories': [tuple(result['categories'][0])]})
+        if len(self.preview) < STREAM_PREVIEW:
+            self.preview.append(result)
+
+    def report(self) -> Dict[str, object]:
+        return {
+            'files': self.exporter.files,
+            'stats': self.accumulator.summary(),
+            'metric_records': self.metric_records,
+            'preview': self.preview,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.exporter.close()
+
+
+class StageStats:
+    """Загрузка стадии конвейера и глубина ее входной очереди."""
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0  # Секунды работы (сумма по потокам стадии)
+        self.blocked = 0.0  # Секунды ожидания места в следующей очереди (backpressure)
+        self.depth_sum = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+        self._lock = threading.Lock()
+
+    def sample_depth(self, depth: int):
+        with self._lock:
+            self.depth_sum += depth
+            self.depth_samples += 1
+            self.depth_max = max(self.depth_max, depth)
+
+    def record(self, items: int, busy: float):
+        with self._lock:
+            self.items += items
+            self.busy += busy
+
+    def record_blocked(self, seconds: float):
+        with self._lock:
+            self.blocked += seconds
+
+    def summary(self, wall: float) -> Dict[str, float]:
+        return {
+            'items': self.items,
+            'utilization': self.busy / (wall * self.workers) if wall > 0 else 0.0,
+            'blocked_sec': self.blocked,
+            'queue_depth_avg': self.depth_sum / self.depth_samples if self.depth_samples else 0.0,
+            'queue_depth_max': self.depth_max,
+        }
+
+
+def _put(target: queue.Queue, item, stage: StageStats = None, stop: threading.Event = None) -> bool:
+    """
+    Кладет элемент в очередь, учитывая время ожидания места.
+    :return: False, если до появления места выставлен stop
+    """
+    started = time.perf_counter()
+    try:
+        while True:
+            try:
+                target.put(item, timeout=QUEUE_POLL_SEC if stop is not None else None)
+                return True
+            except queue.Full:
+                if stop.is_set():
+                    return False
+    finally:
+        if stage is not None:
+            stage.record_blocked(time.perf_counter() - started)
+
+
+def _get(source: queue.Queue, stop: threading.Event):
+    """Берет элемент из очереди; _DONE, если выставлен stop."""
+    while not stop.is_set():
+        try:
+            return source.get(timeout=QUEUE_POLL_SEC)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _queued_paths(files: queue.Queue, seqs: Dict[str, int], stage: StageStats, stop: threading.Event):
+    """Пути из очереди обхода; номер файла запоминается в seqs."""
+    while True:
+        stage.sample_depth(files.qsize())
+        item = _get(files, stop)
+        if item is _DONE:
+            return
+        seq, file_path = item
+        seqs[file_path] = seq
+        yield file_path
+
+
+def _parse_worker(files: queue.Queue, parsed: queue.Queue, stage: StageStats, header_rules: bool,
+                  workers: int, stop: threading.Event):
+    """
+    Стадия парсинга: отдает пути из очереди обхода пулу процессов parser.iter_parsed
+    (изоляция падений и лимит времени на файл - как у parse_files).
+    """
+    from parser import iter_parsed, new_parse_stats
+
+    seqs = {}
+    stats = new_parse_stats(workers)
+    busy = 0.0
+    results = iter_parsed(_queued_paths(files, seqs, stage, stop), header_rules, workers, stats=stats)
+    try:
+        for file_path, email_data, error in results:
+            if error:
+                print(f"❌ Ошибка парсинга файла {os.path.basename(file_path)}: {error}")
+            stage.record(1, stats['busy_sec'] - busy)
+            busy = stats['busy_sec']
+            # None тоже передается дальше: упорядоченной записи нужен каждый номер
+            if not _put(parsed, (seqs.pop(file_path), email_data), stage, stop):
+                return
+    finally:
+        results.close()  # Пул процессов закрывается и при остановке
+        _put(parsed, _DONE, stage, stop)
+
+
+def _write_worker(results: queue.Queue, sink: ResultSink, stage: StageStats, ordered: bool, errors: list):
+    pending = {}  # номер файла -> результат, ждущий предыдущих (ordered)
+    next_seq = 0
+    while True:
+        stage.sample_depth(results.qsize())
+        batch = results.get()
+        if batch is _DONE:
+            break
+        started = time.perf_counter()
+        try:
+            for seq, result in batch:
+                if not ordered:
+                    if result is not None:
+                        sink.add(result)
+                    continue
+                pending[seq] = result
+                while next_seq in pending:
+                    result = pending.pop(next_seq)
+                    next_seq += 1
+                    if result is not None:
+                        sink.add(result)
+        except Exception as e:
+            errors.append(e)
+        stage.record(len(batch), time.perf_counter() - started)
+    # Номера без результата (не должно случаться) не блокируют запись остальных
+    for seq in sorted(pending):
+        if pending[seq] is not None:
+            sink.add(pending[seq])
+
+
+def _feed_files(input_folder: str, files: queue.Queue, stop: threading.Event):
+    """Обходит папку и передает пути стадии парсинга по мере обнаружения."""
+    try:
+        for seq, record in enumerate(iter_files(input_folder)):
+            if not _put(files, (seq, record.path), stop=stop):
+                return
+    finally:
+        _put(files, _DONE, stop=stop)
+
+
+def run_staged(input_folder: str, output_folder: str, categories_file: str,
+               formats: List[str] = ['json', 'csv'], chunk_size: int = STREAM_CHUNK_SIZE,
+               parser_workers: int = PARSER_WORKERS, ordered: bool = STAGED_ORDERED,
+               header_rules: bool = True, filename_prefix: str = 'mail_lens_results',
+               **classify_kwargs) -> Dict[str, object]:
+    """
+    Конвейер "парсинг || кодирование || запись" над ограниченными очередями.
+    :param parser_workers: Процессов парсинга
+    :param ordered: Восстанавливать порядок файлов при записи
+    :return: Как у run_streaming, плюс "stages" - загрузка стадий и глубина очередей
+    """
+    files = queue.Queue(maxsize=PARSED_QUEUE_SIZE)
+    parsed = queue.Queue(maxsize=max(PARSED_QUEUE_SIZE, chunk_size))
+    results = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+
+    parse_stage = StageStats('parse', parser_workers)
+    encode_stage = StageStats('encode')
+    write_stage = StageStats('write')
+    write_errors = []
+    stop = threading.Event()  # Остановка обхода и парсинга, если стадия кодирования упала
+
+    started = time.perf_counter()
+    with ResultSink(output_folder, formats, filename_prefix) as sink:
+        parse_thread = threading.Thread(target=_parse_worker,
+                                        args=(files, parsed, parse_stage, header_rules,
+                                              max(1, parser_workers), stop),
+                                        name="mail-lens-parser", daemon=True)
+        # Обход папки идет параллельно с парсингом: первые письма парсятся, пока дерево еще обходится
+        feeder = threading.Thread(target=_feed_files, args=(input_folder, files, stop),
+                                  name="mail-lens-discovery", daemon=True)
+        writer = threading.Thread(target=_write_worker, args=(results, sink, write_stage, ordered, write_errors),
+                                  name="mail-lens-writer", daemon=True)
+        for thread in (feeder, parse_thread, writer):
+            thread.start()
+
+        # Стадия кодирования: набирает порцию распарсенных писем и классифицирует ее.
+        # Стадия парсинга, закончив, присылает _DONE
+        try:
+            finished = False
+            while not finished:
+                seqs, chunk, skipped = [], [], []
+                while not finished and len(chunk) < chunk_size:
+                    encode_stage.sample_depth(parsed.qsize())
+                    item = parsed.get()
+                    if item is _DONE:
+                        finished = True
+                        continue
+                    seq, email_data = item
+                    if email_data is None:
+                        skipped.append((seq, None))
+                    else:
+                        seqs.append(seq)
+                        chunk.append(email_data)
+                batch_started = time.perf_counter()
+                chunk_results = classify_emails(chunk, categories_file, header_rules=header_rules,
+                                                **classify_kwargs) if chunk else []
+                # classify_emails при ошибке загрузки категорий возвращает меньше результатов
+                chunk_results = list(chunk_results) + [None] * (len(seqs) - len(chunk_results))
+                encode_stage.record(len(chunk), time.perf_counter() - batch_started)
+                _put(results, skipped + list(zip(seqs, chunk_results)), encode_stage)
+        except BaseException:
+            stop.set()  # Обход и парсеры выходят, не дожидаясь места в очередях
+            raise
+        finally:
+            # Писатель дописывает готовое и завершается до закрытия sink
+            results.put(_DONE)
+            for thread in (feeder, parse_thread, writer):
+                thread.join()
+    wall = time.perf_counter() - started
+
+    if write_errors:
+        raise write_errors[0]
+
+    report = sink.report()
+    report['stages'] = {stage.name: stage.summary(wall) for stage in (parse_stage, encode_stage, write_stage)}
+    report['stages']['wall_sec'] = wall
+    return report
+
+
+def print_stage_stats(stages: Dict[str, object]):
+    """Загрузка стадий конвейера и глубина их входных очередей."""
+    print(f"\n🏭 Стадии конвейера ({stages['wall_sec']:.1f} с):")
+    for name in ('parse', 'encode', 'write'):
+        stage = stages[name]
+        print(f"   • {name}: {stage['items']} писем, загрузка {stage['utilization']:.0%}, "
+              f"ожидание следующей стадии {stage['blocked_sec']:.1f} с, "
+              f"очередь ср. {stage['queue_depth_avg']:.1f} / макс. {stage['queue_depth_max']}")
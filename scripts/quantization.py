@@ -0,0 +1,75 @@
+"""
+quantization.py - Int8 динамическая квантизация модели для CPU.
+
+Линейные слои трансформера переводятся в int8 (torch.ao.quantization.quantize_dynamic),
+активации квантуются на лету. Квантованная модель сохраняется целиком
+в model_cache/quantized, поэтому повторный запуск не загружает fp32 веса
+и не квантует модель заново.
+"""
+
+import os
+import re
+
+QUANTIZED_SUBDIR = "quantized"
+
+
+def quantized_model_path(cache_root: str, model_name: str) -> str:
+    """Путь к сохраненной квантованной модели (зависит от версии torch)."""
+    import torch
+
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    torch_version = torch.__version__.split('+')[0]
+    return os.path.join(cache_root, QUANTIZED_SUBDIR, f"{slug}_int8_torch{torch_version}.pt")
+
+
+def _select_quantized_engine():
+    """Выбирает доступный движок квантованных операций (fbgemm на x86, qnnpack на ARM)."""
+    import torch
+
+    engines = torch.backends.quantized.supported_engines
+    if torch.backends.quantized.engine not in engines or torch.backends.quantized.engine == 'none':
+        for engine in ('x86', 'fbgemm', 'qnnpack'):
+            if engine in engines:
+                torch.backends.quantized.engine = engine
+                break
+
+
+def quantize_model(model):
+    """Квантует линейные слои модели в int8 на месте и возвращает ее."""
+    import torch
+
+    _select_quantized_engine()
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def load_quantized_model(cache_root: str, model_name: str):
+    """Загружает ранее сохраненную квантованную модель или возвращает None."""
+    import torch
+
+    path = quantized_model_path(cache_root, model_name)
+    if not os.path.exists(path):
+        return None
+    try:
+        _select_quantized_engine()
+        # Файл создан этим же приложением в model_cache, поэтому загружаем модуль целиком
+        model = torch.load(path, map_location='cpu', weights_only=False)
+        model.eval()
+        print(f"✅ Квантованная модель загружена из кэша: {path}")
+        return model
+    except Exception as e:
+        print(f"⚠️  Не удалось загрузить квантованную модель из кэша: {e}")
+        return None
+
+
+def save_quantized_model(model, cache_root: str, model_name: str) -> str:
+    """Сохраняет квантованную модель целиком для быстрой повторной загрузки."""
+    import torch
+
+    path = quantized_model_path(cache_root, model_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    torch.save(model, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"💾 Квантованная модель сохранена: {path}")
+    return path
@@ -0,0 +1,167 @@
+"""
+result_cache.py - Кэш результатов классификации в памяти процесса (сервисный путь).
+
+Повторные доставки и рассылка одного письма нескольким адресатам приводят к тому,
+что одно и то же письмо классифицируется несколько раз за минуты. Результаты
+хранятся в cachetools.TTLCache (LRU + время жизни) по ключу: хэш нормализованного
+содержимого письма и его заголовков + параметры классификации.
+
+Кэш привязан к отпечатку модели и файла категорий. Отпечаток проверяется перед каждым
+обращением (файл категорий перечитывается только при изменении mtime): при смене
+new_cats.txt или модели кэш очищается.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List
+
+# === КОНФИГУРАЦИЯ ===
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_MAX_ENTRIES = 10000  # Писем в кэше
+RESULT_CACHE_TTL_SEC = 600  # Время жизни результата
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def content_key(email: dict) -> str:
+    """
+    Хэш нормализованного письма: тема, тело (пробелы схлопнуты), вся запись заголовков
+    (отправитель, признаки рассылки, ESP - от них зависят правила и приор домена)
+    и сработавшее правило по заголовкам.
+    """
+    headers = dict(email.get("headers") or {})
+    if "from_address" in headers:
+        headers["from_address"] = str(headers["from_address"]).lower()
+    parts = [
+        _WHITESPACE.sub(' ', str(email.get("subject") or "")).strip(),
+        _WHITESPACE.sub(' ', str(email.get("body") or "")).strip(),
+        json.dumps(headers, sort_keys=True, ensure_ascii=False, default=str),
+        json.dumps(email.get("header_rule"), sort_keys=True, ensure_ascii=False, default=str),
+    ]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8', errors='ignore')).hexdigest()
+
+
+class ResultCache:
+    """TTL/LRU кэш результатов со счетчиками и сбросом при смене модели или категорий."""
+
+    def __init__(self, categories_file: str, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 ttl: float = RESULT_CACHE_TTL_SEC):
+        from cachetools import TTLCache
+
+        stats = self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0}
+
+        class CountingTTLCache(TTLCache):
+            def popitem(self):
+                # Вызывается только при вытеснении по размеру
+                item = super().popitem()
+                stats['evictions'] += 1
+                return item
+
+            def expire(self, time=None):
+                expired = super().expire(time)
+                stats['expired'] += len(expired)
+                return expired
+
+        self.categories_file = categories_file
+        self._new_cache = lambda: CountingTTLCache(maxsize=max_entries, ttl=ttl)
+        self._cache = self._new_cache()
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._categories_mtime = None
+        self._categories_digest = None
+
+    def __len__(self):
+        return len(self._cache)
+
+    def fingerprint(self) -> tuple:
+        """
+        (id модели, хэш файла категорий). Файл хэшируется заново только после изменения;
+        id модели - None, пока модель не загружена (загрузка не запускается).
+        """
+        import model_provider
+
+        mtime = os.stat(self.categories_file).st_mtime_ns
+        if mtime != self._categories_mtime:
+            with open(self.categories_file, 'rb') as f:
+                self._categories_digest = hashlib.sha256(f.read()).hexdigest()
+            self._categories_mtime = mtime
+        model_id = model_provider.get_model_id() if model_provider.is_loaded() else None
+        return model_id, self._categories_digest
+
+    def _check_fingerprint(self):
+        model_id, digest = self.fingerprint()
+        previous = self._fingerprint
+        if previous is not None:
+            model_changed = model_id is not None and previous[0] is not None and model_id != previous[0]
+            if model_changed or digest != previous[1]:
+                # Новый объект, а не clear(): clear() вызывает popitem и исказил бы счетчик вытеснений
+                self._cache = self._new_cache()
+                self.stats['invalidations'] += 1
+                print("🔄 Модель или категории изменились, кэш результатов очищен")
+            if model_id is None:
+                model_id = previous[0]
+        self._fingerprint = (model_id, digest)
+
+    def key(self, email: dict, options: dict) -> str:
+        return f"{content_key(email)}:{json.dumps(options, sort_keys=True, default=str)}"
+
+    def get(self, key: str):
+        with self._lock:
+            result = self._cache.get(key)
+            self.stats['hits' if result is not None else 'misses'] += 1
+            return copy.deepcopy(result) if result is not None else None
+
+    def put(self, key: str, result: dict):
+        with self._lock:
+            self._cache[key] = copy.deepcopy(result)
+
+    def classify_emails(self, emails: List[dict], verbose: bool = True, **classify_kwargs) -> List[dict]:
+        """
+        classify_emails с кэшем: в модель уходят только промахи, одинаковые письма
+        внутри вызова классифицируются один раз. Порядок результатов сохраняется.
+        :param verbose: Передается в classify_emails и не входит в ключ кэша
+        """
+        from classifier import classify_emails
+
+        with self._lock:
+            self._check_fingerprint()
+        keys = [self.key(email, classify_kwargs) for email in emails]
+        results = [self.get(key) for key in keys]
+        for email, result in zip(emails, results):
+            if result is not None:
+                result['filename'] = email.get('filename', result.get('filename'))
+                result['cached'] = True
+
+        misses = {}  # ключ -> индексы писем
+        for i, (key, result) in enumerate(zip(keys, results)):
+            if result is None:
+                misses.setdefault(key, []).append(i)
+        if misses:
+            leaders = [indexes[0] for indexes in misses.values()]
+            fresh = classify_emails([emails[i] for i in leaders], self.categories_file, verbose=verbose,
+                                    **classify_kwargs)
+            # Модель могла загрузиться только сейчас - фиксируем ее в отпечатке
+            with self._lock:
+                self._check_fingerprint()
+            for i, result in zip(leaders, fresh):
+                if result.get('processed', False):
+                    self.put(keys[i], result)
+                for j in misses[keys[i]]:
+                    results[j] = dict(result, filename=emails[j].get('filename', result.get('filename')))
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = {"filename": emails[i].get("filename", ""), "processed": False,
+                              "categories": [], "error": "Ошибка классификации"}
+        return results
+
+
+def print_result_cache_stats(stats: Dict[str, int], size: int):
+    """Выводит счетчики кэша результатов в консоль."""
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / lookups * 100 if lookups else 0.0
+    print(f"🗃️  Кэш результатов: {size} записей, попаданий {stats['hits']}/{lookups} ({hit_rate:.1f}%), "
+          f"вытеснено {stats['evictions']}, истекло {stats['expired']}, сбросов {stats['invalidations']}")
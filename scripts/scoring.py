@@ -0,0 +1,91 @@
+"""
+scoring.py - Векторизованный скоринг писем по категориям.
+
+Сходства всего батча считаются одним произведением нормированных матриц
+(N писем x C категорий), top-k выбирается через argpartition, порог и логика
+категории "Другое" применяются ко всему батчу сразу. Результат хранится
+в компактных массивах; списки (категория, уверенность) строятся только
+для писем, которые попадают в результаты.
+"""
+
+from typing import List, Tuple
+
+
+def normalize_rows(embeddings):
+    """L2-нормировка строк torch-тензора (эмбеддинги категорий нормируются один раз)."""
+    import torch
+
+    return torch.nn.functional.normalize(embeddings.float(), p=2, dim=1)
+
+
+def cosine_matrix(embeddings, normalized_categories) -> "np.ndarray":
+    """
+    Косинусные сходства N x C одним матричным произведением.
+    :param embeddings: Тензор N x D эмбеддингов писем
+    :param normalized_categories: Тензор C x D нормированных эмбеддингов категорий
+    """
+    return (normalize_rows(embeddings) @ normalized_categories.T).cpu().numpy()
+
+
+class ScoredBatch:
+    """Top-k категорий батча в виде массивов."""
+
+    __slots__ = ('category_names', 'top_indices', 'top_scores', 'valid_counts', 'best_scores', 'is_other')
+
+    def __init__(self, category_names, top_indices, top_scores, valid_counts, best_scores, is_other):
+        self.category_names = category_names
+        self.top_indices = top_indices  # N x k индексы категорий по убыванию уверенности
+        self.top_scores = top_scores  # N x k уверенности в [0, 1]
+        self.valid_counts = valid_counts  # Сколько из k прошли порог
+        self.best_scores = best_scores  # Лучшая уверенность (без учета порога)
+        self.is_other = is_other  # Письмо уходит в категорию "Другое"
+
+    def __len__(self):
+        return len(self.valid_counts)
+
+    def category_scores(self, row: int) -> List[Tuple[str, float]]:
+        """Список (категория, уверенность) прошедших порог категорий письма."""
+        count = int(self.valid_counts[row])
+        return [(self.category_names[int(j)], float(score))
+                for j, score in zip(self.top_indices[row, :count], self.top_scores[row, :count])]
+
+    def best_category(self, row: int) -> Tuple[str, float]:
+        """Лучшая категория письма (даже если она ниже порога)."""
+        return self.category_names[int(self.top_indices[row, 0])], float(self.best_scores[row])
+
+
+def score_batch(similarities, category_names: list, top_n: int = 5, threshold: float = 0.1,
+                other_threshold: float = None) -> ScoredBatch:
+    """
+    Скоринг батча по матрице косинусных сходств.
+    Сходства нормализуются в [0, 1]; порог threshold < 0 задан в шкале косинуса.
+    :param similarities: Массив N x C (или вектор C для одного письма)
+    :param other_threshold: Лучшая уверенность ниже порога -> "Другое" (None - не применять)
+    """
+    import numpy as np
+
+    if hasattr(similarities, 'cpu'):
+        similarities = similarities.cpu().numpy()
+    scores = (np.atleast_2d(np.asarray(similarities, dtype=np.float32)) + 1) / 2
+    rows, columns = scores.shape
+    k = max(1, min(top_n, columns))
+
+    # top-k без полной сортировки: argpartition, затем сортировка только k столбцов
+    if k < columns:
+        top_indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top_indices = np.tile(np.arange(columns), (rows, 1))
+    top_scores = np.take_along_axis(scores, top_indices, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top_indices = np.take_along_axis(top_indices, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    normalized_threshold = (threshold + 1) / 2 if threshold < 0 else threshold
+    valid_counts = (top_scores >= normalized_threshold).sum(axis=1)
+    best_scores = top_scores[:, 0]
+
+    is_other = valid_counts == 0
+    if other_threshold is not None:
+        is_other |= best_scores < other_threshold
+
+    return ScoredBatch(category_names, top_indices, top_scores, valid_counts, best_scores, is_other)
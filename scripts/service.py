@@ -0,0 +1,277 @@
+"""
+service.py - HTTP-сервис классификации с моделью, загруженной один раз.
+
+Использование:
+    python scripts/service.py [--port 8765] [--batch-max 32] [--max-latency-ms 20]
+
+Эндпоинты:
+    POST /classify  - тело .eml/.msg (любой Content-Type, кроме JSON)
+                      или JSON {"subject": ..., "body": ..., "filename": ..., "headers": {...}}
+    GET  /health    - процесс жив
+    GET  /ready     - модель и эмбеддинги категорий загружены (иначе 503)
+    GET  /stats     - счетчики запросов и микробатчей
+
+Одновременные запросы собираются в микробатч: он уходит в classify_emails, как только
+набралось SERVICE_BATCH_MAX писем или первое письмо ждет SERVICE_MAX_LATENCY_MS.
+Ответ - результат classify_emails для письма (categories, confidence, decided_by, ...).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+
+PROJECT_ROOT = os.path.dirname(current_dir)
+CATEGORIES_FILE = os.path.join(PROJECT_ROOT, "categories", "new_cats.txt")
+
+from result_cache import (RESULT_CACHE_ENABLED, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SEC, ResultCache,
+                          print_result_cache_stats)
+
+# === КОНФИГУРАЦИЯ ===
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_BATCH_MAX = 32  # Писем в микробатче
+SERVICE_MAX_LATENCY_MS = 20.0  # Сколько первое письмо ждет, пока набирается микробатч
+SERVICE_PARSE_WORKERS = 4  # Потоков парсинга тел запросов
+SERVICE_MAX_BODY_MB = 25  # Максимальный размер запроса
+SERVICE_QUIET = True  # Не выводить подробный лог classify_emails на каждый микробатч
+# Гистограммы доменов и индекс почти одинаковых писем сохраняются на диск после каждого
+# вызова classify_emails; в сервисе это происходило бы на каждый микробатч
+SERVICE_DOMAIN_PRIOR = False
+SERVICE_NEAR_DUPLICATES = False
+
+
+class MicroBatcher:
+    """Собирает письма одновременных запросов в микробатчи для classify_emails."""
+
+    def __init__(self, categories_file: str, batch_max: int = SERVICE_BATCH_MAX,
+                 max_latency_ms: float = SERVICE_MAX_LATENCY_MS, cache=None, verbose: bool = not SERVICE_QUIET,
+                 **classify_kwargs):
+        self.categories_file = categories_file
+        self.cache = cache  # result_cache.ResultCache или None
+        self.batch_max = max(1, batch_max)
+        self.max_latency = max_latency_ms / 1000
+        self.verbose = verbose
+        self.classify_kwargs = classify_kwargs
+        # Один поток: модель кодирует один батч за раз, остальные запросы копятся в очереди
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mail-lens-model")
+        self.queue = None
+        self.stats = {'requests': 0, 'batches': 0, 'errors': 0, 'batch_sizes': {}, 'classify_sec': 0.0}
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        return asyncio.ensure_future(self._loop())
+
+    async def submit(self, email: dict) -> dict:
+        future = asyncio.get_running_loop().create_future()
+        self.stats['requests'] += 1
+        await self.queue.put((email, future))
+        return await future
+
+    def classify(self, emails: list) -> list:
+        from classifier import classify_emails
+
+        if self.cache is not None:
+            return self.cache.classify_emails(emails, verbose=self.verbose, **self.classify_kwargs)
+        return classify_emails(emails, self.categories_file, verbose=self.verbose, **self.classify_kwargs)
+
+    def print_stats(self):
+        """Итоговые счетчики запросов, микробатчей и кэша результатов."""
+        stats = self.stats
+        avg_batch = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        print(f"📊 Сервис: запросов {stats['requests']}, микробатчей {stats['batches']} "
+              f"(в среднем {avg_batch:.1f} писем), ошибок {stats['errors']}, "
+              f"классификация {stats['classify_sec']:.1f} с")
+        if self.cache is not None:
+            print_result_cache_stats(self.cache.stats, len(self.cache))
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.batch_max:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.classify, [email for email, _ in batch])
+            except Exception as e:
+                results = []
+                print(f"❌ Ошибка классификации микробатча: {e}")
+            self.stats['classify_sec'] += time.perf_counter() - started
+            self.stats['batches'] += 1
+            size_key = str(len(batch))
+            self.stats['batch_sizes'][size_key] = self.stats['batch_sizes'].get(size_key, 0) + 1
+
+            for i, (email, future) in enumerate(batch):
+                if future.done():
+                    continue  # Клиент отключился
+                if i < len(results):
+                    future.set_result(results[i])
+                else:
+                    self.stats['errors'] += 1
+                    future.set_exception(RuntimeError("Ошибка классификации"))
+
+
+def email_from_json(data: dict) -> dict:
+    """Письмо в формате parser из JSON {"subject", "body", "filename", "headers"}."""
+    from email.message import Message
+    from header_rules import header_record
+
+    if not isinstance(data, dict) or not (data.get("subject") or data.get("body")):
+        raise ValueError('Ожидается JSON-объект с полями "subject" и/или "body"')
+    headers = {}
+    if isinstance(data.get("headers"), dict):
+        msg = Message()
+        for name, value in data["headers"].items():
+            msg[name] = str(value)
+        headers = header_record(msg)
+    return {
+        "filename": str(data.get("filename", "request")),
+        "subject": str(data.get("subject", "")),
+        "body": str(data.get("body", "")),
+        "attachments": [],
+        "headers": headers,
+        "header_rule": None,
+    }
+
+
+def make_app(batcher: MicroBatcher, header_rules: bool = True):
+    import tornado.web
+
+    parse_executor = ThreadPoolExecutor(max_workers=SERVICE_PARSE_WORKERS, thread_name_prefix="mail-lens-parse")
+    state = {'ready': False, 'started': time.time()}
+
+    class JsonHandler(tornado.web.RequestHandler):
+        def write_json(self, data, status: int = 200):
+            self.set_status(status)
+            self.set_header("Content-Type", "application/json; charset=utf-8")
+            self.finish(json.dumps(data, ensure_ascii=False, default=str))
+
+    class ClassifyHandler(JsonHandler):
+        async def post(self):
+            from parser import parse_bytes
+
+            if not state['ready']:
+                return self.write_json({"error": "Модель еще загружается"}, 503)
+            content_type = self.request.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            loop = asyncio.get_running_loop()
+            try:
+                if content_type == "application/json":
+                    email = email_from_json(json.loads(self.request.body))
+                else:
+                    filename = self.get_query_argument("filename", "request.eml")
+                    email = await loop.run_in_executor(parse_executor, parse_bytes,
+                                                       self.request.body, filename, header_rules)
+            except ValueError as e:
+                return self.write_json({"error": str(e)}, 400)
+            if not email:
+                return self.write_json({"error": "Не удалось распарсить письмо"}, 422)
+            try:
+                result = await batcher.submit(email)
+            except RuntimeError as e:
+                return self.write_json({"error": str(e)}, 500)
+            self.write_json(result)
+
+    class HealthHandler(JsonHandler):
+        def get(self):
+            self.write_json({"status": "ok", "uptime_sec": time.time() - state['started']})
+
+    class ReadyHandler(JsonHandler):
+        def get(self):
+            self.write_json({"ready": state['ready']}, 200 if state['ready'] else 503)
+
+    class StatsHandler(JsonHandler):
+        def get(self):
+            stats = dict(batcher.stats)
+            stats['queue_depth'] = batcher.queue.qsize() if batcher.queue else 0
+            stats['avg_batch'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+            if batcher.cache is not None:
+                stats['result_cache'] = dict(batcher.cache.stats, size=len(batcher.cache))
+            self.write_json(stats)
+
+    app = tornado.web.Application([
+        (r"/classify", ClassifyHandler),
+        (r"/health", HealthHandler),
+        (r"/ready", ReadyHandler),
+        (r"/stats", StatsHandler),
+    ])
+    app.service_state = state
+    return app
+
+
+def warm_up_service(batcher: MicroBatcher):
+    """Загружает модель и эмбеддинги категорий (пробный микробатч из одного письма)."""
+    from classifier import warm_up
+
+    warm_up()
+    batcher.classify([{"filename": "warm_up", "subject": "Прогрев", "body": "Прогрев модели",
+                       "attachments": [], "headers": {}, "header_rule": None}])
+
+
+async def serve(host: str, port: int, batcher: MicroBatcher, header_rules: bool):
+    import tornado.httpserver
+
+    app = make_app(batcher, header_rules)
+    server = tornado.httpserver.HTTPServer(app, max_body_size=SERVICE_MAX_BODY_MB * 1024 * 1024)
+    server.listen(port, host)
+    batcher.start()
+    print(f"🌐 Сервис слушает http://{host}:{port} (микробатч до {batcher.batch_max} писем / "
+          f"{batcher.max_latency * 1000:.0f} мс)")
+
+    print("🔥 Загрузка модели...")
+    started = time.perf_counter()
+    await asyncio.get_running_loop().run_in_executor(batcher.executor, warm_up_service, batcher)
+    app.service_state['ready'] = True
+    print(f"✅ Сервис готов за {time.perf_counter() - started:.1f} с")
+    await asyncio.Event().wait()
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description="Mail Lens - HTTP-сервис классификации")
+    arg_parser.add_argument("--host", default=SERVICE_HOST)
+    arg_parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    arg_parser.add_argument("--batch-max", type=int, default=SERVICE_BATCH_MAX, help="Писем в микробатче")
+    arg_parser.add_argument("--max-latency-ms", type=float, default=SERVICE_MAX_LATENCY_MS,
+                            help="Максимальное ожидание микробатча, мс")
+    arg_parser.add_argument("--no-header-rules", action="store_true", help="Не применять правила по заголовкам")
+    arg_parser.add_argument("--verbose", action="store_true", help="Выводить лог classify_emails")
+    arg_parser.add_argument("--no-result-cache", action="store_true",
+                            help="Не кэшировать результаты повторяющихся писем")
+    arg_parser.add_argument("--cache-size", type=int, default=RESULT_CACHE_MAX_ENTRIES,
+                            help="Писем в кэше результатов")
+    arg_parser.add_argument("--cache-ttl", type=float, default=RESULT_CACHE_TTL_SEC,
+                            help="Время жизни результата в кэше, с")
+    args = arg_parser.parse_args()
+
+    header_rules = not args.no_header_rules
+    cache = None
+    if RESULT_CACHE_ENABLED and not args.no_result_cache:
+        cache = ResultCache(CATEGORIES_FILE, args.cache_size, args.cache_ttl)
+    batcher = MicroBatcher(CATEGORIES_FILE, args.batch_max, args.max_latency_ms, cache=cache,
+                           verbose=args.verbose or not SERVICE_QUIET, top_n=5, threshold=0.25,
+                           header_rules=header_rules, domain_prior=SERVICE_DOMAIN_PRIOR,
+                           near_duplicates=SERVICE_NEAR_DUPLICATES)
+    try:
+        asyncio.run(serve(args.host, args.port, batcher, header_rules))
+    except KeyboardInterrupt:
+        print("\n👋 Сервис остановлен")
+        batcher.print_stats()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
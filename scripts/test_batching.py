@@ -0,0 +1,103 @@
+"""Тесты планировщика батчей по бюджету токенов (batching.py)."""
+
+from batching import (_naive_padded_tokens, merge_encoding_stats, model_token_ids, new_encoding_stats,
+                      plan_batches, summarize_encoding_stats, tokenize_texts)
+
+
+def test_plan_batches_covers_every_index_once():
+    lengths = [5, 300, 12, 7, 128, 1, 64, 33]
+    batches = plan_batches(lengths, token_budget=256, max_batch_size=4)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+
+
+def test_plan_batches_respects_token_budget_with_padding():
+    lengths = [3, 50, 10, 40, 20, 30, 100, 5, 60]
+    budget = 120
+    for batch in plan_batches(lengths, token_budget=budget, max_batch_size=64):
+        longest = max(lengths[i] for i in batch)
+        # Один текст длиннее бюджета все равно должен попасть в свой батч
+        assert len(batch) == 1 or len(batch) * longest <= budget
+
+
+def test_plan_batches_respects_max_batch_size():
+    batches = plan_batches([1] * 10, token_budget=10_000, max_batch_size=3)
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+
+
+def test_plan_batches_groups_similar_lengths():
+    lengths = [500, 2, 480, 3, 490, 1]
+    batches = plan_batches(lengths, token_budget=1000, max_batch_size=64)
+    # Короткие письма не паддятся до длины длинных
+    assert sorted(batches[0]) == [1, 3, 5]
+    assert sorted(i for batch in batches[1:] for i in batch) == [0, 2, 4]
+
+
+def test_plan_batches_handles_empty_and_zero_lengths():
+    assert plan_batches([]) == []
+    assert plan_batches([0, 0], token_budget=1) == [[0], [1]]
+
+
+def test_naive_padded_tokens_uses_input_order():
+    assert _naive_padded_tokens([1, 10, 2, 3], batch_size=2) == 10 * 2 + 3 * 2
+
+
+def test_summarize_encoding_stats_ratios():
+    stats = new_encoding_stats()
+    merge_encoding_stats(stats, {'real_tokens': 60, 'padded_tokens': 80, 'naive_padded_tokens': 120,
+                                 'seconds': 2.0, 'texts': 4})
+    summary = summarize_encoding_stats(stats)
+    assert summary['padding_ratio'] == 0.25
+    assert summary['naive_padding_ratio'] == 0.5
+    assert summary['tokens_per_sec'] == 30.0
+    assert summary['texts'] == 4
+
+
+class _Tokenizer:
+    """Токенизатор-заглушка: слово - токен, пакетный вызов падает на тексте "boom"."""
+
+    def __init__(self):
+        self.tokenized = []
+
+    def __call__(self, texts, truncation, max_length, padding):
+        if isinstance(texts, list):
+            if "boom" in texts:
+                raise ValueError("batch failed")
+            return {'input_ids': [self(text, truncation, max_length, padding)['input_ids'] for text in texts]}
+        if texts == "boom":
+            raise ValueError("bad text")
+        self.tokenized.append(texts)
+        return {'input_ids': list(range(len(texts.split())))[:max_length]}
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def build_inputs_with_special_tokens(self, ids):
+        return [-1] + ids + [-2]
+
+
+class _Model:
+    max_seq_length = 3
+
+    def __init__(self):
+        self.tokenizer = _Tokenizer()
+
+
+def test_tokenize_texts_truncates_to_max_seq_length():
+    assert tokenize_texts(_Model(), ["a b", "a b c d e"]) == [[0, 1], [0, 1, 2]]
+
+
+def test_tokenize_texts_falls_back_to_one_by_one():
+    assert tokenize_texts(_Model(), ["a", "boom", "a b"]) == [[0], None, [0, 1]]
+
+
+def test_model_token_ids_reuses_window_ids():
+    model = _Model()
+    assert model_token_ids(model, ["a", "b c"], [[7], [8, 9]]) == [[-1, 7, -2], [-1, 8, -2]]
+    assert model.tokenizer.tokenized == []  # Окна уже токенизированы при нарезке
+
+
+def test_model_token_ids_tokenizes_only_texts_without_ids():
+    model = _Model()
+    assert model_token_ids(model, ["a", "a b c d"], [[5], None]) == [[-1, 5, -2], [0, 1, 2]]
+    assert model.tokenizer.tokenized == ["a b c d"]
+    assert model_token_ids(model, ["a b"], None) == [[0, 1]]
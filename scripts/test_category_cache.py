@@ -0,0 +1,99 @@
+"""Тесты кэша категорий и их эмбеддингов (category_cache.py)."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+import category_cache
+from category_cache import categories_fingerprint, get_category_embeddings, load_categories_cached
+
+DIM = 4
+
+
+class FakeModel:
+    """Модель, кодирующая текст в вектор из его длины; запоминает закодированные тексты."""
+
+    max_seq_length = 256
+    device = "cpu"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, convert_to_numpy=True, show_progress_bar=False):
+        self.encoded.extend(texts)
+        return np.array([[len(text)] * DIM for text in texts], dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def empty_memory(monkeypatch):
+    monkeypatch.setattr(category_cache, '_loaded', {})
+
+
+@pytest.fixture
+def categories_file(tmp_path):
+    path = tmp_path / "cats.txt"
+    path.write_text("Работа: задачи, встречи\nФинансы: счета, платежи\n", encoding="utf-8")
+    return path
+
+
+def _embeddings(categories_file, model, cache_root):
+    fingerprint, categories = load_categories_cached(str(categories_file), "model-a", model.max_seq_length)
+    return get_category_embeddings(fingerprint, categories, model, "model-a", str(cache_root), log=lambda _: None)
+
+
+def test_fingerprint_tracks_file_model_and_sequence_length(categories_file):
+    fingerprint = categories_fingerprint(str(categories_file), "model-a", 256)
+    assert fingerprint == categories_fingerprint(str(categories_file), "model-a", 256)
+    assert fingerprint != categories_fingerprint(str(categories_file), "model-b", 256)
+    assert fingerprint != categories_fingerprint(str(categories_file), "model-a", 512)
+    categories_file.write_text("Работа: задачи\n", encoding="utf-8")
+    assert fingerprint != categories_fingerprint(str(categories_file), "model-a", 256)
+
+
+def test_second_call_is_served_from_memory(categories_file, tmp_path):
+    model = FakeModel()
+    first = _embeddings(categories_file, model, tmp_path)
+    assert len(model.encoded) == 2 and first.shape == (2, DIM)
+    assert _embeddings(categories_file, model, tmp_path) is first
+    assert len(model.encoded) == 2
+
+
+def test_new_process_reads_embeddings_from_disk(categories_file, tmp_path, monkeypatch):
+    first = _embeddings(categories_file, FakeModel(), tmp_path)
+    monkeypatch.setattr(category_cache, '_loaded', {})
+
+    model = FakeModel()
+    np.testing.assert_array_equal(np.asarray(_embeddings(categories_file, model, tmp_path)), np.asarray(first))
+    assert model.encoded == []
+
+
+def test_edited_category_is_the_only_one_reencoded(categories_file, tmp_path):
+    _embeddings(categories_file, FakeModel(), tmp_path)
+    categories_file.write_text("Работа: задачи, встречи\nФинансы: счета, платежи, налоги\n", encoding="utf-8")
+
+    model = FakeModel()
+    embeddings = _embeddings(categories_file, model, tmp_path)
+    assert len(model.encoded) == 1 and model.encoded[0].startswith("Финансы")
+    assert embeddings.shape == (2, DIM)
+
+
+def test_model_change_reencodes_everything(categories_file, tmp_path):
+    _embeddings(categories_file, FakeModel(), tmp_path)
+    model = FakeModel()
+    model.max_seq_length = 512
+    _embeddings(categories_file, model, tmp_path)
+    assert len(model.encoded) == 2
+
+
+def test_broken_store_is_ignored(categories_file, tmp_path, capsys):
+    model = FakeModel()
+    path = category_cache._store_path(str(tmp_path), "model-a", model.max_seq_length)
+    _embeddings(categories_file, FakeModel(), tmp_path)
+    with open(path, 'wb') as f:
+        f.write(b"not an npz")
+    category_cache._loaded.clear()
+
+    assert _embeddings(categories_file, model, tmp_path).shape == (2, DIM)
+    assert len(model.encoded) == 2
+    assert "Не удалось прочитать кэш" in capsys.readouterr().out
@@ -0,0 +1,83 @@
+"""Тесты ленивого обхода входной папки (discovery.py): порядок и фильтры."""
+
+import os
+
+import pytest
+
+import discovery
+from discovery import configure_discovery, iter_files
+
+
+@pytest.fixture
+def tree(tmp_path):
+    files = {
+        "a.eml": 10,
+        "b.msg": 20,
+        "notes.txt": 5,
+        ".hidden.eml": 10,
+        "a/x.eml": 30,
+        "a/big.eml": 5000,
+        "a/empty.eml": 0,
+        "a/nested/y.eml": 10,
+        ".git/objects.eml": 10,
+        "spam/z.eml": 10,
+        "a-b.eml": 10,
+    }
+    for relpath, size in files.items():
+        path = tmp_path / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * size)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def default_settings(monkeypatch):
+    monkeypatch.setattr(discovery, '_settings', dict(discovery._settings))
+
+
+def _names(root, **filters) -> list:
+    return [os.path.relpath(record.path, root).replace(os.sep, "/") for record in iter_files(str(root), **filters)]
+
+
+def test_default_filters_and_stable_order(tree):
+    names = _names(tree)
+    assert names == ["a-b.eml", "a.eml", "a/big.eml", "a/empty.eml", "a/nested/y.eml", "a/x.eml",
+                     "b.msg", "spam/z.eml"]
+    assert names == sorted(names)
+
+
+def test_records_carry_size_and_mtime(tree):
+    record = next(record for record in iter_files(str(tree)) if record.path.endswith("x.eml"))
+    stat = os.stat(record.path)
+    assert (record.size, record.mtime_ns) == (30, stat.st_mtime_ns)
+
+
+def test_include_and_exclude_match_names_and_relative_paths(tree):
+    assert _names(tree, include=["*.msg"]) == ["b.msg"]
+    # Как в fnmatch, "*" захватывает и "/": шаблон папки действует на все поддерево
+    assert _names(tree, include=["a/*.eml"]) == ["a/big.eml", "a/empty.eml", "a/nested/y.eml", "a/x.eml"]
+    assert "spam/z.eml" not in _names(tree, exclude=[".*", "spam"])
+    assert _names(tree, exclude=[".*", "a"]) == ["a-b.eml", "a.eml", "b.msg", "spam/z.eml"]
+    assert ".hidden.eml" in _names(tree, exclude=[])
+
+
+def test_size_limits(tree):
+    assert "a/empty.eml" not in _names(tree, min_bytes=1)
+    assert "a/big.eml" not in _names(tree, max_bytes=1000)
+    assert _names(tree, min_bytes=25, max_bytes=1000) == ["a/x.eml"]
+
+
+def test_non_recursive_walk(tree):
+    assert _names(tree, recursive=False) == ["a-b.eml", "a.eml", "b.msg"]
+
+
+def test_configure_discovery_changes_defaults(tree):
+    configure_discovery(include=["*.eml"], min_bytes=1, recursive=False)
+    assert _names(tree) == ["a-b.eml", "a.eml"]
+    configure_discovery(recursive=True)  # None оставляет остальные настройки
+    assert "a/empty.eml" not in _names(tree) and "b.msg" not in _names(tree)
+
+
+def test_missing_folder_yields_nothing(tmp_path, capsys):
+    assert list(iter_files(str(tmp_path / "missing"))) == []
+    assert "Не удалось прочитать папку" in capsys.readouterr().out
@@ -0,0 +1,96 @@
+"""Тесты гистограмм категорий по доменам (domain_prior.py): пороги, затухание, вытеснение."""
+
+import pytest
+
+import domain_prior
+from domain_prior import DomainPrior
+
+DAY = 86400
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для domain_prior: clock[0] - текущий момент в секундах."""
+    clock = [1_000_000.0]
+    monkeypatch.setattr(domain_prior.time, 'time', lambda: clock[0])
+    return clock
+
+
+@pytest.fixture
+def prior(tmp_path, clock):
+    return DomainPrior(str(tmp_path / "cache" / "domain_prior.json"), half_life_days=30)
+
+
+def _observe(prior: DomainPrior, domain: str, category: str, times: int):
+    for _ in range(times):
+        prior.observe(domain, category)
+
+
+def test_needs_enough_letters_and_a_dominant_category(prior):
+    _observe(prior, "shop.ru", "Реклама", 4)
+    assert prior.lookup("shop.ru", min_count=5) is None
+    prior.observe("shop.ru", "Реклама")
+    assert prior.lookup("shop.ru", min_count=5) == ("Реклама", 1.0)
+
+    _observe(prior, "mixed.ru", "Реклама", 8)
+    _observe(prior, "mixed.ru", "Финансы", 2)
+    assert prior.lookup("mixed.ru", min_count=5, min_share=0.9) is None
+    assert prior.lookup("mixed.ru", min_count=5, min_share=0.8) == ("Реклама", pytest.approx(0.8))
+
+    assert prior.lookup("unknown.ru") is None and prior.lookup("") is None
+    assert prior.stats['lookups'] == 5 and prior.stats['updates'] == 15
+
+
+def test_counts_halve_every_half_life(prior, clock):
+    _observe(prior, "shop.ru", "Реклама", 8)
+    clock[0] += 30 * DAY
+    assert prior.lookup("shop.ru", min_count=4.5) is None
+    assert prior.lookup("shop.ru", min_count=3.9) == ("Реклама", 1.0)
+    assert prior.domains["shop.ru"]['counts']["Реклама"] == pytest.approx(4.0)
+
+
+def test_new_letters_outweigh_decayed_ones(prior, clock):
+    _observe(prior, "bank.ru", "Реклама", 10)
+    clock[0] += 120 * DAY  # Старые 10 писем весят 10 / 16
+    _observe(prior, "bank.ru", "Финансы", 6)
+    category, share = prior.lookup("bank.ru", min_count=5, min_share=0.9)
+    assert category == "Финансы" and share == pytest.approx(6 / 6.625)
+
+
+def test_prune_drops_faded_domains_and_removed_categories(prior, clock):
+    prior.observe("old.ru", "Реклама")
+    clock[0] += 200 * DAY  # 1 / 2^6.7 < PRIOR_MIN_WEIGHT
+    _observe(prior, "shop.ru", "Реклама", 3)
+    prior.observe("shop.ru", "Удаленная")
+    prior.prune(allowed_categories={"Реклама"})
+    assert set(prior.domains) == {"shop.ru"}
+    assert prior.domains["shop.ru"]['counts'] == {"Реклама": 3.0}
+
+
+def test_least_recently_seen_domains_are_evicted(tmp_path, clock):
+    prior = DomainPrior(str(tmp_path / "prior.json"), max_domains=2)
+    for domain in ("a.ru", "b.ru", "c.ru"):
+        prior.observe(domain, "Реклама")
+        clock[0] += 60
+    prior.observe("a.ru", "Реклама")
+    prior.prune()
+    assert set(prior.domains) == {"a.ru", "c.ru"}
+    assert prior.stats['evictions'] == 1
+
+
+def test_save_and_reload(prior, clock, capsys):
+    _observe(prior, "shop.ru", "Реклама", 5)
+    prior.save()
+    reloaded = DomainPrior(prior.path)
+    assert reloaded.lookup("shop.ru") == ("Реклама", 1.0)
+
+    with open(prior.path, 'w', encoding='utf-8') as f:
+        f.write("{broken")
+    assert DomainPrior(prior.path).domains == {}
+    assert "повреждены" in capsys.readouterr().out
+
+
+def test_registered_domain_without_tldextract(monkeypatch):
+    monkeypatch.setattr(domain_prior, '_extractor', False)
+    assert domain_prior.registered_domain("Mail.News.Example.com.") == "example.com"
+    assert domain_prior.registered_domain("  ") == ""
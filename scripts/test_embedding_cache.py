@@ -0,0 +1,102 @@
+"""Тесты персистентного кэша эмбеддингов (embedding_cache.py)."""
+
+import numpy as np
+import pytest
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, print_cache_stats
+
+DIM = 8
+
+
+@pytest.fixture
+def open_cache(tmp_path):
+    """Открывает кэш в tmp_path; все открытые соединения закрываются после теста."""
+    opened = []
+
+    def open_cache(model_name: str = "model-a", dim: int = DIM, max_seq_length: int = 256, **kwargs) -> EmbeddingCache:
+        cache = EmbeddingCache(str(tmp_path), model_name, max_seq_length, dim, **kwargs)
+        opened.append(cache)
+        return cache
+
+    yield open_cache
+    for cache in opened:
+        cache.close()
+
+
+def _vectors(count: int, dim: int = DIM) -> np.ndarray:
+    return np.random.default_rng(count).standard_normal((count, dim)).astype(np.float32)
+
+
+def test_round_trip_survives_reopen(open_cache):
+    cache = open_cache()
+    keys = [cache.key_for(f"письмо {i}") for i in range(3)]
+    vectors = _vectors(3)
+    cache.put_many(keys, vectors)
+    assert cache.stats['writes'] == 3
+    cache.close()
+
+    reopened = open_cache()
+    found = reopened.get_many(keys + [reopened.key_for("новое письмо")])
+    assert found[3] is None
+    for vector, stored in zip(vectors, found[:3]):
+        assert stored.dtype == np.float32
+        np.testing.assert_allclose(stored, vector, rtol=1e-3, atol=1e-3)  # float16 на диске
+    assert reopened.stats['hits'] == 3 and reopened.stats['misses'] == 1
+
+
+def test_key_depends_on_model_and_sequence_length(open_cache):
+    cache = open_cache()
+    assert cache.key_for("текст") == cache.key_for("текст")
+    assert cache.key_for("текст") != open_cache("model-b").key_for("текст")
+    assert cache.key_for("текст") != open_cache(max_seq_length=512).key_for("текст")
+
+
+def test_existing_keys_are_not_rewritten(open_cache):
+    cache = open_cache()
+    key = cache.key_for("текст")
+    cache.put_many([key], _vectors(1))
+    cache.put_many([key], _vectors(2)[1:])
+    assert len(cache) == 1 and cache.stats['writes'] == 1
+    np.testing.assert_allclose(cache.get_many([key])[0], _vectors(1)[0], rtol=1e-3, atol=1e-3)
+
+
+def test_least_recently_used_entries_are_evicted(open_cache, monkeypatch):
+    cache = open_cache(max_size_mb=4 * DIM * 2 / (1024 * 1024))  # Лимит - 4 вектора
+    assert cache.max_entries == 4
+    keys = [cache.key_for(str(i)) for i in range(6)]
+
+    monkeypatch.setattr(embedding_cache.time, 'time', lambda: 1000)
+    cache.put_many(keys[:4], _vectors(4))
+    monkeypatch.setattr(embedding_cache.time, 'time', lambda: 1000 + embedding_cache.CACHE_TOUCH_SEC)
+    cache.get_many(keys[:2])  # Попадание обновляет время использования
+    cache.put_many(keys[4:], _vectors(2))
+
+    assert len(cache) == 4 and cache.stats['evictions'] == 2
+    assert [vector is not None for vector in cache.get_many(keys)] == [True, True, False, False, True, True]
+
+
+def test_dimension_change_resets_cache(open_cache):
+    cache = open_cache()
+    key = cache.key_for("текст")
+    cache.put_many([key], _vectors(1))
+    cache.close()
+
+    messages = []
+    resized = open_cache(dim=DIM * 2, log=messages.append)
+    assert len(resized) == 0 and len(messages) == 1
+    assert resized.get_many([key]) == [None]
+
+
+def test_get_embedding_cache_reuses_open_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_cache, '_open_caches', {})
+    cache = embedding_cache.get_embedding_cache(str(tmp_path), "model-a", 256, DIM)
+    try:
+        assert embedding_cache.get_embedding_cache(str(tmp_path), "model-a", 256, DIM) is cache
+    finally:
+        cache.close()
+
+
+def test_print_cache_stats(capsys):
+    print_cache_stats({'hits': 3, 'misses': 1, 'writes': 1, 'evictions': 0})
+    assert "попаданий 3, промахов 1 (75.0%)" in capsys.readouterr().out
@@ -0,0 +1,159 @@
+"""Тесты правил по заголовкам (header_rules.py) и их применения в парсере."""
+
+import json
+import os
+from email.message import Message
+
+import pytest
+
+from classifier import _header_rule_stage
+from header_rules import HEADER_RULES_FILE, HeaderRuleEngine, get_header_rules, header_record
+from parser import parse_eml, parse_eml_bytes, read_skipped_body
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SENDERS_EXAMPLE = os.path.join(PROJECT_ROOT, 'categories', 'header_rules_senders.example.json')
+
+
+def _headers(**headers) -> Message:
+    msg = Message()
+    for name, value in headers.items():
+        msg[name.replace('_', '-')] = value
+    return msg
+
+
+def test_header_record_fields():
+    record = header_record(_headers(From='"Shop" <Sales@Deals.Example.com>', Precedence='bulk',
+                                    List_Unsubscribe='<mailto:unsub@example.com>', X_SG_EID='abc',
+                                    X_Mailer='  Mailer\n  5.0 '))
+    assert record['from_address'] == 'sales@deals.example.com'
+    assert record['from_local'] == 'sales' and record['from_domain'] == 'deals.example.com'
+    assert record['x_mailer'] == 'Mailer 5.0'
+    assert record['esp'] == 'sendgrid'
+    assert record['bulk'] == 'list_unsubscribe,precedence,esp'
+
+
+def test_header_record_is_compact():
+    record = header_record(_headers(From='user@example.com', Precedence='first-class'))
+    assert 'bulk' not in record and 'esp' not in record
+    assert header_record(_headers(Subject='без отправителя')) == {}
+
+
+def test_conditions_all_and_any():
+    engine = HeaderRuleEngine([
+        {"name": "promo", "category": "Реклама",
+         "all": [{"field": "bulk", "present": True}],
+         "any": [{"field": "from_local", "regex": "^promo$"}, {"field": "from_domain", "regex": "^promo\\."}]},
+        {"name": "no_list", "category": "Личное", "all": [{"field": "list_id", "present": False}]},
+    ])
+    assert engine.match({'bulk': 'list_id', 'list_id': 'x', 'from_local': 'PROMO'})['name'] == 'promo'
+    assert engine.match({'bulk': 'list_id', 'list_id': 'x', 'from_domain': 'promo.shop.ru'})['name'] == 'promo'
+    assert engine.match({'bulk': 'list_id', 'list_id': 'x', 'from_local': 'info'}) is None
+    assert engine.match({'from_local': 'promo'}) == {"name": "no_list", "category": "Личное"}
+    assert engine.match({}) is None
+
+
+def test_first_matching_rule_wins():
+    engine = HeaderRuleEngine([
+        {"name": "first", "category": "A", "any": [{"field": "from_local", "regex": "^news$"}]},
+        {"name": "second", "category": "B", "any": [{"field": "from_local", "regex": "^news$"}]},
+    ])
+    assert engine.match({'from_local': 'news'})['name'] == 'first'
+
+
+@pytest.mark.parametrize("spec", [
+    {"category": "A", "any": [{"field": "x", "present": True}]},
+    {"name": "a", "any": [{"field": "x", "present": True}]},
+    {"name": "a", "category": "A"},
+    {"name": "a", "category": "A", "any": [{"regex": "x"}]},
+])
+def test_invalid_rules_are_rejected(spec):
+    with pytest.raises(ValueError):
+        HeaderRuleEngine([spec])
+
+
+@pytest.mark.parametrize("headers, rule", [
+    (dict(From='jenkins@ci.example.com'), 'automation_sender'),
+    (dict(From='alerts@example.com', List_Unsubscribe='<mailto:u@example.com>'), None),
+    (dict(From='careers@company.ru'), 'career_sender'),
+    (dict(From='noreply@career.example.ru'), 'career_sender'),
+    (dict(From='hr@company.ru'), None),  # Внутренние письма отдела кадров решает модель
+    (dict(From='daily@news.example.com', List_Id='<daily.news.example.com>'), 'news_list'),
+    (dict(From='daily@news.example.com'), None),
+    (dict(From='sales@example.com', Precedence='bulk', List_Unsubscribe='<https://example.com/u>'),
+     'promo_bulk_sender'),
+    (dict(From='sales@example.com', List_Unsubscribe='<https://example.com/u>'), None),
+    (dict(From='colleague@example.com', Precedence='bulk'), None),
+])
+def test_default_rules(headers, rule):
+    match = get_header_rules(HEADER_RULES_FILE).match(header_record(_headers(**headers)))
+    assert (match['name'] if match else None) == rule
+
+
+def test_default_rules_do_not_name_sender_domains():
+    with open(HEADER_RULES_FILE, encoding='utf-8') as f:
+        rules = json.load(f)['rules']
+    for rule in rules:
+        for condition in rule.get('all', []) + rule.get('any', []):
+            if condition['field'] == 'from_domain':
+                # Только первая метка домена (news., careers.), а не домены конкретных отправителей
+                assert condition['regex'].startswith('^') and condition['regex'].endswith('\\.'), condition
+
+
+def test_senders_example_compiles():
+    assert get_header_rules(SENDERS_EXAMPLE).rules
+
+
+def test_rules_are_recompiled_when_file_changes(tmp_path):
+    rules_file = tmp_path / "rules.json"
+    rules_file.write_text(json.dumps([{"name": "a", "category": "A",
+                                       "any": [{"field": "from_local", "regex": "^a$"}]}]))
+    first = get_header_rules(str(rules_file))
+    assert get_header_rules(str(rules_file)) is first
+    rules_file.write_text(json.dumps({"rules": [{"name": "b", "category": "B",
+                                                 "any": [{"field": "from_local", "regex": "^b$"}]}]}))
+    assert get_header_rules(str(rules_file)).match({'from_local': 'b'})['category'] == 'B'
+    assert get_header_rules(str(tmp_path / "missing.json")).rules == []
+
+
+def test_parser_skips_body_of_rule_matched_email():
+    raw = (b"From: jenkins@ci.example.com\r\nSubject: Build failed\r\n"
+           b"Content-Type: text/plain; charset=utf-8\r\n\r\nBuild #42 failed\r\n")
+    matched = parse_eml_bytes(raw, "build.eml", header_rules=True)
+    assert matched['header_rule'] == {"name": "automation_sender", "category": "Системные уведомления"}
+    assert matched['body'] == "" and matched['body_source'] == raw
+    unmatched = parse_eml_bytes(raw, "build.eml", header_rules=False)
+    assert unmatched['header_rule'] is None
+    assert "Build #42 failed" in unmatched['body']
+
+
+def test_skipped_body_is_read_back(tmp_path):
+    raw = (b"From: jenkins@ci.example.com\r\nSubject: Build failed\r\n"
+           b"Content-Type: text/plain; charset=utf-8\r\n\r\nBuild #42 failed\r\n")
+    path = tmp_path / "build.eml"
+    path.write_bytes(raw)
+    matched = parse_eml(str(path), header_rules=True)
+    assert matched['body'] == "" and matched['body_source'] == str(path)
+    matched['filename'] = "ci/build.eml"
+    full = read_skipped_body(matched)
+    assert "Build #42 failed" in full['body'] and full['filename'] == "ci/build.eml"
+    assert full['body_source'] is None
+    assert read_skipped_body(full) is full
+
+
+@pytest.mark.parametrize("categories, expected", [
+    (["Системные уведомления", "Работа"], "automation_sender"),
+    (["Работа"], None),  # Категории правила нет в файле категорий
+])
+def test_rule_with_unknown_category_falls_through_with_body(categories, expected):
+    raw = (b"From: jenkins@ci.example.com\r\nSubject: Build failed\r\n"
+           b"Content-Type: text/plain; charset=utf-8\r\n\r\nBuild #42 failed\r\n")
+    email = parse_eml_bytes(raw, "build.eml", header_rules=True)
+    rule, email = _header_rule_stage(email, get_header_rules(HEADER_RULES_FILE), categories)
+    assert (rule['name'] if rule else None) == expected
+    assert ("Build #42 failed" in email['body']) == (expected is None)
+
+
+def test_body_is_read_when_rules_are_off_in_classifier():
+    raw = b"From: jenkins@ci.example.com\r\nSubject: Build failed\r\n\r\nBuild #42 failed\r\n"
+    rule, email = _header_rule_stage(parse_eml_bytes(raw, "build.eml", header_rules=True), None, [])
+    assert rule is None and "Build #42 failed" in email['body']
@@ -0,0 +1,177 @@
+"""Тесты манифеста инкрементальных запусков (incremental.py)."""
+
+import os
+
+import pytest
+
+import classifier
+import model_provider
+from discovery import FileRecord, iter_files
+from incremental import MANIFEST_FILE, RESULTS_STORE_FILE, Manifest, run_fingerprint
+from utils import clear_output_folder
+
+FINGERPRINT = "f" * 64
+
+
+@pytest.fixture
+def archive(tmp_path):
+    input_folder = tmp_path / "input"
+    (input_folder / "2024").mkdir(parents=True)
+    for name in ("a.eml", "b.eml", "2024/c.eml"):
+        (input_folder / name).write_bytes(f"Subject: {name}\n\nbody {name}\n".encode())
+    return str(input_folder), str(tmp_path / "output")
+
+
+def _result(name: str, processed: bool = True) -> dict:
+    return {'filename': name, 'processed': processed, 'categories': [('A', 0.9)] if processed else []}
+
+
+def _run(manifest: Manifest, input_folder: str, fingerprint: str = FINGERPRINT, failed=()) -> list:
+    """Один запуск main.py: план, "классификация" запланированных файлов и сохранение."""
+    to_process = manifest.plan(input_folder, iter_files(input_folder), fingerprint, "model-a")
+    for record in to_process:
+        name = os.path.relpath(record.path, input_folder)
+        manifest.record(input_folder, record.path, _result(name, processed=name not in failed))
+    manifest.save()
+    return sorted(os.path.relpath(record.path, input_folder) for record in to_process)
+
+
+def test_first_run_processes_everything(archive):
+    input_folder, output_folder = archive
+    manifest = Manifest(output_folder)
+    assert _run(manifest, input_folder) == ["2024/c.eml", "a.eml", "b.eml"]
+    assert manifest.stats['new'] == 3
+    assert [result['filename'] for result in manifest.merged_results()] == ["2024/c.eml", "a.eml", "b.eml"]
+
+
+def test_plan_returns_file_records_with_sizes(archive):
+    input_folder, output_folder = archive
+    to_process = Manifest(output_folder).plan(input_folder, iter_files(input_folder), FINGERPRINT)
+    assert all(isinstance(record, FileRecord) for record in to_process)
+    assert all(record.size == os.path.getsize(record.path) for record in to_process)
+
+
+def test_second_run_skips_unchanged_files(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder)
+    manifest = Manifest(output_folder)  # Загружается с диска
+    assert manifest.model_id == "model-a"
+    assert _run(manifest, input_folder) == []
+    assert manifest.stats['unchanged'] == 3 and manifest.stats['hashed'] == 0
+    assert len(manifest.merged_results()) == 3
+
+
+def test_changed_new_and_deleted_files(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder)
+    with open(os.path.join(input_folder, "a.eml"), "ab") as f:
+        f.write(b"more text\n")
+    with open(os.path.join(input_folder, "d.eml"), "wb") as f:
+        f.write(b"Subject: d\n\nnew\n")
+    os.remove(os.path.join(input_folder, "2024", "c.eml"))
+
+    manifest = Manifest(output_folder)
+    assert _run(manifest, input_folder) == ["a.eml", "d.eml"]
+    assert manifest.stats == {'unchanged': 1, 'new': 1, 'changed': 1, 'deleted': 1, 'hashed': 0}
+    assert [result['filename'] for result in manifest.merged_results()] == ["a.eml", "b.eml", "d.eml"]
+
+
+def test_touched_file_with_same_content_is_hashed_not_reprocessed(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder)
+    path = os.path.join(input_folder, "b.eml")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    manifest = Manifest(output_folder)
+    assert _run(manifest, input_folder) == []
+    assert manifest.stats['hashed'] == 1 and manifest.stats['unchanged'] == 3
+
+
+def test_file_changed_during_run_is_processed_again(archive):
+    input_folder, output_folder = archive
+    manifest = Manifest(output_folder)
+    to_process = manifest.plan(input_folder, iter_files(input_folder), FINGERPRINT, "model-a")
+    path = os.path.join(input_folder, "a.eml")
+    with open(path, "wb") as f:  # Файл переписан после plan(), тот же размер
+        f.write(b"Subject: a.eml\n\nBODY a.eml\n")
+    for record in to_process:
+        manifest.record(input_folder, record.path, _result(os.path.relpath(record.path, input_folder)))
+    manifest.save()
+    assert _run(Manifest(output_folder), input_folder) == ["a.eml"]
+
+
+def test_same_name_in_different_folders(archive):
+    input_folder, output_folder = archive
+    os.makedirs(os.path.join(input_folder, "2025"))
+    with open(os.path.join(input_folder, "2025", "c.eml"), "wb") as f:
+        f.write(b"Subject: other c\n\nbody\n")
+    manifest = Manifest(output_folder)
+    assert _run(manifest, input_folder) == ["2024/c.eml", "2025/c.eml", "a.eml", "b.eml"]
+    assert [result['filename'] for result in Manifest(output_folder).merged_results()] == [
+        "2024/c.eml", "2025/c.eml", "a.eml", "b.eml"]
+
+
+def test_failed_results_are_retried(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder, failed={"b.eml"})
+    assert _run(Manifest(output_folder), input_folder) == ["b.eml"]
+
+
+def test_new_fingerprint_reprocesses_everything(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder)
+    manifest = Manifest(output_folder)
+    assert _run(manifest, input_folder, fingerprint="e" * 64) == ["2024/c.eml", "a.eml", "b.eml"]
+    assert manifest.stats['changed'] == 0 and manifest.stats['new'] == 3
+
+
+def test_forget_drops_unparsed_file(archive):
+    input_folder, output_folder = archive
+    manifest = Manifest(output_folder)
+    _run(manifest, input_folder)
+    manifest.forget(input_folder, os.path.join(input_folder, "a.eml"))
+    manifest.save()
+    assert _run(Manifest(output_folder), input_folder) == ["a.eml"]
+
+
+def test_stream_wipe_keeps_manifest(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder)
+    with open(os.path.join(output_folder, "mail_lens_results_1.json"), "w") as f:
+        f.write("[]")
+    clear_output_folder(output_folder, keep=(MANIFEST_FILE, RESULTS_STORE_FILE))  # --stream / --staged
+    assert sorted(os.listdir(output_folder)) == sorted([MANIFEST_FILE, RESULTS_STORE_FILE])
+    assert _run(Manifest(output_folder), input_folder) == []
+    clear_output_folder(output_folder)  # --full
+    assert os.listdir(output_folder) == []
+
+
+def test_corrupt_manifest_starts_over(archive):
+    input_folder, output_folder = archive
+    _run(Manifest(output_folder), input_folder)
+    with open(os.path.join(output_folder, "manifest.json"), "w") as f:
+        f.write("{broken")
+    assert len(_run(Manifest(output_folder), input_folder)) == 3
+
+
+def test_run_fingerprint_tracks_model_settings_and_options(tmp_path, monkeypatch):
+    categories_file = tmp_path / "cats.txt"
+    categories_file.write_text("A: a\n", encoding="utf-8")
+    options = {'top_n': 5, 'threshold': 0.25}
+    base = run_fingerprint(str(categories_file), options, "model-a")
+
+    assert run_fingerprint(str(categories_file), dict(options), "model-a") == base
+    assert run_fingerprint(str(categories_file), options, "model-b") != base
+    assert run_fingerprint(str(categories_file), dict(options, threshold=0.3), "model-a") != base
+
+    monkeypatch.setattr(classifier, 'OTHER_CATEGORY_THRESHOLD', classifier.OTHER_CATEGORY_THRESHOLD + 0.1)
+    assert run_fingerprint(str(categories_file), options, "model-a") != base
+    monkeypatch.undo()
+
+    monkeypatch.setattr(model_provider, 'QUANTIZE_INT8', not model_provider.QUANTIZE_INT8)
+    assert run_fingerprint(str(categories_file), options, "model-a") != base
+    monkeypatch.undo()
+
+    categories_file.write_text("A: a, b\n", encoding="utf-8")
+    assert run_fingerprint(str(categories_file), options, "model-a") != base
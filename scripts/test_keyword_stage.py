@@ -0,0 +1,59 @@
+"""Тесты ступени ключевых слов (keyword_stage.py)."""
+
+import os
+
+import pytest
+
+from keyword_stage import KeywordMatcher, get_keyword_matcher
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CATEGORIES_FILE = os.path.join(PROJECT_ROOT, 'categories', 'new_cats.txt')
+
+
+@pytest.fixture
+def matcher():
+    return KeywordMatcher({
+        "Карьера": ["вакансия", "резюме", "HR"],
+        "Бизнес": ["firm", "file", "помещ", "счет-фактура"],
+        "Поддержка": ["ошибка 404", "тикет"],
+    })
+
+
+def test_russian_keywords_match_with_endings(matcher):
+    assert matcher.find("Вакансии нет, но есть вакансиями и резюме") == {"вакансия", "резюме"}
+    assert matcher.find("Аренда помещения") == {"помещ"}
+    assert matcher.find("Счет-фактура и ошибка 404") == {"счет фактура", "ошибка 404"}
+
+
+@pytest.mark.parametrize("text", [
+    "firmware filesystem hrm",  # Английское ключевое слово - начало другого слова
+    "тикетирование",  # Окончание длиннее KEYWORD_MAX_ENDING
+    "ошибка 4040",
+    "предрезюме",
+])
+def test_keyword_prefix_of_longer_word_does_not_match(matcher, text):
+    assert matcher.find(text) == set()
+
+
+def test_english_keywords_allow_plural(matcher):
+    assert matcher.find("Files from the firms, HR") == {"file", "firm", "hr"}
+
+
+def test_decide_requires_score_and_margin(matcher):
+    assert matcher.decide("Вакансия", "Резюме кандидата", min_score=3)[0][0] == "Карьера"
+    assert matcher.decide("", "Резюме кандидата", min_score=3) is None
+    assert matcher.decide("Вакансия", "Тикет по ошибке, ошибка 404", min_score=2, margin=0.5) is None
+    assert matcher.decide("", "") is None
+
+
+def test_matcher_is_compiled_once_per_file_content(tmp_path):
+    categories_file = tmp_path / "cats.txt"
+    categories_file.write_text("A: альфа\n", encoding="utf-8")
+    first = get_keyword_matcher(str(categories_file))
+    assert get_keyword_matcher(str(categories_file)) is first
+    categories_file.write_text("A: альфа, бета\n", encoding="utf-8")
+    assert get_keyword_matcher(str(categories_file)).find("бета") == {"бета"}
+
+
+def test_project_categories_compile():
+    assert get_keyword_matcher(CATEGORIES_FILE).find("Ваш файл и firmware") == set()
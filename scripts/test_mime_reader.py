@@ -0,0 +1,193 @@
+"""Тесты потокового чтения .eml (mime_reader.py) и декодирования частей в parser.py."""
+
+import io
+from email import policy
+from email.message import EmailMessage
+from email.parser import BytesParser
+
+import pytest
+
+import mime_reader
+import parser
+from mime_reader import MimeReader
+from parser import charset_key, decode_payload, normalize_charset, parse_eml_bytes
+
+
+def _decode(content_type, payload, charset):
+    return payload.decode(charset or 'utf-8')
+
+
+def _read(raw: bytes) -> MimeReader:
+    return MimeReader(io.BytesIO(raw)).read_body(_decode)
+
+
+def _message(text: str = "Привет", charset: str = 'utf-8') -> EmailMessage:
+    msg = EmailMessage()
+    msg['From'] = 'Отправитель <sender@example.com>'
+    msg['To'] = 'user@example.com'
+    msg['Subject'] = 'Тема письма'
+    msg.set_content(text, charset=charset)
+    return msg
+
+
+def _with_attachment() -> bytes:
+    msg = _message("Текст письма")
+    msg.add_alternative("<p>HTML <b>версия</b></p>", subtype='html')
+    msg.add_attachment(b"%PDF-1.4" + bytes(range(256)) * 40, maintype='application', subtype='pdf',
+                       filename='счет.pdf')
+    return msg.as_bytes()
+
+
+def _stdlib_texts(raw: bytes) -> list:
+    msg = BytesParser(policy=policy.default).parsebytes(raw)
+    return [part.get_payload(decode=True).decode(part.get_content_charset() or 'utf-8')
+            for part in msg.walk()
+            if part.get_content_type() in ('text/plain', 'text/html') and not part.is_attachment()]
+
+
+def test_text_parts_match_stdlib_parser():
+    raw = _with_attachment()
+    assert _read(raw).texts == _stdlib_texts(raw)
+
+
+def test_attachment_is_skipped_but_described():
+    reader = _read(_with_attachment())
+    assert reader.attachments == [{"name": "счет.pdf", "content_type": "application/pdf",
+                                   "size": reader.attachments[0]["size"]}]
+    # Размер base64 оценивается по длине кода
+    assert abs(reader.attachments[0]["size"] - (8 + 256 * 40)) <= 3
+    assert reader.stats['skipped_bytes'] > 0
+    assert not any("PDF" in text for text in reader.texts)
+
+
+def test_text_attachment_is_not_read_as_body():
+    msg = _message("Тело")
+    msg.add_attachment("секретный лог", filename='log.txt')
+    reader = _read(msg.as_bytes())
+    assert [text.strip() for text in reader.texts] == ["Тело"]
+    assert reader.attachments[0]["name"] == 'log.txt'
+    assert reader.attachments[0]["content_type"] == 'text/plain'
+
+
+def test_nested_message_rfc822():
+    inner = _message("Вложенное письмо")
+    outer = _message("Пересылаю")
+    outer.add_attachment(inner)
+    texts = [text.strip() for text in _read(outer.as_bytes()).texts]
+    assert texts == ["Пересылаю", "Вложенное письмо"]
+
+
+def test_declared_charsets_are_used():
+    for charset in ('koi8-r', 'windows-1251', 'utf-8'):
+        raw = _message("Счет на оплату 42", charset=charset).as_bytes()
+        email_data = parse_eml_bytes(raw, f"{charset}.eml", header_rules=False)
+        assert "Счет на оплату 42" in email_data["body"], charset
+        assert email_data["subject"] == "Тема письма"
+
+
+def test_undeclared_cp1251_falls_back():
+    raw = (b"From: a@example.com\r\nSubject: test\r\nContent-Type: text/plain\r\n"
+           b"Content-Transfer-Encoding: 8bit\r\n\r\n" + "Квитанция об оплате".encode('cp1251') + b"\r\n")
+    assert "Квитанция об оплате" in parse_eml_bytes(raw, "cp1251.eml", header_rules=False)["body"]
+
+
+@pytest.fixture
+def decode_stats(monkeypatch):
+    """Пустые кэш выученных кодировок и счетчики декодирования."""
+    monkeypatch.setattr(parser, '_learned_charsets', {})
+    monkeypatch.setattr(parser, 'DECODE_STATS', dict.fromkeys(parser.DECODE_STATS, 0))
+    return parser.DECODE_STATS
+
+
+def test_charset_labels_are_normalized():
+    assert normalize_charset('"Win-1251"') == 'cp1251'
+    assert normalize_charset('iso-8859-1') == 'cp1252'
+    assert normalize_charset('KOI8-R') == 'koi8-r'
+    assert normalize_charset('x-unknown') is None and normalize_charset(None) is None
+
+
+def test_charset_key_prefers_mailer_then_sender_domain():
+    msg = _message()
+    assert charset_key(msg) == "domain:example.com"
+    msg['X-Mailer'] = 'The Bat!  v9.1'
+    assert charset_key(msg) == "mailer:The Bat! v9.1"
+    assert charset_key(EmailMessage()) is None
+
+
+def test_cascade_result_is_learned_for_the_sender(decode_stats):
+    payload = "Квитанция об оплате".encode('cp1251')
+    assert decode_payload(payload, key="domain:bank.ru") == "Квитанция об оплате"
+    assert decode_stats['cascade'] == 1 and parser._learned_charsets == {"domain:bank.ru": 'cp1251'}
+
+    # Следующее письмо того же отправителя - без каскада, даже с неверной меткой charset
+    assert decode_payload(payload, charset='utf-8', key="domain:bank.ru") == "Квитанция об оплате"
+    assert decode_stats['declared_failed'] == 1 and decode_stats['learned'] == 1
+    assert decode_stats['cascade'] == 1
+
+    # Без ключа ничего не запоминается
+    decode_payload(payload)
+    assert decode_stats['cascade'] == 2 and len(parser._learned_charsets) == 1
+
+
+def test_wrong_learned_charset_falls_back_to_cascade(decode_stats):
+    parser._learned_charsets["domain:bank.ru"] = 'utf-8'
+    payload = "Счет".encode('cp1251')
+    assert decode_payload(payload, key="domain:bank.ru") == "Счет"
+    assert decode_stats['learned'] == 0 and decode_stats['cascade'] == 1
+    assert parser._learned_charsets["domain:bank.ru"] == 'cp1251'
+
+
+def test_learned_charsets_are_bounded(decode_stats, monkeypatch):
+    monkeypatch.setattr(parser, 'LEARNED_CHARSETS_MAX', 2)
+    payload = "Счет".encode('cp1251')
+    for domain in ("a.ru", "b.ru", "c.ru"):
+        decode_payload(payload, key=f"domain:{domain}")
+    assert list(parser._learned_charsets) == ["domain:b.ru", "domain:c.ru"]
+
+
+def test_ascii_and_line_endings(decode_stats):
+    assert decode_payload(b"plain\r\ntext", charset='koi8-r') == "plain\ntext"
+    assert decode_stats['ascii'] == 1 and decode_stats['declared'] == 0
+
+
+def test_html_part_is_converted_to_text():
+    msg = _message("")
+    msg.set_content("<html><style>p {}</style><body><p>Ваш&nbsp;заказ</p></body></html>", subtype='html')
+    body = parse_eml_bytes(msg.as_bytes(), "html.eml", header_rules=False)["body"]
+    assert "Ваш заказ" in body
+    assert "<p>" not in body and "p {}" not in body
+
+
+def test_long_part_is_truncated(monkeypatch):
+    monkeypatch.setattr(mime_reader, 'MIME_MAX_PART_BYTES', 2000)
+    msg = _message("строка текста\n" * 1000)
+    msg.replace_header('Content-Transfer-Encoding', '8bit')
+    reader = _read(msg.as_bytes())
+    assert reader.stats['truncated_parts'] == 1
+    assert reader.stats['text_bytes'] <= 2000
+    assert reader.texts[0].startswith("строка текста")
+
+
+def test_reading_stops_when_text_budget_is_filled(monkeypatch):
+    monkeypatch.setattr(mime_reader, 'MIME_TEXT_BUDGET_CHARS', 10)
+    msg = _message("Первая часть достаточно длинная")
+    msg.add_alternative("<p>Вторая часть</p>", subtype='html')
+    reader = _read(msg.as_bytes())
+    assert reader.stats['stopped_early']
+    assert len(reader.texts) == 1
+
+
+def test_unterminated_multipart_does_not_fail():
+    raw = _with_attachment()
+    cut = raw[:raw.index(b'filename')]  # Файл оборван посреди вложения
+    reader = _read(cut)
+    assert reader.texts == _stdlib_texts(raw)
+
+
+def test_headers_only_read_leaves_body_unread():
+    source = io.BytesIO(_with_attachment())
+    reader = MimeReader(source)
+    headers = reader.read_headers()
+    assert headers['Subject'] == 'Тема письма'
+    assert reader.texts == [] and reader.attachments == []
+    assert source.tell() < len(source.getvalue()) // 2
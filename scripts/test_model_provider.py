@@ -0,0 +1,101 @@
+"""Тесты ленивой потокобезопасной загрузки модели (model_provider.py)."""
+
+import threading
+import time
+
+import pytest
+
+import backends
+import model_provider
+
+
+class FakeModel:
+    max_seq_length = 128
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+
+class LoadLog(list):
+    def __init__(self):
+        super().__init__()
+        self.failing = set()
+
+
+@pytest.fixture
+def loads(monkeypatch, tmp_path):
+    """
+    Подменяет загрузку бэкенда медленной фальшивой: возвращает список имен загруженных моделей.
+    Модели из loads.failing не загружаются.
+    """
+    loads = LoadLog()
+
+    def load_backend_model(name, backend, cache_dir):
+        loads.append(name)
+        time.sleep(0.05)  # Окно, в котором параллельные запросы застают загрузку
+        if name in loads.failing:
+            raise OSError(f"нет модели {name}")
+        return FakeModel(name)
+
+    monkeypatch.setattr(backends, 'load_backend_model', load_backend_model)
+    monkeypatch.setattr(backends, 'check_backend_available', lambda backend: None)
+    monkeypatch.setattr(model_provider, 'MODEL_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(model_provider, 'INFERENCE_BACKEND', "torch")
+    monkeypatch.setattr(model_provider, 'QUANTIZE_INT8', False)
+    for name in ('_model', '_model_name', '_model_id'):
+        monkeypatch.setattr(model_provider, name, None)
+    return loads
+
+
+def test_model_is_loaded_on_first_use(loads):
+    assert not model_provider.is_loaded()
+    assert model_provider.configured_model_id() == model_provider.MODEL_CANDIDATES[0][0]
+    assert loads == []
+
+    model = model_provider.get_model()
+    assert model_provider.is_loaded()
+    assert model_provider.get_model() is model
+    assert loads == [model_provider.MODEL_CANDIDATES[0][0]]
+
+
+def test_concurrent_callers_share_one_load(loads):
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(model_provider.get_model())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len(models) == 8 and all(model is models[0] for model in models)
+
+
+def test_fallback_chain_and_model_id(loads):
+    primary, fallback = model_provider.MODEL_CANDIDATES[0][0], model_provider.MODEL_CANDIDATES[1][0]
+    loads.failing.add(primary)
+    assert model_provider.get_model().name == fallback
+    assert model_provider.get_model_name() == fallback
+    assert model_provider.get_model_id() == fallback
+    assert loads == [primary, fallback]
+
+
+def test_all_candidates_failing_raises(loads):
+    loads.failing.update(name for name, _ in model_provider.MODEL_CANDIDATES)
+    with pytest.raises(RuntimeError):
+        model_provider.get_model()
+    assert not model_provider.is_loaded()
+
+
+def test_configure_reloads_in_new_mode(loads):
+    model_provider.get_model()
+    model_provider.configure(backend="onnx")
+    assert not model_provider.is_loaded()
+    assert model_provider.get_model_id() == f"{model_provider.MODEL_CANDIDATES[0][0]}@onnx"
+    assert len(loads) == 2
+
+    model_provider.configure(backend="onnx")  # Тот же режим - модель остается
+    assert model_provider.is_loaded()
+    with pytest.raises(ValueError):
+        model_provider.configure(backend="tflite")
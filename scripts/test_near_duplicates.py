@@ -0,0 +1,117 @@
+"""Тесты SimHash и индекса почти одинаковых писем (near_duplicates.py)."""
+
+import random
+
+import pytest
+
+from near_duplicates import NearDuplicateIndex, cluster_report, shingles, simhash
+
+RECEIPT = """Здравствуйте, {name}! Ваш заказ номер {order} от {date} оплачен.
+Сумма к оплате {amount} руб. Чек отправлен на адрес {email}.
+Отследить заказ можно по ссылке https://shop.example.com/orders/{order}?utm=mail
+Спасибо, что выбрали наш магазин. Если у вас есть вопросы, ответьте на это письмо
+или позвоните в службу поддержки по телефону 8 800 555 35 35. Команда магазина."""
+
+WORDS = ("отчет встреча проект задача бюджет договор счет поставка склад отгрузка сотрудник "
+         "отпуск приказ совещание клиент звонок презентация сервер релиз ошибка").split()
+
+
+def _receipt(i: int) -> str:
+    return RECEIPT.format(name=f"Клиент {i}", order=100000 + i * 7919, date=f"{i % 28 + 1}.03.2024",
+                          amount=f"{i * 37 % 9000},{i % 100:02d}", email=f"user{i}@example.com")
+
+
+def _random_text(seed: int, words: int = 80) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _result(category: str, confidence: float = 0.8) -> dict:
+    return {'processed': True, 'categories': [(category, confidence)], 'confidence': confidence,
+            'is_other_category': False}
+
+
+def test_shingles_replace_numbers_urls_and_addresses():
+    assert shingles("Заказ 12345 на http://a.ru/x?y=1 для a.b@c.ru оплачен")[:3] == [
+        "заказ 0 на", "0 на url", "на url для"]
+    assert shingles("Заказ 1") == []
+
+
+def test_simhash_ignores_changed_numbers_and_links():
+    assert simhash(_receipt(1)) == simhash(_receipt(2))
+
+
+def test_simhash_is_close_for_small_edits_and_far_for_other_texts():
+    base = _random_text(1, 200)
+    assert (simhash(base) ^ simhash(base + " дополнение")).bit_count() <= 3
+    edited = base.replace("проект", "продукт", 1) + " дополнение"
+    assert (simhash(base) ^ simhash(edited)).bit_count() <= 8
+    assert all((simhash(base) ^ simhash(_random_text(seed, 200))).bit_count() > 20 for seed in range(2, 12))
+
+
+def test_short_texts_are_not_hashed():
+    assert simhash("Спасибо!") is None
+    assert simhash("") is None
+
+
+def test_index_finds_twin_within_distance(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.json"), max_distance=3)
+    value = simhash(_receipt(1))
+    entry_id = index.add(value, "first.eml", _result("Чеки"))
+    for bit in (0, 17, 40):  # До max_distance бит в разных полосах
+        value ^= 1 << bit
+    assert index.find(value) == entry_id
+    assert index.find(value ^ 1 << 63) is None  # Четвертый бит - уже не близнец
+
+
+def test_pending_cluster_is_dropped_when_leader_fails(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.json"))
+    value = simhash(_receipt(1))
+    entry_id = index.add(value, "first.eml")
+    assert index.entries[entry_id]['categories'] is None
+    index.resolve(entry_id, {'processed': False, 'categories': []})
+    assert index.find(value) is None
+
+
+def test_index_round_trips_through_disk(tmp_path):
+    path = str(tmp_path / "near" / "index.json")
+    index = NearDuplicateIndex(path)
+    resolved = index.add(simhash(_receipt(1)), "receipt.eml", _result("Чеки", 0.91))
+    index.add(simhash(_random_text(3)), "pending.eml")  # Без классификации не сохраняется
+    index.record_reuse(resolved)
+    index.save()
+
+    loaded = NearDuplicateIndex(path)
+    assert len(loaded.entries) == 1
+    entry = loaded.entries[loaded.find(simhash(_receipt(5)))]
+    assert entry['categories'] == [("Чеки", 0.91)]
+    assert entry['count'] == 2
+
+
+def test_evict_keeps_recently_seen_clusters(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.json"), max_entries=2)
+    ids = [index.add(simhash(_random_text(seed)), f"{seed}.eml", _result("A")) for seed in range(3)]
+    for entry_id, last_seen in zip(ids, (30.0, 10.0, 20.0)):
+        index.entries[entry_id]['last_seen'] = last_seen
+    index.evict()
+    assert sorted(index.entries) == [ids[0], ids[2]]
+    assert index.stats['evictions'] == 1
+    assert index.find(simhash(_random_text(1))) is None
+
+
+def test_cluster_report_buckets(tmp_path):
+    index = NearDuplicateIndex(str(tmp_path / "index.json"))
+    big = index.add(simhash(_receipt(1)), "receipt.eml", _result("Чеки"))
+    index.add(simhash(_random_text(7)), "single.eml", _result("Работа"))
+    for _ in range(6):
+        index.record_reuse(big)
+    report = cluster_report(index)
+    assert report['clusters'] == 2 and report['emails'] == 8
+    assert report['buckets']['1'] == 1 and report['buckets']['6-20'] == 1
+    assert report['largest'] == [{'filename': 'receipt.eml', 'size': 7, 'category': 'Чеки'}]
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 7])
+def test_bands_cover_all_bits(tmp_path, max_distance):
+    index = NearDuplicateIndex(str(tmp_path / "index.json"), max_distance=max_distance)
+    assert sum(width for _, width in index._band_shifts) == 64
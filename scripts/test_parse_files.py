@@ -0,0 +1,97 @@
+"""Тесты параллельного парсинга (parser.parse_files): порядок, ошибки и изоляция падений."""
+
+import time
+
+import pytest
+
+import parser
+from parser import iter_parsed, parse_files
+
+
+def _write_emails(folder, count: int) -> list:
+    paths = []
+    for i in range(count):
+        path = folder / f"{i:02d}.eml"
+        path.write_bytes(f"From: a{i}@example.com\r\nSubject: s{i}\r\n\r\nbody {i}\r\n".encode())
+        paths.append(str(path))
+    return paths
+
+
+def _fake_pool(tasks, header_rules, workers, stats):
+    """
+    Заглушка _run_pool: файл с "crash" в имени роняет процесс. Как и в настоящем пуле,
+    оборванными считаются пачка с ним и все пачки, отданные после нее.
+    """
+    tasks = iter(tasks)
+    for task in tasks:
+        if any("crash" in path for path in task):
+            return task + [path for rest in tasks for path in rest]
+        for path in task:
+            yield path, {'filename': path, 'body': path}, None
+    return []
+
+
+def test_files_are_parsed_in_input_order(tmp_path):
+    paths = _write_emails(tmp_path, 5)
+    (tmp_path / "broken.msg").write_bytes(b"not an OLE2 file")
+    paths.insert(2, str(tmp_path / "broken.msg"))
+
+    parsed, errors, stats = parse_files(paths, header_rules=False)
+    assert [email_data['subject'] for _, email_data in parsed] == [f"s{i}" for i in range(5)]
+    assert [error['filename'] for error in errors] == ["broken.msg"]
+    assert stats['files'] == 6 and stats['parsed'] == 5 and stats['errors'] == 1
+    assert stats['bytes'] > 0 and stats['busy_sec'] > 0
+
+
+def test_process_pool_matches_sequential_parsing(tmp_path):
+    paths = _write_emails(tmp_path, 7)
+    sequential, _, _ = parse_files(paths, header_rules=False)
+    pooled, errors, stats = parse_files(paths, header_rules=False, workers=2, chunk_size=3)
+    assert pooled == sequential and errors == []
+    assert stats['workers'] == 2 and stats['crashes'] == 0
+
+
+def test_crashing_file_fails_alone(monkeypatch, capsys):
+    monkeypatch.setattr(parser, '_run_pool', _fake_pool)
+    paths = [f"{i}.eml" for i in range(4)] + ["crash.eml"] + [f"{i}.eml" for i in range(4, 9)]
+
+    parsed, errors, stats = parse_files(paths, header_rules=False, workers=2, chunk_size=3)
+    assert [path for path, _ in parsed] == [path for path in paths if path != "crash.eml"]
+    assert errors == [{"filename": "crash.eml", "path": "crash.eml",
+                       "error": "Процесс парсинга аварийно завершился"}]
+    assert stats['crashes'] == 2  # Падение пула и повторное падение на виновном файле
+    assert "crash.eml" in capsys.readouterr().out
+
+
+def test_iter_parsed_streams_results(monkeypatch):
+    monkeypatch.setattr(parser, '_run_pool', _fake_pool)
+    consumed = []
+
+    def paths():
+        for i in range(6):
+            consumed.append(i)
+            yield f"{i}.eml"
+
+    results = iter_parsed(paths(), header_rules=False, workers=2, chunk_size=2)
+    assert next(results)[0] == "0.eml"
+    assert len(consumed) < 6  # Вход читается по мере надобности
+    assert [path for path, _, _ in results] == [f"{i}.eml" for i in range(1, 6)]
+
+
+def test_file_timeout_becomes_an_error(monkeypatch):
+    if not hasattr(parser.signal, 'SIGALRM'):
+        pytest.skip("лимит времени на файл работает только на Unix")
+
+    def parse_file(path, header_rules):
+        if path == "slow.eml":
+            time.sleep(5)
+        return {'filename': path}
+
+    monkeypatch.setattr(parser, 'parse_file', parse_file)
+    previous = parser.signal.signal(parser.signal.SIGALRM, parser._on_timeout)
+    try:
+        outputs, _, _ = parser._parse_chunk(["slow.eml", "fast.eml"], header_rules=False, timeout=0.1)
+    finally:
+        parser.signal.signal(parser.signal.SIGALRM, previous)
+    assert outputs[0][1] is None and "лимит" in outputs[0][2]
+    assert outputs[1] == ("fast.eml", {'filename': "fast.eml"}, None)
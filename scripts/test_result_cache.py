@@ -0,0 +1,129 @@
+"""Тесты кэша результатов сервиса (result_cache.py): ключи, счетчики и сброс."""
+
+import os
+import time
+
+import pytest
+
+pytest.importorskip("cachetools")
+
+import classifier
+import model_provider
+from result_cache import ResultCache, content_key
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Подменяет classify_emails: запоминает вызовы и возвращает категорию по теме письма."""
+    calls = []
+
+    def classify_emails(emails, categories_file, **kwargs):
+        calls.append(([email['filename'] for email in emails], kwargs))
+        return [{'filename': email['filename'], 'processed': email['subject'] != 'fail',
+                 'categories': [(email['subject'], 0.9)]} for email in emails]
+
+    monkeypatch.setattr(classifier, 'classify_emails', classify_emails)
+    monkeypatch.setattr(model_provider, 'is_loaded', lambda: True)
+    monkeypatch.setattr(model_provider, 'get_model_id', lambda: "model-a")
+    return calls
+
+
+@pytest.fixture
+def categories_file(tmp_path):
+    path = tmp_path / "cats.txt"
+    path.write_text("A: a\n", encoding="utf-8")
+    return path
+
+
+def _email(filename: str, subject: str = "A", body: str = "Текст письма", sender: str = "a@example.com") -> dict:
+    return {'filename': filename, 'subject': subject, 'body': body, 'headers': {'from_address': sender}}
+
+
+def test_content_key_normalizes_whitespace_and_ignores_filename():
+    assert content_key(_email("1.eml", body="Текст  письма\n")) == content_key(_email("2.eml", body="Текст письма"))
+    assert content_key(_email("1.eml")) == content_key(_email("1.eml", sender="A@Example.com"))
+    assert content_key(_email("1.eml")) != content_key(_email("1.eml", sender="b@example.com"))
+    assert content_key(_email("1.eml")) != content_key(_email("1.eml", subject="B"))
+
+
+def test_content_key_covers_all_headers_and_rule():
+    plain = _email("1.eml")
+    bulk = _email("1.eml")
+    bulk['headers']['bulk'] = 'list_unsubscribe'
+    assert content_key(plain) != content_key(bulk)
+    assert content_key(bulk) == content_key({**bulk, 'headers': dict(reversed(list(bulk['headers'].items())))})
+
+    ruled = {**plain, 'header_rule': {'name': 'promo', 'category': 'Реклама'}}
+    assert content_key(plain) != content_key(ruled)
+
+
+def test_duplicates_are_classified_once_and_then_cached(calls, categories_file):
+    cache = ResultCache(str(categories_file))
+    results = cache.classify_emails([_email("1.eml"), _email("2.eml"), _email("3.eml", subject="B")], top_n=5)
+    assert calls[0][0] == ["1.eml", "3.eml"]
+    assert [result['filename'] for result in results] == ["1.eml", "2.eml", "3.eml"]
+
+    again = cache.classify_emails([_email("4.eml")], top_n=5)
+    assert len(calls) == 1
+    assert again[0]['filename'] == "4.eml" and again[0]['cached']
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 3
+
+
+def test_options_are_part_of_the_key_but_verbose_is_not(calls, categories_file):
+    cache = ResultCache(str(categories_file))
+    cache.classify_emails([_email("1.eml")], verbose=False, top_n=5)
+    cache.classify_emails([_email("1.eml")], verbose=True, top_n=5)
+    assert len(calls) == 1
+    assert calls[0][1] == {'verbose': False, 'top_n': 5}
+    cache.classify_emails([_email("1.eml")], verbose=False, top_n=3)
+    assert len(calls) == 2
+
+
+def test_failed_results_are_not_cached(calls, categories_file):
+    cache = ResultCache(str(categories_file))
+    cache.classify_emails([_email("1.eml", subject="fail")])
+    cache.classify_emails([_email("1.eml", subject="fail")])
+    assert len(calls) == 2 and len(cache) == 0
+
+
+def test_cached_results_are_copies(calls, categories_file):
+    cache = ResultCache(str(categories_file))
+    cache.classify_emails([_email("1.eml")])[0]['categories'].append(("mutated", 0.0))
+    assert cache.classify_emails([_email("1.eml")])[0]['categories'] == [("A", 0.9)]
+
+
+def test_categories_change_invalidates_cache(calls, categories_file):
+    cache = ResultCache(str(categories_file))
+    cache.classify_emails([_email("1.eml")])
+    categories_file.write_text("A: a, b\n", encoding="utf-8")
+    stat = os.stat(categories_file)
+    os.utime(categories_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    cache.classify_emails([_email("1.eml")])
+    assert len(calls) == 2
+    assert cache.stats['invalidations'] == 1
+
+
+def test_model_change_invalidates_cache(calls, categories_file, monkeypatch):
+    cache = ResultCache(str(categories_file))
+    cache.classify_emails([_email("1.eml")])
+
+    monkeypatch.setattr(model_provider, 'is_loaded', lambda: False)  # Модель еще не загружена - не сброс
+    cache.classify_emails([_email("1.eml")])
+    assert len(calls) == 1 and cache.stats['invalidations'] == 0
+
+    monkeypatch.setattr(model_provider, 'is_loaded', lambda: True)
+    monkeypatch.setattr(model_provider, 'get_model_id', lambda: "model-b")
+    cache.classify_emails([_email("1.eml")])
+    assert len(calls) == 2 and cache.stats['invalidations'] == 1
+
+
+def test_eviction_and_expiry_are_counted(calls, categories_file):
+    cache = ResultCache(str(categories_file), max_entries=2, ttl=0.2)
+    cache.classify_emails([_email(f"{i}.eml", subject=str(i)) for i in range(3)])
+    assert len(cache) == 2 and cache.stats['evictions'] == 1
+    assert cache.stats['invalidations'] == 0
+
+    time.sleep(0.3)
+    cache.classify_emails([_email("9.eml", subject="9")])
+    assert cache.stats['expired'] == 2
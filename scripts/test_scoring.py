@@ -0,0 +1,63 @@
+"""Тесты векторизованного скоринга (scoring.py) против прежнего скоринга по одному письму."""
+
+import numpy as np
+import pytest
+
+from scoring import cosine_matrix, normalize_rows, score_batch
+
+CATEGORIES = [f"cat_{i}" for i in range(12)]
+
+
+def _baseline_scores(similarities, top_n: int, threshold: float):
+    """Прежний classify_text: нормализация в [0, 1], сортировка, порог и top_n для одного письма."""
+    results = sorted(((name, float((value + 1) / 2)) for name, value in zip(CATEGORIES, similarities)),
+                     key=lambda x: x[1], reverse=True)
+    normalized_threshold = (threshold + 1) / 2 if threshold < 0 else threshold
+    return [r for r in results if r[1] >= normalized_threshold][:top_n]
+
+
+def _baseline_is_other(category_scores, other_threshold: float) -> bool:
+    return not category_scores or category_scores[0][1] < other_threshold
+
+
+@pytest.mark.parametrize("top_n, threshold", [(5, 0.1), (3, 0.55), (12, -0.2), (20, 0.0), (1, 0.9)])
+def test_score_batch_matches_per_email_scoring(top_n, threshold):
+    rng = np.random.default_rng(top_n)
+    similarities = rng.uniform(-1, 1, size=(40, len(CATEGORIES))).astype(np.float32)
+    scored = score_batch(similarities, CATEGORIES, top_n, threshold, other_threshold=0.6)
+
+    assert len(scored) == len(similarities)
+    for row, email_similarities in enumerate(similarities):
+        expected = _baseline_scores(email_similarities, top_n, threshold)
+        actual = scored.category_scores(row)
+        assert [name for name, _ in actual] == [name for name, _ in expected]
+        assert [score for _, score in actual] == pytest.approx([score for _, score in expected])
+        assert bool(scored.is_other[row]) == _baseline_is_other(expected, 0.6)
+
+
+def test_score_batch_accepts_single_vector():
+    similarities = np.linspace(-1, 1, len(CATEGORIES))
+    scored = score_batch(similarities, CATEGORIES, top_n=2, threshold=0.0)
+    assert [name for name, _ in scored.category_scores(0)] == ["cat_11", "cat_10"]
+    assert scored.category_scores(0)[0][1] == pytest.approx(1.0)
+
+
+def test_best_category_ignores_threshold():
+    similarities = np.full((1, len(CATEGORIES)), -0.9, dtype=np.float32)
+    similarities[0, 4] = -0.5
+    scored = score_batch(similarities, CATEGORIES, top_n=5, threshold=0.5, other_threshold=0.3)
+    assert scored.category_scores(0) == []
+    assert scored.best_category(0) == ("cat_4", pytest.approx(0.25))
+    assert bool(scored.is_other[0])
+
+
+def test_cosine_matrix_matches_numpy():
+    torch = pytest.importorskip("torch")
+    rng = np.random.default_rng(0)
+    emails = rng.normal(size=(6, 16)).astype(np.float32)
+    categories = rng.normal(size=(len(CATEGORIES), 16)).astype(np.float32)
+
+    actual = cosine_matrix(torch.from_numpy(emails), normalize_rows(torch.from_numpy(categories)))
+    expected = ((emails / np.linalg.norm(emails, axis=1, keepdims=True))
+                @ (categories / np.linalg.norm(categories, axis=1, keepdims=True)).T)
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
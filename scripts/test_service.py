@@ -0,0 +1,109 @@
+"""Тесты микробатчей сервиса (service.MicroBatcher) и разбора JSON-запросов без tornado."""
+
+import asyncio
+
+import pytest
+
+import classifier
+from service import MicroBatcher, email_from_json
+
+
+def _email(subject: str) -> dict:
+    return {'filename': f"{subject}.eml", 'subject': subject, 'body': "текст", 'headers': {}}
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """
+    Подменяет classify_emails: запоминает темы писем каждого вызова.
+    Тема "boom" роняет вызов, тема "short" - результатов на один меньше, чем писем.
+    """
+    batches = []
+
+    def classify_emails(emails, categories_file, **kwargs):
+        batches.append([email['subject'] for email in emails])
+        if any(email['subject'] == "boom" for email in emails):
+            raise RuntimeError("модель упала")
+        results = [{'filename': email['filename'], 'processed': True, 'categories': [(email['subject'], 0.9)]}
+                   for email in emails]
+        return results[:-1] if any(email['subject'] == "short" for email in emails) else results
+
+    monkeypatch.setattr(classifier, 'classify_emails', classify_emails)
+    return batches
+
+
+def _serve(batcher: MicroBatcher, *groups) -> list:
+    """Отправляет группы писем одновременными запросами; группы - друг за другом."""
+    async def run():
+        loop_task = batcher.start()
+        try:
+            outcomes = []
+            for group in groups:
+                outcomes += await asyncio.gather(*(batcher.submit(_email(subject)) for subject in group),
+                                                 return_exceptions=True)
+            return outcomes
+        finally:
+            loop_task.cancel()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        batcher.executor.shutdown()
+
+
+def test_concurrent_requests_share_micro_batches(batches):
+    batcher = MicroBatcher("cats.txt", batch_max=3, max_latency_ms=50)
+    outcomes = _serve(batcher, ["a", "b", "c", "d", "e"], ["f"])
+    assert batches == [["a", "b", "c"], ["d", "e"], ["f"]]
+    assert [outcome['categories'][0][0] for outcome in outcomes] == ["a", "b", "c", "d", "e", "f"]
+    assert batcher.stats['requests'] == 6 and batcher.stats['batches'] == 3
+    assert batcher.stats['batch_sizes'] == {'3': 1, '2': 1, '1': 1}
+
+
+def test_classification_error_fails_only_its_batch(batches, capsys):
+    batcher = MicroBatcher("cats.txt", batch_max=2, max_latency_ms=50)
+    outcomes = _serve(batcher, ["boom", "a"], ["b"])
+    assert [isinstance(outcome, RuntimeError) for outcome in outcomes] == [True, True, False]
+    assert outcomes[2]['categories'][0][0] == "b"
+    assert batcher.stats['errors'] == 2
+    assert "модель упала" in capsys.readouterr().out
+
+
+def test_missing_results_become_errors(batches):
+    batcher = MicroBatcher("cats.txt", batch_max=2, max_latency_ms=50)
+    outcomes = _serve(batcher, ["a", "short"])
+    assert outcomes[0]['categories'][0][0] == "a"
+    assert isinstance(outcomes[1], RuntimeError)
+    assert batcher.stats['errors'] == 1
+
+
+def test_verbose_and_options_are_passed_through(monkeypatch):
+    calls = []
+    monkeypatch.setattr(classifier, 'classify_emails',
+                        lambda emails, categories_file, **kwargs: calls.append(kwargs) or [])
+    MicroBatcher("cats.txt", top_n=3).classify([_email("a")])
+    MicroBatcher("cats.txt", verbose=True).classify([_email("a")])
+    assert calls == [{'verbose': False, 'top_n': 3}, {'verbose': True}]
+
+
+def test_result_cache_is_used_when_given():
+    class Cache:
+        def __init__(self):
+            self.calls = []
+
+        def classify_emails(self, emails, **kwargs):
+            self.calls.append(kwargs)
+            return [{'filename': email['filename'], 'cached': True} for email in emails]
+
+    cache = Cache()
+    assert MicroBatcher("cats.txt", cache=cache, top_n=3).classify([_email("a")])[0]['cached']
+    assert cache.calls == [{'verbose': False, 'top_n': 3}]
+
+
+def test_email_from_json():
+    email = email_from_json({"subject": "Счет", "body": "Оплатите", "headers": {"From": "Bank <Info@Bank.ru>"}})
+    assert email["filename"] == "request" and email["header_rule"] is None
+    assert email["headers"]["from_address"] == "info@bank.ru"
+    for data in ({}, {"filename": "a.eml"}, ["subject"], "текст"):
+        with pytest.raises(ValueError):
+            email_from_json(data)
@@ -0,0 +1,72 @@
+"""Тесты нарезки писем на окна по токенам (token_windows.py)."""
+
+import re
+
+import pytest
+
+from token_windows import pool_window_embeddings, split_token_windows, split_token_windows_with_ids
+
+
+class _FastTokenizer:
+    """Быстрый токенизатор-заглушка: слово - токен с offset mapping, id - номер слова в тексте."""
+
+    is_fast = True
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text, add_special_tokens, truncation, return_offsets_mapping):
+        self.calls.append(len(text))
+        spans = [match.span() for match in re.finditer(r'\S+', text)]
+        return {'input_ids': list(range(len(spans))), 'offset_mapping': spans}
+
+
+def _text(words: int) -> str:
+    return " ".join(f"w{i}" for i in range(words))
+
+
+def test_single_window_is_truncated_to_budget():
+    assert split_token_windows(_text(10), _FastTokenizer(), window_tokens=4) == ["w0 w1 w2 w3"]
+
+
+def test_windows_carry_their_token_ids():
+    windows = split_token_windows_with_ids(_text(10), _FastTokenizer(), window_tokens=4, max_windows=2)
+    assert windows == [("w0 w1 w2 w3", [0, 1, 2, 3]), ("w4 w5 w6 w7", [4, 5, 6, 7])]
+
+
+def test_short_text_gives_one_window():
+    assert split_token_windows_with_ids("a b", _FastTokenizer(), window_tokens=4, max_windows=3) == [
+        ("a b", [0, 1])]
+
+
+def test_only_prefix_is_tokenized():
+    tokenizer = _FastTokenizer()
+    text = _text(10_000)
+    split_token_windows(text, tokenizer, window_tokens=8)
+    assert max(tokenizer.calls) < len(text) // 10
+
+
+def test_slow_tokenizer_and_empty_text():
+    class SlowTokenizer:
+        is_fast = False
+
+    assert split_token_windows_with_ids("текст", SlowTokenizer(), 4) == [("текст", None)]
+    assert split_token_windows("", _FastTokenizer(), 4) == []
+
+
+def test_pooling_mean_max_and_errors():
+    torch = pytest.importorskip("torch")
+    first, second, single = torch.tensor([1.0, 4.0]), torch.tensor([3.0, 2.0]), torch.tensor([5.0, 5.0])
+    error = RuntimeError("окно не закодировано")
+    embeddings = [first, second, single, error, error, second]
+    owners = [0, 0, 1, 2, 3, 3]
+
+    mean = pool_window_embeddings(embeddings, owners, count=5)
+    assert torch.allclose(mean[0], torch.tensor([2.0, 3.0]))
+    assert mean[1] is single
+    assert mean[2] is error  # Ни одного закодированного окна
+    assert torch.allclose(mean[3], second)  # Упавшее окно не портит остальные
+    assert isinstance(mean[4], ValueError)  # У письма нет окон
+
+    maximum = pool_window_embeddings(embeddings, owners, count=5, mode="max")
+    assert torch.allclose(maximum[0], torch.tensor([3.0, 4.0]))
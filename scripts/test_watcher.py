@@ -0,0 +1,214 @@
+"""Тесты демона (watcher.py): дебаунс, микробатчи, журнал обработанных файлов и повторы."""
+
+import json
+import os
+import time
+
+import pytest
+
+import classifier
+import watcher
+from watcher import MailWatcher, RotatingJsonlWriter, WatchState
+
+
+@pytest.fixture
+def folders(tmp_path):
+    input_folder, output_folder = tmp_path / "input", tmp_path / "output"
+    input_folder.mkdir()
+    return str(input_folder), str(output_folder)
+
+
+@pytest.fixture
+def classified(monkeypatch):
+    """Подменяет classify_emails: письма с темой "fail" не обрабатываются; список тем вызовов."""
+    classified = []
+
+    def classify_emails(emails, categories_file, **kwargs):
+        classified.append([email['subject'] for email in emails])
+        return [{'filename': email['filename'], 'subject': email['subject'],
+                 'processed': email['subject'] != "fail", 'categories': [("A", 0.9)]} for email in emails]
+
+    monkeypatch.setattr(classifier, 'classify_emails', classify_emails)
+    return classified
+
+
+def _watcher(folders, **kwargs) -> MailWatcher:
+    kwargs.setdefault('debounce', 2.0)
+    return MailWatcher(*folders, "cats.txt", header_rules=False, **kwargs)
+
+
+def _write(folder: str, name: str, subject: str = "s", body: str = "body") -> str:
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(f"From: a@example.com\r\nSubject: {subject}\r\n\r\n{body}\r\n".encode())
+    return path
+
+
+def _tick(mail_watcher: MailWatcher, now: float):
+    mail_watcher._retry_failed(now)
+    mail_watcher._drain_events(now)
+    mail_watcher._check_pending(now)
+
+
+def _close(mail_watcher: MailWatcher):
+    mail_watcher.output.close()
+    mail_watcher.state.close()
+
+
+def _results(output_folder: str) -> list:
+    with open(os.path.join(output_folder, watcher.WATCH_OUTPUT_FILE), encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_mail_file_filter():
+    assert watcher.is_mail_file("/in/a.eml") and watcher.is_mail_file("b.msg")
+    assert not watcher.is_mail_file("/in/.a.eml") and not watcher.is_mail_file("~a.eml")
+    assert not watcher.is_mail_file("a.eml.part")
+
+
+def test_file_is_taken_after_it_stops_changing(folders):
+    mail_watcher = _watcher(folders)
+    path = _write(folders[0], "a.eml")
+    mail_watcher.notify(path)
+    _tick(mail_watcher, 100.0)  # Первое наблюдение размера и mtime
+    _tick(mail_watcher, 101.0)
+    assert mail_watcher.ready == []
+
+    _write(folders[0], "a.eml", body="body, дописанное MTA")
+    _tick(mail_watcher, 101.5)  # Файл изменился - отсчет заново
+    _tick(mail_watcher, 103.0)
+    assert mail_watcher.ready == []
+    _tick(mail_watcher, 103.6)
+    assert [path for path, _ in mail_watcher.ready] == [path]
+    assert mail_watcher.batch_started == 103.6
+    _close(mail_watcher)
+
+
+def test_deleted_pending_file_is_dropped(folders):
+    mail_watcher = _watcher(folders)
+    path = _write(folders[0], "a.eml")
+    mail_watcher.notify(path)
+    _tick(mail_watcher, 100.0)
+    os.remove(path)
+    _tick(mail_watcher, 103.0)
+    assert mail_watcher.pending == {} and mail_watcher.ready == []
+    _close(mail_watcher)
+
+
+def test_batch_is_due_by_size_or_wait(folders):
+    mail_watcher = _watcher(folders, debounce=0.0, batch_max=2, max_wait=5.0)
+    mail_watcher.notify(_write(folders[0], "a.eml"))
+    _tick(mail_watcher, 100.0)
+    _tick(mail_watcher, 100.0)
+    assert not mail_watcher._batch_due(104.0)
+    assert mail_watcher._batch_due(105.0)
+
+    mail_watcher.notify(_write(folders[0], "b.eml"))
+    _tick(mail_watcher, 101.0)
+    _tick(mail_watcher, 101.0)
+    assert mail_watcher._batch_due(101.0)
+    _close(mail_watcher)
+
+
+def test_handled_files_are_skipped_after_restart(folders, classified):
+    input_folder, output_folder = folders
+    mail_watcher = _watcher(folders, debounce=0.0)
+    path = _write(input_folder, "a.eml", subject="first")
+    mail_watcher.scan()
+    _tick(mail_watcher, 100.0)
+    _tick(mail_watcher, 100.0)
+    mail_watcher.flush()
+    _close(mail_watcher)
+    assert classified == [["first"]]
+    assert [(record['path'], record['processed']) for record in _results(output_folder)] == [("a.eml", True)]
+
+    restarted = _watcher(folders, debounce=0.0)
+    restarted.scan()
+    _tick(restarted, 200.0)
+    _tick(restarted, 200.0)
+    assert restarted.ready == []
+
+    _write(input_folder, "a.eml", subject="second", body="новое содержимое")  # Изменение - снова в работу
+    restarted.scan()
+    _tick(restarted, 201.0)
+    _tick(restarted, 201.0)
+    assert [p for p, _ in restarted.ready] == [path]
+    _close(restarted)
+
+
+def test_journal_survives_torn_line_and_forgets_deleted_files(folders):
+    input_folder, output_folder = folders
+    path = _write(input_folder, "a.eml")
+    gone = _write(input_folder, "gone.eml")
+    state = WatchState(os.path.join(output_folder, watcher.WATCH_STATE_FILE), input_folder)
+    state.mark([(path, os.stat(path)), (gone, os.stat(gone))])
+    state.close()
+    os.remove(gone)
+    with open(state.path, 'a', encoding='utf-8') as f:
+        f.write('{"file": "b.eml", "si')  # Обрыв записи при аварийном завершении
+
+    reloaded = WatchState(state.path, input_folder)
+    assert reloaded.is_handled(path, os.stat(path))
+    assert set(reloaded.handled) == {"a.eml"}
+    reloaded.close()
+    with open(state.path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 1  # Журнал сжат
+
+
+def test_failed_files_are_retried_a_limited_number_of_times(folders, classified, monkeypatch):
+    monkeypatch.setattr(watcher, 'WATCH_RETRY_SEC', 60.0)
+    monkeypatch.setattr(watcher, 'WATCH_MAX_RETRIES', 2)
+    input_folder, output_folder = folders
+    mail_watcher = _watcher(folders, debounce=0.0)
+    path = _write(input_folder, "a.eml", subject="fail")
+
+    def attempt(now: float) -> bool:
+        _tick(mail_watcher, now)
+        _tick(mail_watcher, now)
+        if not mail_watcher.ready:
+            return False
+        mail_watcher.flush()
+        return True
+
+    start = time.time()  # flush отсчитывает время повтора от текущего времени
+    mail_watcher.notify(path)
+    assert attempt(start)
+    assert mail_watcher.failed[path][2] == 1
+    assert not attempt(start + 30)  # Рано повторять
+    assert attempt(start + 61)  # Повтор
+    assert not attempt(start + 10_000)  # Лимит повторов исчерпан
+    assert len(classified) == 2
+    assert mail_watcher.state.handled == {}
+    assert mail_watcher.stats['errors'] == 2
+
+    _write(input_folder, "a.eml", subject="ok", body="исправленное письмо")
+    mail_watcher.notify(path)
+    assert attempt(start + 20_000)
+    assert path not in mail_watcher.failed and "a.eml" in mail_watcher.state.handled
+    _close(mail_watcher)
+
+
+def test_unparsable_file_is_recorded_as_error(folders, classified):
+    input_folder, output_folder = folders
+    mail_watcher = _watcher(folders, debounce=0.0)
+    path = os.path.join(input_folder, "broken.msg")
+    with open(path, 'wb') as f:
+        f.write(b"not an OLE2 file")
+    mail_watcher.notify(path)
+    _tick(mail_watcher, 0.0)
+    _tick(mail_watcher, 0.0)
+    mail_watcher.flush()
+    _close(mail_watcher)
+    assert classified == []
+    [record] = _results(output_folder)
+    assert record['path'] == "broken.msg" and not record['processed'] and record['error']
+
+
+def test_output_rotation(tmp_path):
+    path = str(tmp_path / "out" / "results.jsonl")
+    writer = RotatingJsonlWriter(path, max_mb=50 / (1024 * 1024), backups=2)
+    writer.write_many([{'n': i, 'pad': "x" * 30} for i in range(5)])
+    writer.close()
+    assert sorted(os.listdir(tmp_path / "out")) == ["results.jsonl", "results.jsonl.1", "results.jsonl.2"]
+    with open(path, encoding='utf-8') as f:
+        assert [json.loads(line)['n'] for line in f] == [4]
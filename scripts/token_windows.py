@@ -0,0 +1,91 @@
+"""
+token_windows.py - Обрезка и нарезка длинных писем по токенам модели.
+
+Модель видит не больше max_seq_length токенов, поэтому токенизировать
+весь текст письма бессмысленно. Здесь токенизируется только префикс,
+которого хватает на нужное количество окон, и текст режется по границам
+токенов. Id токенов окон отдаются дальше в batching, чтобы текст не
+токенизировался при кодировании второй раз. В режиме окон эмбеддинги окон одного письма усредняются
+(или берется максимум по компонентам).
+"""
+
+from typing import List, Optional, Tuple
+
+# === КОНФИГУРАЦИЯ ===
+CHARS_PER_TOKEN_ESTIMATE = 6  # Начальная оценка символов на токен для размера префикса
+POOLING_MODES = ("mean", "max")
+
+
+def split_token_windows(text: str, tokenizer, window_tokens: int, max_windows: int = 1) -> List[str]:
+    """
+    Режет текст на окна по window_tokens токенов (не больше max_windows окон).
+    Токенизируется только префикс текста, покрывающий нужные окна.
+    При max_windows=1 возвращает текст, обрезанный до бюджета модели.
+    Для токенизаторов без offset mapping текст возвращается как есть.
+    """
+    return [window for window, _ in split_token_windows_with_ids(text, tokenizer, window_tokens, max_windows)]
+
+
+def split_token_windows_with_ids(text: str, tokenizer, window_tokens: int,
+                                 max_windows: int = 1) -> List[Tuple[str, Optional[List[int]]]]:
+    """
+    То же, что split_token_windows, но вместе с текстом окна возвращает id его токенов
+    (без служебных). None вместо id - текст не токенизирован (его токенизирует batching).
+    """
+    if not text or window_tokens <= 0 or max_windows <= 0:
+        return [(text, None)] if text else []
+    if not getattr(tokenizer, 'is_fast', False):
+        return [(text, None)]
+
+    needed_tokens = window_tokens * max_windows
+    prefix_chars = needed_tokens * CHARS_PER_TOKEN_ESTIMATE
+    while True:
+        prefix = text[:prefix_chars]
+        encoding = tokenizer(prefix, add_special_tokens=False, truncation=False,
+                             return_offsets_mapping=True)
+        offsets = encoding['offset_mapping']
+        input_ids = encoding['input_ids']
+        # Токенов хватает или текст закончился. Последний токен префикса может быть
+        # обрезанным словом, поэтому запрашиваем на один токен больше.
+        if len(offsets) > needed_tokens or len(prefix) == len(text):
+            break
+        prefix_chars *= 2
+
+    windows = []
+    for start in range(0, min(len(offsets), needed_tokens), window_tokens):
+        window_offsets = offsets[start:start + window_tokens]
+        window_text = text[window_offsets[0][0]:window_offsets[-1][1]].strip()
+        if window_text:
+            windows.append((window_text, list(input_ids[start:start + window_tokens])))
+    return windows or [(text[:prefix_chars], None)]
+
+
+def pool_window_embeddings(embeddings: list, owners: List[int], count: int, mode: str = "mean") -> list:
+    """
+    Собирает эмбеддинги окон в один эмбеддинг на письмо.
+    :param embeddings: Эмбеддинги окон (тензор или исключение для упавших окон)
+    :param owners: Индекс письма для каждого окна
+    :param count: Количество писем
+    :param mode: "mean" - среднее, "max" - максимум по компонентам
+    :return: Список длины count: эмбеддинг письма или исключение, если не закодировано ни одно окно
+    """
+    import torch
+
+    grouped = [[] for _ in range(count)]
+    errors = [None] * count
+    for owner, embedding in zip(owners, embeddings):
+        if isinstance(embedding, Exception):
+            errors[owner] = embedding
+        else:
+            grouped[owner].append(embedding)
+
+    pooled = []
+    for i, window_embeddings in enumerate(grouped):
+        if not window_embeddings:
+            pooled.append(errors[i] or ValueError("Нет закодированных окон"))
+        elif len(window_embeddings) == 1:
+            pooled.append(window_embeddings[0])
+        else:
+            stacked = torch.stack(window_embeddings)
+            pooled.append(stacked.max(dim=0).values if mode == "max" else stacked.mean(dim=0))
+    return pooled
@@ -71,6 +71,21 @@ def extract_true_category_from_filename(filename: str) -> str:
     # Если не нашли соответствие - вызываем исключение
     raise ValueError(f"Не удалось определить категорию для файла: {filename}")
 
+# Английские ключевые слова, которые добавляются к описаниям категорий для мультиязычности
+ENGLISH_KEYWORDS = {
+    "Техническая поддержка": "technical support, help desk, IT support, troubleshooting",
+    "Финансовые операции": "financial transactions, payments, invoices, bills, accounting",
+    "Вакансии и карьера": "vacancies, careers, jobs, recruitment, CV, resume",
+    "Рекламная рассылка": "advertising, marketing, promotion, commercial offers",
+    "Новостные рассылки": "newsletters, news, updates, announcements",
+    "Регистрация и подтверждение": "registration, confirmation, account, verification",
+    "Транспорт и путешествия": "transport, travel, tickets, booking, flights, hotels",
+    "Неприемлемый контент": "spam, inappropriate content, adult, violence",
+    "Бизнес-корреспонденция": "business correspondence, partners, contracts, negotiations",
+    "Системные уведомления": "system notifications, alerts, reports, automated messages",
+    "Другое": "other, miscellaneous, uncategorized"
+}
+
 def load_categories(file_path: str) -> dict:
     """Загружает категории из файла. Комбинирует название и описание для лучшего контекста."""
     categories = {}
@@ -90,22 +105,8 @@ def load_categories(file_path: str) -> dict:
                 enhanced_description = f"{name}. {description}"
                 
                 # Добавляем английские ключевые слова для мультиязычности
-                english_keywords = {
-                    "Техническая поддержка": "technical support, help desk, IT support, troubleshooting",
-                    "Финансовые операции": "financial transactions, payments, invoices, bills, accounting",
-                    "Вакансии и карьера": "vacancies, careers, jobs, recruitment, CV, resume",
-                    "Рекламная рассылка": "advertising, marketing, promotion, commercial offers",
-                    "Новостные рассылки": "newsletters, news, updates, announcements",
-                    "Регистрация и подтверждение": "registration, confirmation, account, verification",
-                    "Транспорт и путешествия": "transport, travel, tickets, booking, flights, hotels",
-                    "Неприемлемый контент": "spam, inappropriate content, adult, violence",
-                    "Бизнес-корреспонденция": "business correspondence, partners, contracts, negotiations",
-                    "Системные уведомления": "system notifications, alerts, reports, automated messages",
-                    "Другое": "other, miscellaneous, uncategorized"
-                }
-                
-                if name in english_keywords:
-                    enhanced_description += f". {english_keywords[name]}"
+                if name in ENGLISH_KEYWORDS:
+                    enhanced_description += f". {ENGLISH_KEYWORDS[name]}"
                 
                 categories[name] = enhanced_description
                 print(f"   📍 {name}: {enhanced_description[:80]}...")
@@ -115,11 +116,27 @@ def load_categories(file_path: str) -> dict:
     print(f"\n📂 Загружено категорий: {len(categories)}")
     return categories
 
-def clear_output_folder(output_folder: str):
-    """Очищает папку data_output."""
+def load_category_keywords(file_path: str) -> dict:
+    """Загружает списки ключевых слов категорий из файла (строки вида 'Категория: слово, слово')."""
+    keywords = {}
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.strip()
+            if not line or ":" not in line:
+                continue
+            name, words = line.split(":", 1)
+            keywords.setdefault(name.strip(), []).extend(
+                word.strip() for word in words.split(",") if word.strip()
+            )
+    return keywords
+
+def clear_output_folder(output_folder: str, keep=()):
+    """Очищает папку data_output (кроме файлов с именами из keep)."""
     output_path = Path(output_folder)
     if output_path.exists():
         for file in output_path.iterdir():
+            if file.name in keep:
+                continue
             if file.is_file():
                 file.unlink()
             elif file.is_dir():
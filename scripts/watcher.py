@@ -0,0 +1,361 @@
+"""
+watcher.py - Демон: классификация писем, появляющихся в data_input, почти в реальном времени.
+
+Модель загружается один раз и остается в памяти. События файловой системы
+(watchdog) отмечают файлы как ожидающие; файл берется в работу, когда его размер
+и mtime не меняются WATCH_DEBOUNCE_SEC (MTA мог еще не дописать письмо). Готовые
+файлы собираются в микробатч, который классифицируется, как только набралось
+WATCH_BATCH_MAX писем или первое письмо ждет дольше WATCH_MAX_WAIT_SEC.
+
+Результаты дописываются в data_output/watch_results.jsonl с ротацией по размеру.
+Успешно обработанные файлы (путь, размер, mtime) записываются в журнал watch_state.jsonl,
+поэтому после перезапуска демон не классифицирует их повторно. Файлы с ошибкой
+парсинга или классификации в журнал не попадают и повторяются через WATCH_RETRY_SEC
+(не больше WATCH_MAX_RETRIES раз, дальше - после изменения файла или перезапуска).
+"""
+
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+# === КОНФИГУРАЦИЯ ===
+WATCH_DEBOUNCE_SEC = 2.0  # Сколько размер и mtime файла должны не меняться
+WATCH_BATCH_MAX = 64  # Писем в микробатче
+WATCH_MAX_WAIT_SEC = 5.0  # Максимальное ожидание первого письма микробатча
+WATCH_POLL_SEC = 0.5  # Период проверки ожидающих файлов
+WATCH_RESCAN_SEC = 30.0  # Период полного пересканирования папки без watchdog
+WATCH_OUTPUT_FILE = "watch_results.jsonl"
+WATCH_STATE_FILE = "watch_state.jsonl"
+WATCH_OUTPUT_MAX_MB = 50  # Размер выходного файла до ротации
+WATCH_OUTPUT_BACKUPS = 5  # Сколько старых файлов хранить (watch_results.jsonl.1 ...)
+WATCH_RETRY_SEC = 60.0  # Через сколько повторить файл с ошибкой
+WATCH_MAX_RETRIES = 3  # Повторов подряд до следующего изменения файла или перезапуска
+# Гистограммы доменов и индекс почти одинаковых писем сохраняются на диск после каждого
+# вызова classify_emails; в демоне это происходило бы на каждый микробатч (как в service.py)
+WATCH_DOMAIN_PRIOR = False
+WATCH_NEAR_DUPLICATES = False
+
+SUPPORTED_EXTENSIONS = (".eml", ".msg")
+
+
+def is_mail_file(path: str) -> bool:
+    """Письмо, а не временный или скрытый файл, который MTA еще пишет."""
+    name = os.path.basename(path)
+    return name.endswith(SUPPORTED_EXTENSIONS) and not name.startswith(('.', '~'))
+
+
+class RotatingJsonlWriter:
+    """Дописывает JSON-строки в файл, при превышении размера сдвигает файлы .1, .2, ..."""
+
+    def __init__(self, path: str, max_mb: float = WATCH_OUTPUT_MAX_MB, backups: int = WATCH_OUTPUT_BACKUPS):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def write_many(self, records: List[dict]):
+        for record in records:
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class WatchState:
+    """Журнал обработанных файлов: относительный путь -> (размер, mtime)."""
+
+    def __init__(self, path: str, input_folder: str):
+        self.path = path
+        self.input_folder = input_folder
+        self.handled = {}  # относительный путь -> [размер, mtime_ns]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._load()
+        self._journal = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    self.handled[record['file']] = [record['size'], record['mtime_ns']]
+                except (ValueError, KeyError):
+                    continue  # Недописанная строка после аварийного завершения
+        # Сжимаем журнал: остаются только существующие файлы
+        self.handled = {key: value for key, value in self.handled.items()
+                        if os.path.exists(os.path.join(self.input_folder, key))}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key, (size, mtime_ns) in self.handled.items():
+                f.write(json.dumps({'file': key, 'size': size, 'mtime_ns': mtime_ns}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def _key(self, path: str) -> str:
+        return os.path.relpath(path, self.input_folder)
+
+    def is_handled(self, path: str, stat: os.stat_result) -> bool:
+        return self.handled.get(self._key(path)) == [stat.st_size, stat.st_mtime_ns]
+
+    def mark(self, items: List[tuple]):
+        """Отмечает файлы [(путь, stat)] обработанными (после записи их результатов)."""
+        for path, stat in items:
+            key = self._key(path)
+            self.handled[key] = [stat.st_size, stat.st_mtime_ns]
+            self._journal.write(json.dumps({'file': key, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+                                           ensure_ascii=False) + '\n')
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def close(self):
+        self._journal.close()
+
+
+class MailWatcher:
+    """Отслеживание папки, дебаунс недописанных файлов и микробатчи классификации."""
+
+    def __init__(self, input_folder: str, output_folder: str, categories_file: str,
+                 debounce: float = WATCH_DEBOUNCE_SEC, batch_max: int = WATCH_BATCH_MAX,
+                 max_wait: float = WATCH_MAX_WAIT_SEC, header_rules: bool = True, **classify_kwargs):
+        self.input_folder = input_folder
+        self.categories_file = categories_file
+        self.debounce = debounce
+        self.batch_max = max(1, batch_max)
+        self.max_wait = max_wait
+        self.header_rules = header_rules
+        classify_kwargs.setdefault('domain_prior', WATCH_DOMAIN_PRIOR)
+        classify_kwargs.setdefault('near_duplicates', WATCH_NEAR_DUPLICATES)
+        self.classify_kwargs = classify_kwargs
+        self.state = WatchState(os.path.join(output_folder, WATCH_STATE_FILE), input_folder)
+        self.output = RotatingJsonlWriter(os.path.join(output_folder, WATCH_OUTPUT_FILE))
+        self.events = queue.Queue()  # пути из событий watchdog
+        self.pending = {}  # путь -> (размер, mtime_ns, время последнего изменения)
+        self.ready = []  # [(путь, stat)] - микробатч
+        self.batch_started = None
+        self.failed = {}  # путь -> (размер, mtime_ns, попыток, когда повторить)
+        self.stop_event = threading.Event()
+        self.stats = {'batches': 0, 'emails': 0, 'errors': 0, 'latency_sum': 0.0, 'latency_max': 0.0}
+
+    # --- Источники файлов ---
+
+    def notify(self, path: str):
+        """Вызывается из потока watchdog: файл создан, изменен или переименован."""
+        if is_mail_file(path):
+            self.events.put(path)
+
+    def scan(self):
+        """Ставит в ожидание все необработанные файлы папки (старт и режим без watchdog)."""
+        with os.scandir(self.input_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and is_mail_file(entry.path) and entry.path not in self.pending:
+                    self.events.put(entry.path)
+
+    def _start_observer(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            print(f"⚠️  watchdog не установлен, папка пересканируется каждые {WATCH_RESCAN_SEC:.0f} с")
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.dest_path)
+
+        observer = Observer()
+        observer.schedule(Handler(), self.input_folder, recursive=False)
+        observer.start()
+        return observer
+
+    # --- Дебаунс и микробатчи ---
+
+    def _drain_events(self, now: float):
+        while True:
+            try:
+                path = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if path not in self.pending:
+                self.pending[path] = (None, None, now)
+
+    def _check_pending(self, now: float):
+        """Переносит в микробатч файлы, которые не менялись debounce секунд."""
+        for path in list(self.pending):
+            size, mtime_ns, changed_at = self.pending[path]
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]  # Удален или переименован до обработки
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            if now - changed_at < self.debounce:
+                continue
+            del self.pending[path]
+            if self.state.is_handled(path, stat) or any(path == p for p, _ in self.ready):
+                continue
+            if not self.ready:
+                self.batch_started = now
+            self.ready.append((path, stat))
+
+    def _retry_failed(self, now: float):
+        """Возвращает в ожидание файлы с ошибкой, которым пора повторить попытку."""
+        for path, (size, mtime_ns, attempts, retry_at) in list(self.failed.items()):
+            if not os.path.exists(path):
+                del self.failed[path]
+            elif attempts < WATCH_MAX_RETRIES and now >= retry_at and path not in self.pending:
+                self.failed[path] = (size, mtime_ns, attempts, float('inf'))
+                self.events.put(path)
+
+    def _remember_failed(self, path: str, stat: os.stat_result, now: float):
+        size, mtime_ns, attempts, _ = self.failed.get(path, (None, None, 0, None))
+        if (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+            attempts = 0  # Файл изменился - счетчик повторов заново
+        self.failed[path] = (stat.st_size, stat.st_mtime_ns, attempts + 1, now + WATCH_RETRY_SEC)
+
+    def _batch_due(self, now: float) -> bool:
+        return bool(self.ready) and (len(self.ready) >= self.batch_max or now - self.batch_started >= self.max_wait)
+
+    def flush(self):
+        """Классифицирует микробатч, дописывает результаты и отмечает файлы обработанными."""
+        from classifier import classify_emails
+        from parser import parse_file
+        from utils import decode_subject
+
+        batch, self.ready = self.ready[:self.batch_max], self.ready[self.batch_max:]
+        self.batch_started = time.time() if self.ready else None
+        started = time.time()
+
+        emails, records = [], [None] * len(batch)
+        for i, (path, _) in enumerate(batch):
+            email_data = parse_file(path, self.header_rules)
+            if email_data:
+                emails.append((i, email_data))
+            else:
+                records[i] = {"filename": os.path.basename(path), "processed": False,
+                              "categories": [], "error": "Не удалось распарсить файл"}
+        if emails:
+            try:
+                results = classify_emails([email for _, email in emails], self.categories_file,
+                                          header_rules=self.header_rules, **self.classify_kwargs)
+            except Exception as e:
+                print(f"❌ Ошибка классификации микробатча: {e}")
+                results = []
+            for (i, _), result in zip(emails, results):
+                records[i] = result
+            for i, _ in emails[len(results):]:
+                records[i] = {"filename": os.path.basename(batch[i][0]), "processed": False,
+                              "categories": [], "error": "Ошибка классификации"}
+
+        finished = time.time()
+        for (path, stat), record in zip(batch, records):
+            record['subject_decoded'] = decode_subject(record.get('subject', ''))
+            record['path'] = os.path.relpath(path, self.input_folder)
+            record['classified_at'] = datetime.now().isoformat()
+            latency = finished - stat.st_mtime
+            self.stats['latency_sum'] += latency
+            self.stats['latency_max'] = max(self.stats['latency_max'], latency)
+            if not record.get('processed', False):
+                self.stats['errors'] += 1
+
+        # Сначала результаты, потом журнал: при сбое между ними письмо классифицируется повторно, а не теряется.
+        # В журнал попадают только обработанные файлы, файлы с ошибкой будут повторены
+        self.output.write_many(records)
+        done = []
+        for (path, stat), record in zip(batch, records):
+            if record.get('processed', False):
+                done.append((path, stat))
+                self.failed.pop(path, None)
+            else:
+                self._remember_failed(path, stat, finished)
+        self.state.mark(done)
+        self.stats['batches'] += 1
+        self.stats['emails'] += len(batch)
+        print(f"📬 Микробатч {self.stats['batches']}: {len(batch)} писем за {finished - started:.2f} с")
+
+    # --- Основной цикл ---
+
+    def run(self):
+        from classifier import warm_up
+
+        print("🔥 Загрузка модели...")
+        warm_up()
+        observer = self._start_observer()
+        self.scan()
+        print(f"👀 Слежение за {self.input_folder} (дебаунс {self.debounce} с, "
+              f"микробатч до {self.batch_max} писем / {self.max_wait} с)")
+
+        last_scan = time.time()
+        try:
+            while not self.stop_event.is_set():
+                now = time.time()
+                if observer is None and now - last_scan >= WATCH_RESCAN_SEC:
+                    self.scan()
+                    last_scan = now
+                self._retry_failed(now)
+                self._drain_events(now)
+                self._check_pending(now)
+                while self._batch_due(time.time()):
+                    self.flush()
+                self.stop_event.wait(WATCH_POLL_SEC)
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            # Уже дописанные файлы обрабатываются перед выходом
+            while self.ready:
+                self.flush()
+            self.output.close()
+            self.state.close()
+            print_watch_stats(self.stats)
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+
+def run_daemon(input_folder: str, output_folder: str, categories_file: str, **kwargs):
+    """Запускает демон до SIGINT/SIGTERM."""
+    watcher = MailWatcher(input_folder, output_folder, categories_file, **kwargs)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run()
+
+
+def print_watch_stats(stats: Dict[str, float]):
+    avg_latency = stats['latency_sum'] / stats['emails'] if stats['emails'] else 0.0
+    print(f"\n📊 Демон: {stats['emails']} писем в {stats['batches']} микробатчах, ошибок {stats['errors']}, "
+          f"задержка от записи файла ср. {avg_latency:.1f} с / макс. {stats['latency_max']:.1f} с")